@@ -69,8 +69,12 @@ days_listed = 250  # 上市至今交易天数
 # excluded_boards = ["bj"]  # 过滤板块，默认不过滤
 excluded_boards = ["cyb", "kcb", "bj"]  # 同时过滤创业板和科创板和北交所
 
+# 增量准备数据：只处理每个股票新增的K线，适合每天更新数据之后运行
+# 第一次运行、或者修改了回测时间和排除板块之后，会自动全量准备数据
+incremental_data = False
+
 # 💡运行提示：
-# - 修改hold_period之后，需要执行step2因子计算，不需要再次准备数据
+# - 修改hold_period之后，需要执行step2因子计算，不需要再次准备数据（参数遍历多个hold_period时，step2会一次算好全部持仓周期）
 # - 修改select_num之后，只需要再执行step3选股即可，不需要准备数据和计算因子
 # - 修改factor_list之后，需要执行step2因子计算，不需要再次准备数据
 # - 修改filter_list之后，需要执行step2因子计算，不需要再次准备数据
@@ -100,6 +104,11 @@ initial_cash = 10_0000  # 初始资金10w
 c_rate = 1.2 / 10000
 # 印花税
 t_rate = 1 / 1000
+# 调仓方式
+# - "full"：换仓日收盘全部卖出，下个交易日开盘按目标仓位买入
+# - "delta"：换仓日不卖出，下个交易日开盘只买卖当前持仓和目标持仓之间的差额，交易单位规则不变
+# 也可以在策略配置中加上 'rebalance_mode' 单独指定，方便参数遍历时比较两种方式
+rebalance_mode = "full"
 # 并行运行的进程数
 n_jobs = os.cpu_count() - 1
 
@@ -0,0 +1,407 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from core.utils.path_kit import get_file_path, get_folder_path
+
+
+def get_period_df_path(hold_period_name: str) -> Path:
+    """
+    因子计算结果（周期数据）的路径，每个持仓周期单独保存，step2 可以一次计算多个持仓周期
+    :param hold_period_name: 持仓周期的名称，比如 周频、月频、5D
+    """
+    return get_file_path("data", "运行缓存", "因子计算结果", f"{hold_period_name}.pkl")
+
+
+class CandleStore:
+    """
+    股票预处理数据的列式缓存
+    按股票代码分区，每个股票保存为一个parquet文件，读取时可以只读取需要的股票和列，
+    避免一次性把全部股票的数据加载到内存中
+    """
+
+    def __init__(self, folder: Optional[str | Path] = None):
+        if folder is None:
+            folder = get_folder_path("data", "运行缓存", "股票预处理数据")
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.folder / "_manifest.json"
+
+    def load_manifest(self) -> dict:
+        """
+        读取增量更新的清单，记录了每个股票源文件的状态，以及生成缓存时的配置
+        """
+        if not self.manifest_path.exists():
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest: dict):
+        tmp_path = self.manifest_path.with_name(".manifest.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        tmp_path.replace(self.manifest_path)
+
+    def get_path(self, stock_code: str) -> Path:
+        return self.folder / f"{stock_code}.parquet"
+
+    @property
+    def stock_codes(self) -> List[str]:
+        """
+        缓存中所有的股票代码，已排序
+        """
+        return sorted(path.stem for path in self.folder.glob("*.parquet") if not path.stem.startswith("."))
+
+    def exists(self, stock_code: str) -> bool:
+        return self.get_path(stock_code).exists()
+
+    def clear(self):
+        """
+        清空缓存，全量重建数据之前调用，避免残留已经被排除的股票
+        """
+        shutil.rmtree(self.folder, ignore_errors=True)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def save(self, stock_code: str, df: pd.DataFrame):
+        """
+        保存单个股票的数据，先写临时文件再替换，避免中断时留下不完整的文件
+        :param stock_code: 股票代码
+        :param df: 预处理后的数据
+        """
+        path = self.get_path(stock_code)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        df.reset_index(drop=True).to_parquet(tmp_path, index=False)
+        tmp_path.replace(path)
+
+    def remove(self, stock_code: str):
+        self.get_path(stock_code).unlink(missing_ok=True)
+
+    def read(self, stock_code: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        读取单个股票的数据
+        :param stock_code: 股票代码
+        :param columns: 需要读取的列，None表示读取全部列
+        :return: 股票数据
+        """
+        return pd.read_parquet(self.get_path(stock_code), columns=columns)
+
+    def data_version(self) -> str:
+        """
+        缓存数据的版本，根据step1保存的清单计算哈希，不需要读取数据文件。
+        清单中包括数据配置（含预处理数据的格式版本），以及每个股票源文件的内容哈希、行数和最后交易日，
+        预处理的结果由这些信息唯一确定，数据没有变化时版本不变
+        """
+        md5 = hashlib.md5()
+        manifest = self.load_manifest()
+        if manifest:
+            md5.update(json.dumps(manifest, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        else:
+            # 没有清单时，根据数据文件的大小和修改时间计算
+            for stock_code in self.stock_codes:
+                stat = self.get_path(stock_code).stat()
+                md5.update(f"{stock_code}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+        return md5.hexdigest()
+
+    def read_all(self, columns: Optional[List[str]] = None, stock_codes=None) -> Dict[str, pd.DataFrame]:
+        """
+        读取多个股票的数据
+        :param columns: 需要读取的列，None表示读取全部列
+        :param stock_codes: 需要读取的股票代码，None表示读取全部股票
+        :return: {股票代码: 股票数据}
+        """
+        if stock_codes is None:
+            stock_codes = self.stock_codes
+        return {code: self.read(code, columns) for code in stock_codes}
+
+
+class FinStore(CandleStore):
+    """
+    财务数据的时点（point-in-time）表
+    按股票代码分区，每个股票保存为一个parquet文件，按 (publish_date, report_date) 排序，包括：
+    - 财报中的原始数据，以及提前算好的衍生指标（_单季、_ttm、_同比等）
+    - 废弃报告：1表示发布时已经有更新的财报，合并到日线数据时需要舍弃
+    """
+
+    def __init__(self, folder: Optional[str | Path] = None):
+        if folder is None:
+            folder = get_folder_path("data", "运行缓存", "财务数据")
+        super().__init__(folder)
+
+    def read(self, stock_code: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        读取单个股票的财务数据，财报中没有的列填充为空值
+        :param stock_code: 股票代码
+        :param columns: 需要读取的列，None表示读取全部列
+        :return: 财务数据
+        """
+        if columns is None:
+            return super().read(stock_code)
+        path = self.get_path(stock_code)
+        available_cols = set(pq.read_schema(path).names)
+        df = pd.read_parquet(path, columns=[col for col in columns if col in available_cols])
+        missing_cols = [col for col in columns if col not in available_cols]
+        if missing_cols:
+            df = pd.concat([df, pd.DataFrame(np.nan, index=df.index, columns=missing_cols)], axis=1)
+        return df[columns]
+
+
+class MarketPivot:
+    """
+    全部股票行情的透视表（开盘价、收盘价、前收盘价），用于回测模拟
+    每个字段保存为一个 (交易日期 x 股票代码) 的float64矩阵（.npy），交易日期和股票代码单独保存。
+    读取时使用内存映射，不需要把整个透视表加载到内存中，回测时只取出需要的交易日期和股票
+    """
+
+    FIELDS = ("open", "close", "preclose")
+
+    def __init__(self, folder: Optional[str | Path] = None):
+        if folder is None:
+            folder = get_folder_path("data", "运行缓存", "全部股票行情pivot")
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._dates: Optional[pd.DatetimeIndex] = None
+        self._symbols: Optional[pd.Index] = None
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def _get_path(self, name: str) -> Path:
+        return self.folder / f"{name}.npy"
+
+    def exists(self) -> bool:
+        return all(self._get_path(name).exists() for name in ("dates", "symbols", *self.FIELDS))
+
+    def save(self, pivot_dict: Dict[str, pd.DataFrame]):
+        """
+        保存透视表，所有字段按照开盘价透视表的交易日期和股票代码对齐
+        :param pivot_dict: {字段: 透视表}，字段为 open、close、preclose
+        """
+        self.close()
+        dates = pivot_dict["open"].index
+        symbols = pivot_dict["open"].columns
+        arrays = {
+            "dates": dates.to_numpy(dtype="datetime64[ns]"),
+            "symbols": symbols.to_numpy(dtype=str),
+            **{
+                field: pivot_dict[field].reindex(index=dates, columns=symbols).to_numpy(dtype=np.float64)
+                for field in self.FIELDS
+            },
+        }
+        for name, array in arrays.items():
+            path = self._get_path(name)
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            tmp_path.replace(path)
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        if self._dates is None:
+            self._dates = pd.DatetimeIndex(np.load(self._get_path("dates")), name="交易日期")
+        return self._dates
+
+    @property
+    def symbols(self) -> pd.Index:
+        if self._symbols is None:
+            self._symbols = pd.Index(np.load(self._get_path("symbols")), name="股票代码")
+        return self._symbols
+
+    def get_array(self, field: str) -> np.ndarray:
+        """
+        获取某个字段的完整矩阵，以只读的内存映射方式打开
+        :param field: 字段，open、close、preclose
+        :return: (交易日期 x 股票代码) 的矩阵
+        """
+        if field not in self._arrays:
+            self._arrays[field] = np.load(self._get_path(field), mmap_mode="r")
+        return self._arrays[field]
+
+    def gather(self, field: str, dates, symbols) -> np.ndarray:
+        """
+        取出指定交易日期和股票的数据，和 DataFrame.loc[dates, symbols] 一样，不存在的日期或股票会报错
+        :param field: 字段，open、close、preclose
+        :param dates: 交易日期
+        :param symbols: 股票代码
+        :return: 新的 (交易日期 x 股票代码) 矩阵
+        """
+        row_idx = self.dates.get_indexer(pd.DatetimeIndex(dates))
+        col_idx = self.symbols.get_indexer(pd.Index(symbols))
+        if (row_idx < 0).any() or (col_idx < 0).any():
+            missing_dates = pd.DatetimeIndex(dates)[row_idx < 0].tolist()
+            missing_symbols = pd.Index(symbols)[col_idx < 0].tolist()
+            raise KeyError(f"行情透视表中不存在：交易日期{missing_dates}，股票代码{missing_symbols}")
+
+        array = self.get_array(field)
+        # 交易日期通常是连续的一段，先切片（不复制），再按股票取出需要的列
+        if len(row_idx) > 0 and (np.diff(row_idx) == 1).all():
+            array = array[row_idx[0]:row_idx[-1] + 1]
+        else:
+            array = array[row_idx]
+        return np.ascontiguousarray(array[:, col_idx])
+
+    def to_frame(self, field: str, symbols=None) -> pd.DataFrame:
+        """
+        把某个字段转换成DataFrame透视表
+        :param field: 字段，open、close、preclose
+        :param symbols: 需要的股票代码，None表示全部股票
+        :return: 透视表，index为交易日期，columns为股票代码
+        """
+        if symbols is None:
+            symbols = self.symbols
+        columns = pd.Index(symbols, name="股票代码")
+        return pd.DataFrame(self.gather(field, self.dates, symbols), index=self.dates, columns=columns)
+
+    def to_dict(self) -> Dict[str, pd.DataFrame]:
+        """
+        读取全部字段的透视表
+        :return: {字段: 透视表}
+        """
+        return {field: self.to_frame(field) for field in self.FIELDS}
+
+    def close(self):
+        """
+        释放内存映射，覆盖文件之前需要先释放
+        """
+        self._dates = None
+        self._symbols = None
+        self._arrays = {}
+
+
+class FactorStore:
+    """
+    因子计算结果的分列缓存，按持仓周期分目录
+    - 行情基础列（周期转换之后的K线数据）保存为一个文件
+    - 每个因子列单独保存为一个文件，只保存数值，行的顺序和行情基础列一致
+
+    每个文件都带有一个缓存键，由调用方根据因子源码、输入数据版本、持仓周期等信息生成，
+    读取时缓存键不一致则视为没有缓存，需要重新计算
+    """
+
+    BASE_NAME = "_base"
+
+    def __init__(self, hold_period_name: str, folder: Optional[str | Path] = None):
+        if folder is None:
+            folder = get_folder_path("data", "运行缓存", "因子缓存", hold_period_name)
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def _get_path(self, name: str) -> Path:
+        # 因子列名中可能包含文件名不支持的字符，使用哈希作为文件名
+        if name != self.BASE_NAME:
+            name = hashlib.md5(name.encode("utf-8")).hexdigest()
+        return self.folder / f"{name}.pkl"
+
+    def _load(self, name: str, key: str) -> Optional[dict]:
+        path = self._get_path(name)
+        if not path.exists():
+            return None
+        payload = pd.read_pickle(path)
+        if payload["key"] != key or payload["name"] != name:
+            return None
+        return payload
+
+    def _save(self, name: str, key: str, **content):
+        path = self._get_path(name)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        pd.to_pickle({"key": key, "name": name, **content}, tmp_path)
+        tmp_path.replace(path)
+
+    def load_base(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        读取行情基础列
+        :param key: 缓存键
+        :return: 行情基础列，没有缓存时返回None
+        """
+        payload = self._load(self.BASE_NAME, key)
+        return None if payload is None else payload["df"]
+
+    def save_base(self, key: str, df: pd.DataFrame):
+        self._save(self.BASE_NAME, key, df=df)
+
+    def load(self, col_name: str, key: str) -> Optional[tuple]:
+        """
+        读取单个因子列
+        :param col_name: 因子列名
+        :param key: 缓存键
+        :return: (因子数值, 周期转换规则)，没有缓存时返回None
+        """
+        payload = self._load(col_name, key)
+        return None if payload is None else (payload["values"], payload["agg_dict"])
+
+    def save(self, col_name: str, key: str, values: np.ndarray, agg_dict: dict):
+        """
+        保存单个因子列
+        :param col_name: 因子列名
+        :param key: 缓存键
+        :param values: 因子数值，行的顺序和行情基础列一致
+        :param agg_dict: 因子列的周期转换规则
+        """
+        self._save(col_name, key, values=values, agg_dict=agg_dict)
+
+
+class BacktestDataContext:
+    """
+    一次运行中共享的回测数据，包括因子计算结果、策略因子列信息和行情透视表
+    参数遍历时，所有参数组合共用同一份数据，每份数据只在第一次使用时从硬盘读取一次，
+    因子计算结果按持仓周期分别读取，不同持仓周期的参数组合可以在同一次遍历中回测
+
+    数据是只读的：
+    - 因子计算结果每次访问都返回一个浅拷贝，配合 pandas 的写时复制，修改只会影响拿到的副本
+    - 策略因子列信息以只读字典的形式返回
+    - 行情透视表是只读的内存映射
+    """
+
+    def __init__(self, period_dfs: Dict[str, pd.DataFrame] = None, factor_col_info: Dict[str, str] = None):
+        """
+        :param period_dfs: 已经加载好的因子计算结果，{持仓周期名称: 周期数据}，比如子进程从共享内存中读取的数据，
+                           没有提供的持仓周期从硬盘读取
+        :param factor_col_info: 已经加载好的策略因子列信息，None表示从硬盘读取
+        """
+        self._period_dfs: Dict[str, pd.DataFrame] = dict(period_dfs or {})
+        self._factor_col_info: Optional[Mapping[str, str]] = None
+        if factor_col_info is not None:
+            self._factor_col_info = MappingProxyType(dict(factor_col_info))
+        self._market_pivot: Optional[MarketPivot] = None
+
+    def get_period_df(self, hold_period_name: str) -> pd.DataFrame:
+        """
+        因子计算结果
+        :param hold_period_name: 持仓周期的名称，比如 周频、月频、5D
+        """
+        if hold_period_name not in self._period_dfs:
+            path = get_period_df_path(hold_period_name)
+            if not path.exists():
+                raise FileNotFoundError(f"没有找到持仓周期为{hold_period_name}的因子计算结果，请先运行step2计算因子")
+            self._period_dfs[hold_period_name] = pd.read_pickle(path)
+        return self._period_dfs[hold_period_name].copy(deep=False)
+
+    @property
+    def factor_col_info(self) -> Mapping[str, str]:
+        """
+        策略因子列信息，{因子列名: 周期转换规则}
+        """
+        if self._factor_col_info is None:
+            self._factor_col_info = MappingProxyType(
+                pd.read_pickle(get_file_path("data", "运行缓存", "策略因子列信息.pkl"))
+            )
+        return self._factor_col_info
+
+    @property
+    def market_pivot(self) -> MarketPivot:
+        """
+        全部股票行情的透视表
+        """
+        if self._market_pivot is None:
+            self._market_pivot = MarketPivot()
+        return self._market_pivot
@@ -7,6 +7,7 @@ import numba as nb
 import numpy as np
 import pandas as pd
 
+from core.data_store import MarketPivot
 from core.evaluate import strategy_evaluate
 from core.figure import draw_equity_curve_plotly
 from core.market_essentials import import_index_data
@@ -28,29 +29,24 @@ def read_trading_dates(first_date, last_date):
     return trading_dates
 
 
-def get_stock_market(pivot_dict_stock, trading_dates, symbols, symbol_types) -> StockMarketData:
-    df_open: pd.DataFrame = pivot_dict_stock["open"].loc[trading_dates, symbols]
-    df_close: pd.DataFrame = pivot_dict_stock["close"].loc[trading_dates, symbols]
-    df_preclose: pd.DataFrame = pivot_dict_stock["preclose"].loc[trading_dates, symbols]
-    # Not sure if necessary
-    should_copy = True
-
+def get_stock_market(market_pivot: MarketPivot, trading_dates, symbols, symbol_types) -> StockMarketData:
+    # 从内存映射的行情透视表中，只取出回测区间和持仓股票的数据
     data = StockMarketData(
-        candle_begin_ts=(trading_dates.astype(np.int64) // 1000000000).to_numpy(copy=should_copy),
-        op=df_open.to_numpy(copy=should_copy),
-        cl=df_close.to_numpy(copy=should_copy),
-        pre_cl=df_preclose.to_numpy(copy=should_copy),
+        candle_begin_ts=(trading_dates.astype(np.int64) // 1000000000).to_numpy(copy=True),
+        op=market_pivot.gather("open", trading_dates, symbols),
+        cl=market_pivot.gather("close", trading_dates, symbols),
+        pre_cl=market_pivot.gather("preclose", trading_dates, symbols),
         types=np.array(symbol_types, dtype=np.int16),
     )
 
     return data
 
 
-def calc_equity(conf: BacktestConfig, pivot_dict_stock: dict, df_stock_ratio: pd.DataFrame):
+def calc_equity(conf: BacktestConfig, market_pivot: MarketPivot, df_stock_ratio: pd.DataFrame):
     """
     计算资金曲线
     :param conf: 回测配置
-    :param pivot_dict_stock: 股票行情
+    :param market_pivot: 股票行情透视表
     :param df_stock_ratio: 股票目标资金占比
     """
     symbols = sorted(df_stock_ratio.columns)
@@ -63,24 +59,128 @@ def calc_equity(conf: BacktestConfig, pivot_dict_stock: dict, df_stock_ratio: pd
     trading_dates = read_trading_dates(start_date, conf.end_date)
 
     # 读取行情
-    market = get_stock_market(pivot_dict_stock, trading_dates, symbols, symbol_types)
+    market = get_stock_market(market_pivot, trading_dates, symbols, symbol_types)
 
     # 开始回测
     df_stock_ratio = df_stock_ratio.loc[start_date : conf.end_date, symbols]
-    params = SimuParams(
-        init_cash=conf.initial_cash,  # 初始资金
-        stamp_tax_rate=conf.t_rate,  # 印花税率
-        commission_rate=conf.c_rate,  # 券商佣金费率
-    )
+    params = get_simu_params(conf)
     adj_dts = df_stock_ratio.index.to_numpy().astype(np.int64) // 1000000000
     ratios = df_stock_ratio.to_numpy()
     pos_calc = RebAlways(market.types)
+    delta = is_delta_rebalance(conf)
 
     s_time = time.perf_counter()
-    cashes, pos_values, stamp_taxes, commissions = start_simulation(market, params, adj_dts, ratios, pos_calc)
+    cashes, pos_values, stamp_taxes, commissions = start_simulation(market, params, adj_dts, ratios, pos_calc, delta)
 
     print(f"✅ 完成模拟交易，花费时间: {time.perf_counter() - s_time:.3f}秒\n")
 
+    return evaluate_equity(conf, trading_dates, cashes, pos_values, stamp_taxes, commissions)
+
+
+def calc_equity_batch(conf_list, market_pivot: MarketPivot, df_stock_ratio_list, chunk_size=64):
+    """
+    批量计算多个参数组合的资金曲线，结果和逐个调用 calc_equity 完全一致
+    所有参数组合共用一份行情数据（全部持仓股票的并集），目标资金占比组成
+    (参数组合 x 换仓日期 x 股票) 的三维矩阵，在一次numba并行计算中完成模拟
+
+    :param conf_list: 回测配置列表，初始资金、手续费率和调仓方式都可以不同
+    :param market_pivot: 股票行情透视表
+    :param df_stock_ratio_list: 每个参数组合的股票目标资金占比
+    :param chunk_size: 每次并行模拟的参数组合数量，用于控制三维矩阵占用的内存
+    :return: 每个参数组合的 (资金曲线，策略评价，年度收益，月度收益，季度收益)
+    """
+    symbols = sorted(set().union(*[df_stock_ratio.columns for df_stock_ratio in df_stock_ratio_list]))
+    symbol_types = [get_symbol_type(sym) for sym in symbols]
+    if any(x == BSE_MAIN for x in symbol_types):
+        raise ValueError(f"BSE not supported")  # No Beijing stocks
+
+    # 确定每个参数组合的回测区间，行情覆盖所有参数组合的回测区间
+    date_ranges = [
+        (max(df_stock_ratio.index.min(), pd.to_datetime(conf.start_date)), pd.to_datetime(conf.end_date))
+        for conf, df_stock_ratio in zip(conf_list, df_stock_ratio_list)
+    ]
+    trading_dates = read_trading_dates(min(d[0] for d in date_ranges), max(d[1] for d in date_ranges))
+
+    # 读取行情
+    market = get_stock_market(market_pivot, trading_dates, symbols, symbol_types)
+    pos_calc = RebAlways(market.types)
+    delta_modes = np.array([is_delta_rebalance(conf) for conf in conf_list], dtype=np.bool_)
+
+    # 初始资金和手续费率相同的参数组合分为一组，每组使用同一份模拟参数，行情数据所有分组共用
+    simu_groups = {}
+    for i, conf in enumerate(conf_list):
+        simu_groups.setdefault((conf.initial_cash, conf.t_rate, conf.c_rate), []).append(i)
+
+    s_time = time.perf_counter()
+    results = [None] * len(conf_list)
+    for group in simu_groups.values():
+        params = get_simu_params(conf_list[group[0]])
+        for chunk_start in range(0, len(group), chunk_size):
+            chunk = group[chunk_start : chunk_start + chunk_size]
+
+            # 每个参数组合的换仓日期数量不同，不足的部分用0填充
+            chunk_ratios = [
+                df_stock_ratio_list[i].loc[date_ranges[i][0] : date_ranges[i][1]].reindex(columns=symbols, fill_value=0)
+                for i in chunk
+            ]
+            n_adjs = np.array([len(df) for df in chunk_ratios], dtype=np.int64)
+            adj_dts = np.zeros((len(chunk), max(n_adjs.max(), 1)), dtype=np.int64)
+            ratios = np.zeros((len(chunk), adj_dts.shape[1], len(symbols)), dtype=np.float64)
+            for j, df in enumerate(chunk_ratios):
+                adj_dts[j, : len(df)] = df.index.to_numpy().astype(np.int64) // 1000000000
+                ratios[j, : len(df)] = df.to_numpy()
+
+            cashes, pos_values, stamp_taxes, commissions = start_simulation_batch(
+                market, params, adj_dts, n_adjs, ratios, pos_calc, delta_modes[chunk]
+            )
+
+            # 截取每个参数组合自己的回测区间，在回测开始之前，账户只持有现金，不会影响之后的结果
+            for j, i in enumerate(chunk):
+                mask = ((trading_dates >= date_ranges[i][0]) & (trading_dates <= date_ranges[i][1])).to_numpy()
+                results[i] = evaluate_equity(
+                    conf_list[i],
+                    trading_dates[mask],
+                    cashes[j][mask],
+                    pos_values[j][mask],
+                    stamp_taxes[j][mask],
+                    commissions[j][mask],
+                )
+
+    print(f"✅ 完成{len(conf_list)}个参数组合的模拟交易，花费时间: {time.perf_counter() - s_time:.3f}秒\n")
+
+    return results
+
+
+def get_simu_params(conf: BacktestConfig) -> SimuParams:
+    return SimuParams(
+        init_cash=conf.initial_cash,  # 初始资金
+        stamp_tax_rate=conf.t_rate,  # 印花税率
+        commission_rate=conf.c_rate,  # 券商佣金费率
+    )
+
+
+def is_delta_rebalance(conf: BacktestConfig) -> bool:
+    """
+    是否使用差额调仓
+    :param conf: 回测配置
+    :return: True 表示差额调仓，False 表示全部卖出再买入
+    """
+    if conf.rebalance_mode not in ("full", "delta"):
+        raise ValueError(f"不支持的调仓方式：{conf.rebalance_mode}，只支持 full 和 delta")
+    return conf.rebalance_mode == "delta"
+
+
+def evaluate_equity(conf: BacktestConfig, trading_dates, cashes, pos_values, stamp_taxes, commissions):
+    """
+    根据模拟交易的结果，生成资金曲线并进行策略评价
+    :param conf: 回测配置
+    :param trading_dates: 交易日期
+    :param cashes: 每个交易日收盘后的账户可用资金
+    :param pos_values: 每个交易日收盘后的持仓市值
+    :param stamp_taxes: 每个交易日的印花税
+    :param commissions: 每个交易日的券商佣金
+    :return: 资金曲线，策略评价，年度收益，月度收益，季度收益
+    """
     account_df = pd.DataFrame(
         {
             "交易日期": trading_dates,
@@ -110,9 +210,8 @@ def calc_equity(conf: BacktestConfig, pivot_dict_stock: dict, df_stock_ratio: pd
 
 
 @nb.njit(boundscheck=True)
-def start_simulation(market, simu_params, adj_dts, ratios, pos_calc):
+def start_simulation(market, simu_params, adj_dts, ratios, pos_calc, delta=False):
     n_bars = len(market.candle_begin_ts)
-    n_syms = len(market.types)
 
     # Equity at end of day
     pos_values = np.zeros(n_bars, dtype=np.float64)
@@ -120,6 +219,62 @@ def start_simulation(market, simu_params, adj_dts, ratios, pos_calc):
     stamp_taxes = np.zeros(n_bars, dtype=np.float64)
     commissions = np.zeros(n_bars, dtype=np.float64)
 
+    run_simulation(
+        market, simu_params, adj_dts, ratios, pos_calc, delta, cashes, pos_values, stamp_taxes, commissions
+    )
+
+    return cashes, pos_values, stamp_taxes, commissions
+
+
+@nb.njit(boundscheck=True, parallel=True)
+def start_simulation_batch(market, simu_params, adj_dts, n_adjs, ratios, pos_calc, delta_modes):
+    """
+    并行模拟多个参数组合，每个参数组合使用独立的 Simulator
+    :param market: 行情数据
+    :param simu_params: 模拟参数
+    :param adj_dts: (参数组合 x 换仓日期) 换仓日期时间戳
+    :param n_adjs: 每个参数组合的有效换仓日期数量
+    :param ratios: (参数组合 x 换仓日期 x 股票) 目标资金占比
+    :param pos_calc: 目标仓位计算
+    :param delta_modes: 每个参数组合是否使用差额调仓
+    :return: (参数组合 x 交易日期) 的账户可用资金、持仓市值、印花税、券商佣金
+    """
+    n_configs = ratios.shape[0]
+    n_bars = len(market.candle_begin_ts)
+
+    pos_values = np.zeros((n_configs, n_bars), dtype=np.float64)
+    cashes = np.zeros((n_configs, n_bars), dtype=np.float64)
+    stamp_taxes = np.zeros((n_configs, n_bars), dtype=np.float64)
+    commissions = np.zeros((n_configs, n_bars), dtype=np.float64)
+
+    for idx_conf in nb.prange(n_configs):
+        n_adj = n_adjs[idx_conf]
+        run_simulation(
+            market,
+            simu_params,
+            adj_dts[idx_conf, :n_adj],
+            ratios[idx_conf, :n_adj],
+            pos_calc,
+            delta_modes[idx_conf],
+            cashes[idx_conf],
+            pos_values[idx_conf],
+            stamp_taxes[idx_conf],
+            commissions[idx_conf],
+        )
+
+    return cashes, pos_values, stamp_taxes, commissions
+
+
+@nb.njit(boundscheck=True)
+def run_simulation(market, simu_params, adj_dts, ratios, pos_calc, delta, cashes, pos_values, stamp_taxes, commissions):
+    """
+    模拟单个投资组合的日线交易，结果写入 cashes、pos_values、stamp_taxes、commissions
+    delta 为 False 时，换仓日收盘清空仓位，下个交易日开盘按目标仓位买入；
+    delta 为 True 时，换仓日不卖出，下个交易日开盘只买卖当前持仓和目标持仓之间的差额
+    """
+    n_bars = len(market.candle_begin_ts)
+    n_syms = len(market.types)
+
     init_pos_values = np.zeros(n_syms, dtype=np.float64)
     simu = Simulator(simu_params.init_cash, simu_params.commission_rate, simu_params.stamp_tax_rate, init_pos_values)
 
@@ -137,7 +292,16 @@ def start_simulation(market, simu_params, adj_dts, ratios, pos_calc):
 
         stamp_tax = commission = 0.0
 
-        if buy_next_open:
+        if buy_next_open and delta:
+            # 差额调仓，集合竞价结束时，基于开盘价和当前总权益计算需要买卖的股数
+            equity = simu.cash + simu.get_pos_value()
+            delta_pos = pos_calc.calc_delta_lots(equity, market.op[idx_bar], ratios[idx_adj], simu.pos_values)
+            idx_adj += 1
+            buy_next_open = False
+
+            # 连续竞价开始，基于开盘价先卖后买
+            stamp_tax, commission = simu.trade_delta(market.op[idx_bar], delta_pos)
+        elif buy_next_open:
             # 如果本交易日需要买入，集合竞价结束时，基于开盘价计算买入仓位
             target_pos = pos_calc.calc_lots(simu.cash, market.op[idx_bar], ratios[idx_adj])
             idx_adj += 1
@@ -146,8 +310,9 @@ def start_simulation(market, simu_params, adj_dts, ratios, pos_calc):
             # 连续竞价开始，基于开盘价买入股票
             commission = simu.buy_stocks(market.op[idx_bar], target_pos)
         elif idx_adj < len(adj_dts) and adj_dts[idx_adj] == market.candle_begin_ts[idx_bar]:
-            # 根据交易日历，本交易日结束后需要计算下交易周期股票权重，则收盘清空仓位
-            stamp_tax, commission = simu.sell_all(market.cl[idx_bar])
+            # 根据交易日历，本交易日结束后需要计算下交易周期股票权重，则收盘清空仓位，差额调仓时不卖出
+            if not delta:
+                stamp_tax, commission = simu.sell_all(market.cl[idx_bar])
             buy_next_open = True
 
         # 计算收盘仓位价值，不需要更新最新价
@@ -158,8 +323,6 @@ def start_simulation(market, simu_params, adj_dts, ratios, pos_calc):
         pos_values[idx_bar] = simu.get_pos_value()
         cashes[idx_bar] = simu.cash
 
-    return cashes, pos_values, stamp_taxes, commissions
-
 
 def show_plot_performance(conf: BacktestConfig, account_df, rtn, year_return, title_prefix="", **kwargs):
     # 添加指数数据
@@ -1,13 +1,26 @@
 """
 未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
 """
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
+from tqdm import tqdm
 
+from core.data_store import FinStore
 from core.model.backtest_config import BacktestConfig
+from core.utils.asof import asof_index, take_rows
 
 pd.set_option('expand_frame_repr', False)  # 当列太多时不换行
 
+# 财务数据时点表的格式版本，计算逻辑变化时修改，已有的时点表会全部重建
+FIN_STORE_VERSION = 1
+# 流量型财务指标（R_、C_开头）的衍生指标
+FLOW_FIN_SUFFIXES = ['_单季', '_单季环比', '_单季同比', '_累计同比', '_ttm', '_ttm同比']
+# 截面型财务指标（B_开头）的衍生指标
+CROSS_FIN_SUFFIXES = ['_环比', '_同比']
+
 
 # region  财务数据处理
 def mark_old_report(date_list):
@@ -34,84 +47,43 @@ def mark_old_report(date_list):
 def get_last_quarter_and_year_index(date_list):
     """
     获取上季度、上年度、以及上一次年报的索引
+    对每一行财报，在它之前的行中（按发布顺序）从后往前查找，取最近的一行满足条件的财报：
+    - 上季度：报告期相差约3个月，即相差的天数除以30之后四舍五入（银行家舍入）等于3
+    - 去年同期：报告期相差约12个月，规则同上
+    - 去年年报、去年一、二、三季度：报告期在上一年，月份分别为12、3、6、9
+    没有找到时，使用无意义的索引值（最后一行的索引）
     :param date_list: 财报日期数据
     :return: 上季度、上年度、以及上一次年报的索引
     """
-    # 使用 list 相比 TSeries 在性能上要好很多，使用上保持一致
-    date_list = date_list.tolist()
-    # 申明输出变量
-    last_q_index = []  # 上个季度的index
-    last_4q_index = []  # 去年同期的index
-    last_y_index = []  # 去年年报的index
-    last_y_3q_index = []  # 去年三季度的index
-    last_y_2q_index = []  # 去年二季度的index
-    last_y_q_index = []  # 去年一季度的index
-
-    no_meaning_index = len(date_list) - 1  # 无意义的索引值，（最后一行的索引）
-
-    # 逐个日期循环
-    for index, date in enumerate(date_list):
+    dates = pd.DatetimeIndex(date_list)
+    n = len(dates)
+    if n == 0:
+        return [], [], [], [], [], []
+    no_meaning_index = n - 1  # 无意义的索引值，（最后一行的索引）
+
+    # 用 (当前行, 之前的行) 的矩阵一次比较全部的财报，每只股票的财报只有几十到几百行
+    before = np.tri(n, k=-1, dtype=bool)  # 只在当前行之前的行中查找
+    timestamps = dates.as_unit('ns').asi8
+    delta_days = (timestamps[:, None] - timestamps[None, :]) // (24 * 3600 * 10 ** 9)
+    delta_month = np.round(delta_days / 30)
+    delta_year = dates.year.to_numpy()[:, None] - dates.year.to_numpy()[None, :]
+    month = dates.month.to_numpy()[None, :]
+    row_index = np.arange(n)
+
+    def last_index(condition):
+        # 满足条件的最后一行，没有找到时使用无意义的索引值
+        index = np.where(condition & before, row_index, -1).max(axis=1)
+        index[index < 0] = no_meaning_index
         # 首个日期时，添加空值
-        if index == 0:
-            last_q_index.append(no_meaning_index)
-            last_4q_index.append(no_meaning_index)
-            last_y_index.append(no_meaning_index)
-            last_y_3q_index.append(no_meaning_index)
-            last_y_2q_index.append(no_meaning_index)
-            last_y_q_index.append(no_meaning_index)
-            continue
-
-        # 反向逐个遍历当前日期之前的日期
-        q_finish = False
-        _4q_finish = False
-        y_finish = False
-        _y_3q_index = False
-        _y_2q_index = False
-        _y_q_index = False
-        for i in sorted(range(index), reverse=True):
-            # 计算之前日期和当前日期相差的月份
-            delta_month = (date - date_list[i]).days / 30
-            delta_month = round(delta_month)
-            # 如果相差3个月，并且尚未找到上个季度的值
-            if delta_month == 3 and q_finish is False:
-                last_q_index.append(i)
-                q_finish = True  # 已经找到上个季度的值
-            # 如果相差12个月，并且尚未找到去年同期的值
-            if delta_month == 12 and _4q_finish is False:
-                last_4q_index.append(i)
-                _4q_finish = True  # 已经找到上个年度的值
-            # 如果是去年4季度，并且尚未找到去年4季度的值
-            if date.year - date_list[i].year == 1 and date_list[i].month == 3 and _y_q_index is False:
-                last_y_q_index.append(i)
-                _y_q_index = True
-            # 如果是去年4季度，并且尚未找到去年4季度的值
-            if date.year - date_list[i].year == 1 and date_list[i].month == 6 and _y_2q_index is False:
-                last_y_2q_index.append(i)
-                _y_2q_index = True
-            # 如果是去年4季度，并且尚未找到去年4季度的值
-            if date.year - date_list[i].year == 1 and date_list[i].month == 9 and _y_3q_index is False:
-                last_y_3q_index.append(i)
-                _y_3q_index = True
-            # 如果是去年4季度，并且尚未找到去年4季度的值
-            if date.year - date_list[i].year == 1 and date_list[i].month == 12 and y_finish is False:
-                last_y_index.append(i)
-                y_finish = True
-
-            # 如果三个数据都找到了
-            if q_finish and _4q_finish and y_finish and _y_q_index and _y_2q_index and _y_3q_index:
-                break  # 退出寻找
-        if q_finish is False:  # 全部遍历完之后，尚未找到上个季度的值
-            last_q_index.append(no_meaning_index)
-        if _4q_finish is False:  # 全部遍历完之后，尚未找到4个季度前的值
-            last_4q_index.append(no_meaning_index)
-        if y_finish is False:  # 全部遍历完之后，尚未找到去年4季度的值
-            last_y_index.append(no_meaning_index)
-        if _y_q_index is False:  # 全部遍历完之后，尚未找到去年4季度的值
-            last_y_q_index.append(no_meaning_index)
-        if _y_2q_index is False:  # 全部遍历完之后，尚未找到去年4季度的值
-            last_y_2q_index.append(no_meaning_index)
-        if _y_3q_index is False:  # 全部遍历完之后，尚未找到去年4季度的值
-            last_y_3q_index.append(no_meaning_index)
+        index[0] = no_meaning_index
+        return index.tolist()
+
+    last_q_index = last_index(delta_month == 3)  # 上个季度的index
+    last_4q_index = last_index(delta_month == 12)  # 去年同期的index
+    last_y_index = last_index((delta_year == 1) & (month == 12))  # 去年年报的index
+    last_y_q_index = last_index((delta_year == 1) & (month == 3))  # 去年一季度的index
+    last_y_2q_index = last_index((delta_year == 1) & (month == 6))  # 去年二季度的index
+    last_y_3q_index = last_index((delta_year == 1) & (month == 9))  # 去年三季度的index
     # 返回
     return last_q_index, last_4q_index, last_y_index, last_y_q_index, last_y_2q_index, last_y_3q_index
 
@@ -282,52 +254,149 @@ def get_his_data(fin_df, data_cols, span='q'):
     return data, new_cols
 
 
-# 计算财务预处理数据
-def merge_with_finance_data(conf: BacktestConfig, stock_code, stock_df):
+def build_fin_table(stock_fin_folder: str | Path) -> pd.DataFrame:
+    """
+    把单个股票的全部财务数据文件整理成时点表，计算全部财务指标的衍生指标，并标记废弃报告
+    :param stock_fin_folder: 股票的财务数据目录
+    :return: 按 publish_date、report_date 排序的财务数据，没有财务数据文件时返回空的DataFrame
+    """
+    finance_dfs = []
+    # 读取路径下的各个财务数据文件
+    for file in sorted(Path(stock_fin_folder).glob('*.csv')):
+        # 读取财务数据
+        finance_df = pd.read_csv(file, parse_dates=['publish_date'], skiprows=1, encoding='gbk')
+
+        # 划分流量型和截面型财务数据，财报中的全部指标都计算衍生指标
+        flow_fin_cols = [col for col in finance_df.columns if col.startswith(('R_', 'C_')) and col.endswith('@xbx')]
+        cross_fin_cols = [col for col in finance_df.columns if col.startswith('B_') and col.endswith('@xbx')]
+        derived_cols = [col + suffix for col in flow_fin_cols for suffix in FLOW_FIN_SUFFIXES] + \
+                       [col + suffix for col in cross_fin_cols for suffix in CROSS_FIN_SUFFIXES]
+        # cal_fin_data 只计算已经存在的衍生指标列
+        finance_df = pd.concat(
+            [finance_df, pd.DataFrame(np.nan, index=finance_df.index, columns=derived_cols)], axis=1
+        )
+        # 计算财务类因子
+        finance_df = cal_fin_data(data=finance_df, flow_fin_list=flow_fin_cols, cross_fin_list=cross_fin_cols,
+                                  discard=False)
+        finance_dfs.append(finance_df)
+
+    if not finance_dfs:
+        return pd.DataFrame()
+
+    # 对数据做合并和排序处理
+    all_finance_df = pd.concat(finance_dfs, ignore_index=True)
+    all_finance_df.sort_values(by=['publish_date', 'report_date'], inplace=True)
+    all_finance_df['废弃报告'] = np.array(mark_old_report(all_finance_df['report_date']), dtype=np.int8)
+    return all_finance_df.reset_index(drop=True)
+
+
+def build_and_save_fin_table(stock_fin_folder: str | Path, store_folder: Path):
+    """
+    在子进程中整理单个股票的财务数据，并直接写入时点表
+    """
+    stock_fin_folder = Path(stock_fin_folder)
+    fin_store = FinStore(store_folder)
+    fin_df = build_fin_table(stock_fin_folder)
+    if fin_df.empty:
+        fin_store.remove(stock_fin_folder.name)
+    else:
+        fin_store.save(stock_fin_folder.name, fin_df)
+
+
+def update_fin_store(conf: BacktestConfig, n_jobs: int) -> FinStore:
     """
-    将财务数据合并到日线数据上
+    把 stock-fin-data-xbx 中的财务数据整理成时点表，只有财务数据文件发生变化的股票需要重新整理
+    之后计算因子时，只需要读取需要的列，不需要每次都解析财务数据文件、计算衍生指标
+    :param conf: 回测配置
+    :param n_jobs: 并行的进程数
+    :return: 财务数据时点表
+    """
+    fin_store = FinStore()
+    manifest = fin_store.load_manifest()
+    if manifest.get('version') != FIN_STORE_VERSION:
+        fin_store.clear()
+        manifest = {'version': FIN_STORE_VERSION, 'files': {}}
+    last_file_metas = manifest['files']
+
+    # 记录每个股票的财务数据文件的大小和修改时间，用于判断是否需要重新整理
+    file_metas = {}
+    for stock_fin_folder in sorted(conf.fin_data_path.iterdir()):
+        if stock_fin_folder.is_dir() and not stock_fin_folder.name.startswith('.'):
+            file_metas[stock_fin_folder.name] = {
+                file.name: [file.stat().st_size, file.stat().st_mtime_ns]
+                for file in sorted(stock_fin_folder.glob('*.csv'))
+            }
+    changed_codes = [code for code, file_meta in file_metas.items() if last_file_metas.get(code) != file_meta]
+    removed_codes = set(last_file_metas) - set(file_metas)
+
+    if changed_codes:
+        print(f'ℹ️ 整理财务数据：{len(changed_codes)}个股票的财务数据需要更新...')
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [
+                executor.submit(build_and_save_fin_table, conf.fin_data_path / code, fin_store.folder)
+                for code in changed_codes
+            ]
+            for future in tqdm(futures, desc='整理财务数据', total=len(futures)):
+                future.result()
+    for code in removed_codes:
+        fin_store.remove(code)
+
+    # 清单最后保存，中途中断时，下次运行会重新整理没有完成的股票
+    manifest['files'] = file_metas
+    fin_store.save_manifest(manifest)
+    return fin_store
+
+
+class FinColumns:
+    """
+    按需合并到日线数据上的财务数据
+    创建时只计算每个交易日对应的财报（发布日期不晚于交易日期的最新一行，和 merge_asof backward 一致），
+    某一列财务数据只在第一次被用到时，按对应的行取出来，之后直接使用缓存
+    """
+
+    def __init__(self, trade_dates: pd.Series, finance_df: pd.DataFrame):
+        """
+        :param trade_dates: 日线数据的交易日期，已排序
+        :param finance_df: 删除了废弃报告的财务数据，按 publish_date 排序且不重复
+        """
+        self.finance_df = finance_df
+        # 每个交易日对应的财务数据的行号，没有已发布的财报时为-1
+        self.join_index = asof_index(trade_dates, finance_df['publish_date'])
+        self._cache = {}
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        if col not in self._cache:
+            # 没有对应财报的交易日，reindex 之后为空值
+            self._cache[col] = self.finance_df[col].reindex(self.join_index).to_numpy()
+        return self._cache[col]
+
+    def attach(self, stock_df: pd.DataFrame, fin_cols) -> pd.DataFrame:
+        """
+        把需要的财务数据列合并到日线数据上，日线数据本身不会被修改
+        :param stock_df: 日线数据，和创建时的交易日期逐行对应
+        :param fin_cols: 需要的财务数据列
+        :return: 合并了 publish_date、report_date 以及 fin_cols 的日线数据
+        """
+        cols = ['publish_date', 'report_date'] + [col for col in fin_cols if col not in ('publish_date', 'report_date')]
+        return stock_df.assign(**{col: self[col] for col in cols})
+
+
+def load_finance_data(conf: BacktestConfig, stock_code, stock_df):
+    """
+    读取财务数据，财务数据列不会立即合并到日线数据上，由因子按照各自的 fin_cols 按需合并
+    财务数据从提前整理好的时点表（update_fin_store）中读取，只读取需要的列
     :param conf: 回测配置
     :param stock_code: 股票代码
     :param stock_df: 日线数据
+    :return: 按需合并的财务数据列、删除废弃报告之后的财务数据、原始财务数据（不删除废弃报告）
     """
-    # 判断路径是否存在
-    stock_fin_folder = conf.fin_data_path / stock_code
-    fin_cols = conf.fin_cols
-
-    if stock_fin_folder.exists():
-        # 获取路径下的所有文件名
-        # 划分流量型和截面型财务数据
-        flow_fin_cols = list(set([col.split('@xbx')[0] + '@xbx' for col in fin_cols if
-                                  (col.startswith('R_')) or (col.startswith('C_'))]))  # 流量型
-        cross_fin_cols = list(set([col.split('@xbx')[0] + '@xbx' for col in fin_cols if col.startswith('B_')]))  # 截面型
-
-        finance_dfs = []
-        # 读取路径下的各个财务数据文件
-        for file in stock_fin_folder.iterdir():
-            # 读取财务数据
-            finance_df = pd.read_csv(stock_fin_folder / file, parse_dates=['publish_date'], skiprows=1, encoding='gbk')
-
-            # 判断财务数据中是否包含我们需要的finance_cols
-            for col in set(flow_fin_cols + cross_fin_cols + fin_cols):
-                # 如果没有我们需要的，赋值nan到财务数据的dataframe中
-                if col not in finance_df.columns:
-                    finance_df[col] = np.nan
-
-            necessary_cols = ['stock_code', 'report_date', 'publish_date']  # 所必须的字段
-            finance_df = finance_df[list(set(necessary_cols + flow_fin_cols + cross_fin_cols + fin_cols))]  # 取需要的数据
-            # 计算财务类因子
-            finance_df = cal_fin_data(data=finance_df, flow_fin_list=flow_fin_cols, cross_fin_list=cross_fin_cols,
-                                      discard=False)
-            # 合并
-            col = ['publish_date', 'report_date'] + fin_cols
-            finance_dfs.append(finance_df[col])
-
-        # 对数据做合并和排序处理
-        all_finance_df = pd.concat(finance_dfs, ignore_index=True)
-        all_finance_df.sort_values(by=['publish_date', 'report_date'], inplace=True)
-        all_finance_df_not_discord = all_finance_df.copy()
+    fin_store = FinStore()
+    col = ['publish_date', 'report_date'] + conf.fin_cols
+
+    if fin_store.exists(stock_code):
+        all_finance_df = fin_store.read(stock_code, col + ['废弃报告'])
+        all_finance_df_not_discord = all_finance_df[col].copy()
 
-        all_finance_df['废弃报告'] = mark_old_report(all_finance_df['report_date'])  # 获取废弃报告
         # 删除废弃的研报
         all_finance_df = all_finance_df[all_finance_df['废弃报告'] != 1]
         # 删除不必要的行
@@ -335,17 +404,26 @@ def merge_with_finance_data(conf: BacktestConfig, stock_code, stock_df):
 
         all_finance_df.drop_duplicates(subset=['publish_date'], keep='last', inplace=True)  # 删除重复数据
         all_finance_df.reset_index(drop=True, inplace=True)  # 重置索引
-        stock_df = pd.merge_asof(stock_df, all_finance_df, left_on='交易日期', right_on='publish_date',
-                                 direction='backward')  # 合并股票数据和财务数据
-        # 演示merge_asof效果：右边的数据，会找左边最接近的日期去合并。backward往上找，forward往下找，nearest最近
-    else:  # 如果本地没有财务数据，返回含有财务数据为nan的dataframe
+    else:  # 如果本地没有财务数据，财务数据全部为nan
         print(f'{stock_code}未找到财务数据，如果一直报这个错误，请检查财务数据路径是否正确。偶尔几个可以忽略。')
         all_finance_df = pd.DataFrame()
-        for col in ['publish_date', 'report_date'] + fin_cols:
-            stock_df[f'{col}'] = np.nan
-            all_finance_df[f'{col}'] = np.nan
+        for c in col:
+            all_finance_df[c] = np.nan
         all_finance_df_not_discord = all_finance_df.copy()
 
+    return FinColumns(stock_df['交易日期'], all_finance_df), all_finance_df, all_finance_df_not_discord
+
+
+# 计算财务预处理数据
+def merge_with_finance_data(conf: BacktestConfig, stock_code, stock_df):
+    """
+    将财务数据合并到日线数据上，合并全部的 fin_cols，结果和 merge_asof 一致
+    :param conf: 回测配置
+    :param stock_code: 股票代码
+    :param stock_df: 日线数据
+    """
+    fin_columns, all_finance_df, all_finance_df_not_discord = load_finance_data(conf, stock_code, stock_df)
+    stock_df = fin_columns.attach(stock_df, conf.fin_cols)
     return stock_df, all_finance_df, all_finance_df_not_discord
 
 
@@ -376,11 +454,12 @@ def merge_with_calc_fin_data(stock_df, no_discard_finance_df, calc_fin_cols, ext
                 extra_agg_dict[new_col] = 'last'
             continue
 
-        # 去年年报数据合并到df中
-        stock_df = pd.merge_asof(left=stock_df, right=fin_df, left_on='交易日期', right_on='publish_date',
-                                 direction='backward', suffixes=("", "_y"))
+        # 去年年报数据合并到df中，同一天发布的多份财报使用最后一份，和 merge_asof 一致
+        fin_df = fin_df.drop_duplicates(subset=['publish_date'], keep='last')
+        row_index = asof_index(stock_df['交易日期'], fin_df['publish_date'])
+        his_df = take_rows(fin_df[new_cols], row_index).ffill()
+        stock_df = stock_df.assign(**{new_col: his_df[new_col].to_numpy() for new_col in new_cols})
         for new_col in new_cols:
-            stock_df[new_col].fillna(method='ffill', inplace=True)
             extra_agg_dict[new_col] = 'last'
 
     return stock_df
@@ -11,6 +11,9 @@ import pandas as pd
 import requests
 
 from core.figure import draw_equity_curve_plotly
+from core.model.type_def import NAME_DELIST, NAME_S, NAME_ST, NAME_STAR
+from core.period_agg import aggregate_by_period
+from core.utils.asof import asof_index, take_rows
 
 pd.set_option('expand_frame_repr', False)
 pd.set_option('future.no_silent_downcasting', True)
@@ -174,8 +177,14 @@ def merge_with_index_data(df, index_data, fill_0_list=()):
     返回:
     DataFrame: 合并后的股票数据，包含补全的日期
     """
-    # 将股票数据和指数数据合并，结果已经排序
-    df = pd.merge(left=df, right=index_data, on='交易日期', how='right', sort=True, indicator=True)
+    # 将股票数据按交易日期对齐到指数数据上，结果按交易日期排序，和 pd.merge(how='right', sort=True) 一致
+    index_data = index_data.sort_values('交易日期', kind='stable').reset_index(drop=True)
+    row_index = asof_index(index_data['交易日期'], df['交易日期'], exact=True)
+    df = pd.concat([
+        take_rows(df, row_index).assign(交易日期=index_data['交易日期']),
+        index_data.drop(columns='交易日期'),
+    ], axis=1)
+    is_trading = row_index >= 0  # 股票当天有K线数据
 
     # 对开、高、收、低、前收盘价价格进行补全处理
     # 用前一天的收盘价，补全收盘价的空值
@@ -208,23 +217,43 @@ def merge_with_index_data(df, index_data, fill_0_list=()):
     df.ffill(inplace=True)
 
     # 去除上市之前的数据
-    df = df[df['股票代码'].notnull()]
+    listed = df['股票代码'].notnull().to_numpy()
+    df = df[listed]
 
     # 判断计算当天是否交易
-    df['是否交易'] = np.int8(1)
-    df.loc[df['_merge'] == 'right_only', '是否交易'] = np.int8(0)
-    del df['_merge']
+    df['是否交易'] = is_trading[listed].astype(np.int8)
     df.reset_index(drop=True, inplace=True)
 
     return df
 
 
+def cal_name_state(names) -> np.ndarray:
+    """
+    根据股票名称计算名称状态，每种状态占一个二进制位（NAME_ST、NAME_S、NAME_STAR、NAME_DELIST）
+    同一个股票的名称很少变化，只需要对不重复的名称做字符串匹配
+
+    参数:
+    names (Series): 股票名称
+
+    返回:
+    ndarray: int8 的名称状态，名称为空时为0
+    """
+    codes, uniques = pd.factorize(pd.Series(names))
+    unique_names = pd.Series(uniques, dtype=object)
+    unique_state = np.zeros(len(unique_names), dtype=np.int8)
+    for flag, keyword in ((NAME_ST, 'ST'), (NAME_S, 'S'), (NAME_STAR, '*'), (NAME_DELIST, '退')):
+        unique_state[unique_names.str.contains(keyword, regex=False, na=False).to_numpy(dtype=bool)] |= flag
+    state = np.zeros(len(codes), dtype=np.int8)
+    state[codes >= 0] = unique_state[codes[codes >= 0]]
+    return state
+
+
 def transfer_to_period_data(df, period, extra_agg_dict=None):
     """
     将日线数据转换为相应的周期数据
 
     参数:
-    df (DataFrame): 原始数据
+    df (DataFrame | dict): 原始数据，也可以是 {列名: 数据列} 的字典，不需要先拼成 DataFrame
     period (str): 需要转换的数据周期，例如 'W' 表示周频，'M' 表示月频
     extra_agg_dict (dict, optional): 额外的聚合字典，默认为空字典
 
@@ -234,7 +263,7 @@ def transfer_to_period_data(df, period, extra_agg_dict=None):
     # 创造一列用于周期末的时间计算
     if extra_agg_dict is None:
         extra_agg_dict = {}
-    df['周期最后交易日'] = df['交易日期']
+    df = {**df, '周期最后交易日': df['交易日期']} if isinstance(df, dict) else df.assign(周期最后交易日=df['交易日期'])
 
     # agg_dict 是周期内数据整合所必须的字典。数据整合方法包括:
     # first(保留周期内第一条数据)、max(保留周期内最大的数据)、min(保留周期内最小的数据)、sum(周期内所有数据求和)、last(保留最新数据)
@@ -243,6 +272,7 @@ def transfer_to_period_data(df, period, extra_agg_dict=None):
         '周期最后交易日': 'last',
         '股票代码': 'last',
         '股票名称': 'last',
+        '名称状态': 'last',
         '是否交易': ['last', 'sum', 'count'],  # 统计局和计算是否交易，交易天数，市场交易天数
         '开盘价': 'first',
         '最高价': 'max',
@@ -263,9 +293,9 @@ def transfer_to_period_data(df, period, extra_agg_dict=None):
     # 合并额外的聚合字典
     agg_dict = {**agg_dict, **extra_agg_dict}
 
-    # 根据周期offset情况，进行groupby后，得到对应的nD/周线/月线数据
+    # 根据周期offset情况，按周期聚合后，得到对应的nD/周线/月线数据，结果和 df.groupby(group_tag).agg(agg_dict) 一致
     group_tag = f'{period}起始日'
-    period_df = df.groupby(group_tag).agg(agg_dict)
+    period_df = aggregate_by_period(df, group_tag, agg_dict)
     period_df.columns = [
         '是否交易' if col == ('是否交易', 'last') else
         '交易天数' if col == ('是否交易', 'sum') else
@@ -304,6 +334,75 @@ def transfer_to_period_data(df, period, extra_agg_dict=None):
     return period_df
 
 
+def _round_to_cents(values, half_up):
+    """
+    把价格精确地舍入到分，全程使用整数运算，结果和 Decimal 逐个舍入完全一致
+
+    浮点数可以精确地拆成 尾数 * 2^指数（尾数是53位以内的整数），
+    所以 价格 * 100 = 尾数 * 100 * 2^指数，尾数 * 100 不会超过 2^60，可以直接用 int64 计算，
+    再通过右移实现向下取整，不会有任何浮点误差
+
+    参数:
+    values (ndarray): 价格数组
+    half_up (bool): True 表示四舍五入（ROUND_HALF_UP），False 表示直接截断（ROUND_DOWN）
+
+    返回:
+    ndarray: 舍入到分之后的价格数组，NaN 保持不变
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = values.copy()
+    finite = np.isfinite(values)
+    if not finite.any():
+        return result
+
+    x = np.abs(values[finite])
+    mantissa, exponent = np.frexp(x)
+    mantissa = np.ldexp(mantissa, 53).astype(np.int64)  # 53位整数尾数，x = mantissa * 2^(exponent - 53)
+    shift = 53 - exponent.astype(np.int64)  # x * 100 = mantissa * 100 / 2^shift
+
+    # 尾数不超过 2^53，shift 超过 61 时价格不到 2^-8，乘以100之后小于0.5，舍入结果一定是0
+    valid = (shift > 0) & (shift <= 61)
+    safe_shift = np.where(valid, shift, 1)
+    scaled = mantissa * 100
+    if half_up:
+        scaled = scaled + (np.int64(1) << (safe_shift - 1))  # 加上0.5分再向下取整
+    cents = np.where(valid, scaled >> safe_shift, 0)
+
+    # 价格本身超过 2^53 时已经是整数，不需要舍入（实际行情中不会出现）
+    big = shift <= 0
+    rounded = cents / 100
+    rounded[big] = x[big]
+
+    result[finite] = np.copysign(rounded, values[finite])
+    return result
+
+
+def price_round(values):
+    """
+    涨跌停价格的四舍五入，等价于逐个计算 float(Decimal(x + 1e-7).quantize(Decimal('1.00'), ROUND_HALF_UP))
+
+    参数:
+    values (ndarray): 未舍入的涨跌停价格
+
+    返回:
+    ndarray: 四舍五入到分的价格
+    """
+    return _round_to_cents(np.asarray(values, dtype=np.float64) + 1e-7, half_up=True)
+
+
+def price_round_bj(values):
+    """
+    北交所涨跌停价格的截断，等价于逐个计算 float(Decimal(x).quantize(Decimal('0.00'), rounding=ROUND_DOWN))
+
+    参数:
+    values (ndarray): 未舍入的涨跌停价格
+
+    返回:
+    ndarray: 截断到分的价格
+    """
+    return _round_to_cents(values, half_up=False)
+
+
 def cal_zdt_price(df):
     """
     计算股票当天的涨跌停价格。在计算涨跌停价格的时候，按照严格的四舍五入。
@@ -325,14 +424,14 @@ def cal_zdt_price(df):
         北交所（bj） 30%
 
     参数:
-    df (DataFrame): 必须得是日线数据。必须包含的字段：前收盘价，开盘价，最高价，最低价
+    df (DataFrame): 必须得是日线数据。必须包含的字段：前收盘价，开盘价，最高价，最低价，以及名称状态（没有时由股票名称计算）
 
     返回:
     DataFrame: 包含涨停价、跌停价、一字涨停、一字跌停、开盘涨停、开盘跌停等字段的DataFrame
     """
-    from decimal import Decimal, ROUND_HALF_UP, ROUND_DOWN
     # 计算普通股票的涨停价和跌停价
-    cond = df['股票名称'].str.contains('ST')
+    name_state = df['名称状态'].to_numpy() if '名称状态' in df.columns else cal_name_state(df['股票名称'])
+    cond = (name_state & NAME_ST) != 0
     df['涨停价'] = df['前收盘价'] * 1.1
     df['跌停价'] = df['前收盘价'] * 0.9
     df.loc[cond, '涨停价'] = df['前收盘价'] * 1.05
@@ -349,17 +448,14 @@ def cal_zdt_price(df):
     df.loc[cond_bj, '涨停价'] = df['前收盘价'] * 1.3
     df.loc[cond_bj, '跌停价'] = df['前收盘价'] * 0.7
 
-    # 四舍五入
-    def price_round(x):
-        return float(Decimal(x + 1e-7).quantize(Decimal('1.00'), ROUND_HALF_UP))
-    df.loc[~cond_bj, '涨停价'] = df['涨停价'].apply(price_round)
-    df.loc[~cond_bj, '跌停价'] = df['跌停价'].apply(price_round)
+    # 四舍五入，与 Decimal(x + 1e-7).quantize(Decimal('1.00'), ROUND_HALF_UP) 的结果完全一致
+    df.loc[~cond_bj, '涨停价'] = price_round(df.loc[~cond_bj, '涨停价'].to_numpy(dtype=float))
+    df.loc[~cond_bj, '跌停价'] = price_round(df.loc[~cond_bj, '跌停价'].to_numpy(dtype=float))
 
     # 北交所特殊处理：北交所的规则是涨跌停价格小于等于30%，不做四舍五入，所以超过30%的部分需要减去1分钱
-    def price_round_bj(x):
-        return float(Decimal(x).quantize(Decimal('0.00'), rounding=ROUND_DOWN))
-    df.loc[cond_bj, '涨停价'] = df['涨停价'].apply(price_round_bj)
-    df.loc[cond_bj, '跌停价'] = df['跌停价'].apply(price_round_bj)
+    # 与 Decimal(x).quantize(Decimal('0.00'), rounding=ROUND_DOWN) 的结果完全一致
+    df.loc[cond_bj, '涨停价'] = price_round_bj(df.loc[cond_bj, '涨停价'].to_numpy(dtype=float))
+    df.loc[cond_bj, '跌停价'] = price_round_bj(df.loc[cond_bj, '跌停价'].to_numpy(dtype=float))
 
     # 判断是否一字涨停
     df['一字涨停'] = False
@@ -30,6 +30,8 @@ class BacktestConfig:
         self.initial_cash: float = config_dict.get("initial_cash", 100_0000)  # 初始资金默认100万
         self.c_rate: float = config_dict.get("c_rate", 1.2 / 10000)  # 手续费，默认为0.002，表示万分之二
         self.t_rate: float = config_dict.get("t_rate", 1 / 1000)  # 印花税，默认为0.001
+        # 调仓方式：full 表示换仓日收盘全部卖出，下个交易日开盘买入；delta 表示只买卖持仓和目标之间的差额
+        self.rebalance_mode: str = config_dict.get("rebalance_mode", "full")
 
         data_center_path = config_dict.get("data_center_path", "not-provided")
         self.data_center_path = Path(data_center_path)
@@ -54,6 +56,9 @@ class BacktestConfig:
         # 缓存被排除的板块
         self.excluded_boards: list = config_dict.get("excluded_boards", [])
 
+        # 是否增量准备数据，缓存不存在或者数据配置变化时，会自动全量重建
+        self.incremental_data: bool = config_dict.get("incremental_data", False)
+
         # 资金曲线再择时配置，会在load_strategy中初始化
         self.equity_timing: Optional[EquityTiming] = None
 
@@ -69,6 +74,10 @@ class BacktestConfig:
         else:
             self.strategy_raw = strategy
             stg_dict: dict = strategy
+        if "rebalance_mode" in stg_dict:
+            # 策略中可以单独指定调仓方式，方便参数遍历时比较
+            stg_dict = {**stg_dict}
+            self.rebalance_mode = stg_dict.pop("rebalance_mode")
         strategy_name = stg_dict["name"]
         stg_dict["funcs"] = get_strategy_by_name(strategy_name)
         self.strategy = StrategyConfig.init(**stg_dict)
@@ -208,6 +217,8 @@ class BacktestConfig:
         fullname = f"{self.strategy.get_fullname()}，初始资金￥{self.initial_cash:,.2f}"
         if self.equity_timing is not None:
             fullname += f"，再择时：{self.equity_timing.name, self.equity_timing.params}"
+        if self.rebalance_mode != "full":
+            fullname += f"，调仓方式：{self.rebalance_mode}"
         return fullname
 
     def set_report(self, report: pd.DataFrame):
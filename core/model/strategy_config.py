@@ -10,28 +10,34 @@ import numpy as np
 import pandas as pd
 
 from config import days_listed
-
-
-def filter_series_by_range(series, range_str):
+from core.model.type_def import NAME_DELIST, NAME_S, NAME_ST, NAME_STAR
+
+# 过滤条件中的比较运算
+COMPARE_FUNCS = {
+    '>=': np.greater_equal,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+    '>': np.greater,
+    '<': np.less,
+}
+
+
+def parse_range(range_str) -> tuple:
+    """
+    解析过滤范围，比如 '<=0.2' 解析为 (np.less_equal, 0.2)
+    """
     # 提取运算符和数值
     operator = range_str[:2] if range_str[:2] in ['>=', '<=', '==', '!='] else range_str[0]
     value = float(range_str[len(operator):])
+    if operator not in COMPARE_FUNCS:
+        raise ValueError(f"Unsupported operator: {operator}")
+    return COMPARE_FUNCS[operator], value
 
-    match operator:
-        case '>=':
-            return series >= value
-        case '<=':
-            return series <= value
-        case '==':
-            return series == value
-        case '!=':
-            return series != value
-        case '>':
-            return series > value
-        case '<':
-            return series < value
-        case _:
-            raise ValueError(f"Unsupported operator: {operator}")
+
+def filter_series_by_range(series, range_str):
+    compare, value = parse_range(range_str)
+    return compare(series, value)
 
 
 def get_col_name(factor_name, factor_param):
@@ -177,24 +183,51 @@ def calc_factor_common(df, factor_list: List[FactorConfig]):
     return factor_val
 
 
-def filter_common(df, filter_list):
-    condition = pd.Series(True, index=df.index)
+class FilterPlan:
+    """
+    过滤因子列表（filter_list）的执行计划，解析一次，每次过滤直接使用：
+    - 过滤范围的比较运算和数值提前解析好
+    - 同一个因子列、同一个排序方向的 rank 和 pct 过滤，共用一次按交易日期分组的排名
+    - 全部过滤条件在 numpy 数组上计算，合并成一个布尔数组
+    """
+
+    def __init__(self, filter_list: List[FilterFactorConfig]):
+        self.rules = []  # [(过滤方式, 因子列名, 是否正排序, 比较运算, 数值)]
+        for filter_config in filter_list:
+            how = filter_config.method.how
+            if how not in ('rank', 'pct', 'val'):
+                raise ValueError(f'不支持的过滤方式：{how}')
+            compare, value = parse_range(filter_config.method.range)
+            self.rules.append((how, filter_config.col_name, filter_config.is_sort_asc, compare, value))
+
+    def evaluate(self, df) -> np.ndarray:
+        """
+        计算过滤条件
+        :param df: 周期数据
+        :return: 和 df 逐行对应的布尔数组，True 表示满足全部过滤条件
+        """
+        condition = np.ones(len(df), dtype=bool)
+        grouped = None
+        ranks = {}  # {(因子列名, 是否正排序): (排名, 当天因子值不为空的股票数量)}
+        for how, col_name, is_sort_asc, compare, value in self.rules:
+            if how == 'val':
+                values = df[col_name].to_numpy()
+            else:
+                if (col_name, is_sort_asc) not in ranks:
+                    grouped = grouped if grouped is not None else df.groupby('交易日期')
+                    ranks[(col_name, is_sort_asc)] = (
+                        grouped[col_name].rank(ascending=is_sort_asc).to_numpy(),
+                        grouped[col_name].transform('count').to_numpy(),
+                    )
+                rank, count = ranks[(col_name, is_sort_asc)]
+                # 排名百分比和 rank(pct=True) 一致：排名 / 当天因子值不为空的股票数量
+                values = rank if how == 'rank' else rank / count
+            condition &= compare(values, value)
+        return condition
 
-    for filter_config in filter_list:
-        col_name = f'{filter_config.name}_{str(filter_config.param)}'
-        match filter_config.method.how:
-            case 'rank':
-                rank = df.groupby('交易日期')[col_name].rank(ascending=filter_config.is_sort_asc, pct=False)
-                condition = condition & filter_series_by_range(rank, filter_config.method.range)
-            case 'pct':
-                rank = df.groupby('交易日期')[col_name].rank(ascending=filter_config.is_sort_asc, pct=True)
-                condition = condition & filter_series_by_range(rank, filter_config.method.range)
-            case 'val':
-                condition = condition & filter_series_by_range(df[col_name], filter_config.method.range)
-            case _:
-                raise ValueError(f'不支持的过滤方式：{filter_config.method.how}')
 
-    return condition
+def filter_common(df, filter_list):
+    return pd.Series(FilterPlan(filter_list).evaluate(df), index=df.index)
 
 
 @dataclass
@@ -250,6 +283,10 @@ class StrategyConfig:
 
         return list(factor_columns)
 
+    @cached_property
+    def filter_plan(self) -> FilterPlan:
+        return FilterPlan(self.filter_list)
+
     @cached_property
     def all_factors(self) -> set:
         all_factors = set()
@@ -286,28 +323,21 @@ class StrategyConfig:
 
         # 通用的filter筛选
         # =删除不能交易的周期数
-        # 删除月末为st状态的周期数
-        cond1 = ~period_df['股票名称'].str.contains('ST', regex=False)
-        # 删除月末为s状态的周期数
-        cond2 = ~period_df['股票名称'].str.contains('S', regex=False)
-        # 删除月末有退市风险的周期数
-        cond3 = ~period_df['股票名称'].str.contains('*', regex=False)
-        cond4 = ~period_df['股票名称'].str.contains('退', regex=False)
+        # 删除月末为st状态、s状态、有退市风险（名称包含 * 或者 退）的周期数，名称状态在step1中已经由股票名称算好
+        cond1 = (period_df['名称状态'].to_numpy() & (NAME_ST | NAME_S | NAME_STAR | NAME_DELIST)) == 0
         # 删除交易天数过少的周期数
-        cond5 = period_df['交易天数'] / period_df['市场交易天数'] >= 0.8
+        cond2 = period_df['交易天数'].to_numpy() / period_df['市场交易天数'].to_numpy() >= 0.8
 
-        cond6 = period_df['下日_是否交易'] == 1
-        cond7 = period_df['下日_开盘涨停'] != 1
-        cond8 = period_df['下日_是否ST'] != 1
-        cond9 = period_df['下日_是否退市'] != 1
-        cond10 = period_df['上市至今交易天数'] > days_listed
+        cond3 = period_df['下日_是否交易'].to_numpy() == 1
+        cond4 = period_df['下日_开盘涨停'].to_numpy() != 1
+        cond5 = period_df['下日_是否ST'].to_numpy() != 1
+        cond6 = period_df['下日_是否退市'].to_numpy() != 1
+        cond7 = period_df['上市至今交易天数'].to_numpy() > days_listed
 
-        common_filter = cond1 & cond2 & cond3 & cond4 & cond5 & cond6 & cond7 & cond8 & cond9 & cond10
+        common_filter = cond1 & cond2 & cond3 & cond4 & cond5 & cond6 & cond7
         period_df = period_df[common_filter]
 
-        filter_condition = filter_common(period_df, self.filter_list)
-
-        return period_df[filter_condition]
+        return period_df[self.filter_plan.evaluate(period_df)]
 
     def calc_select_factor(self, period_df):
         if 'calc_select_factor' in self.funcs:
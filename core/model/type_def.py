@@ -19,6 +19,19 @@ SZSE_MAIN = 3
 # 深交所创业板 sz30xxxx
 SZSE_CHINEXT = 4
 
+# 股票名称状态（名称状态列），每种状态占一个二进制位，由股票名称计算，可以同时有多个状态，比如 *ST = NAME_ST | NAME_STAR
+# 名称包含 ST
+NAME_ST = 1
+
+# 名称包含 S（包括 ST）
+NAME_S = 2
+
+# 名称包含 *
+NAME_STAR = 4
+
+# 名称包含 退
+NAME_DELIST = 8
+
 
 @jitclass
 class StockMarketData:
@@ -0,0 +1,190 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+from numba import njit
+
+# 日线数据按周期聚合（周期转换），结果和 df.groupby(周期列).agg(agg_dict) 完全一致
+#
+# 日线数据已经按交易日期排好序，同一个周期的数据是连续的一段，只需要找到每个周期的起止位置（分组边界），
+# 再用 numba 在每一段上做聚合，直接得到周期数据，不需要创建 pandas 的 groupby 对象。
+# - last、first、max、min 先算出取值的行号，再按行号取数据，任何数据类型都保持不变
+# - sum、mean 和 pandas 一样使用 Kahan 求和，结果逐位一致
+# - count 统计非空值的数量
+# - 其他聚合方式（比如自定义函数）仍然使用 pandas 计算
+
+
+@njit(cache=True)
+def _first_last_index(valid, order, bounds, last):
+    """
+    每个周期第一个（或最后一个）非空值的行号，全部为空值时为-1
+    """
+    n_groups = len(bounds) - 1
+    out = np.full(n_groups, -1, dtype=np.int64)
+    for g in range(n_groups):
+        if last:
+            for k in range(bounds[g + 1] - 1, bounds[g] - 1, -1):
+                if valid[order[k]]:
+                    out[g] = order[k]
+                    break
+        else:
+            for k in range(bounds[g], bounds[g + 1]):
+                if valid[order[k]]:
+                    out[g] = order[k]
+                    break
+    return out
+
+
+@njit(cache=True)
+def _min_max_index(values, order, bounds, is_max):
+    """
+    每个周期最大值（或最小值）的行号，相同的值取第一个，全部为空值时为-1
+    """
+    n_groups = len(bounds) - 1
+    out = np.full(n_groups, -1, dtype=np.int64)
+    for g in range(n_groups):
+        best = -1
+        for k in range(bounds[g], bounds[g + 1]):
+            i = order[k]
+            val = values[i]
+            if val != val:
+                continue
+            if best < 0 or (val > values[best] if is_max else val < values[best]):
+                best = i
+        out[g] = best
+    return out
+
+
+@njit(cache=True)
+def _sum_count(values, order, bounds):
+    """
+    每个周期非空值的和（Kahan 求和，和 pandas 的 groupby sum 一致）以及非空值的数量
+    """
+    n_groups = len(bounds) - 1
+    sums = np.zeros(n_groups, dtype=values.dtype)
+    counts = np.zeros(n_groups, dtype=np.int64)
+    zero = np.zeros(1, dtype=values.dtype)[0]
+    for g in range(n_groups):
+        total = zero
+        compensation = zero
+        nobs = 0
+        for k in range(bounds[g], bounds[g + 1]):
+            val = values[order[k]]
+            if val != val:
+                continue
+            nobs += 1
+            y = val - compensation
+            t = total + y
+            compensation = t - total - y
+            if compensation != compensation:
+                # 数值为正负无穷时，补偿项为 NaN，需要重置
+                compensation = zero
+            total = t
+        sums[g] = total
+        counts[g] = nobs
+    return sums, counts
+
+
+@njit(cache=True)
+def _count(valid, order, bounds):
+    """
+    每个周期非空值的数量
+    """
+    n_groups = len(bounds) - 1
+    out = np.zeros(n_groups, dtype=np.int64)
+    for g in range(n_groups):
+        for k in range(bounds[g], bounds[g + 1]):
+            if valid[order[k]]:
+                out[g] += 1
+    return out
+
+
+def _to_array(values):
+    """
+    转为 numpy 数组，pandas 特有的数据类型（比如字符串）保持为 ExtensionArray
+    """
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.array
+    if isinstance(values, pd.arrays.NumpyExtensionArray):
+        values = values.to_numpy()
+    return values if isinstance(values, pd.api.extensions.ExtensionArray) else np.asarray(values)
+
+
+def _take(values, index: np.ndarray):
+    """
+    按行号取数据，行号为-1时为空值
+    """
+    return pd.api.extensions.take(values, index, allow_fill=True)
+
+
+def _aggregate_column(values, how, order, bounds):
+    """
+    按 how 聚合一列数据，不支持的聚合方式返回 None
+    """
+    if how in ('last', 'first'):
+        return _take(values, _first_last_index(~pd.isna(values), order, bounds, how == 'last'))
+    if how == 'count':
+        return _count(~pd.isna(values), order, bounds)
+
+    if not isinstance(values, np.ndarray) or values.dtype.kind not in 'biuf':
+        return None
+    if how in ('max', 'min'):
+        kernel_values = values.view(np.uint8) if values.dtype.kind == 'b' else values
+        return _take(values, _min_max_index(kernel_values, order, bounds, how == 'max'))
+    if how == 'sum':
+        # 整数在 int64 上求和，浮点数保持原来的精度；布尔值求和为 int64，整数求和保持原来的类型，和 pandas 一致
+        sums, _ = _sum_count(values if values.dtype.kind == 'f' else values.astype(np.int64), order, bounds)
+        return sums if values.dtype.kind in 'bf' else sums.astype(values.dtype)
+    if how == 'mean':
+        # 整数先转为 float64 再求均值
+        sums, counts = _sum_count(values if values.dtype.kind == 'f' else values.astype(np.float64), order, bounds)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts.astype(sums.dtype), np.nan).astype(sums.dtype)
+    return None
+
+
+def aggregate_by_period(df, group_tag: str, agg_dict: dict) -> pd.DataFrame:
+    """
+    按周期列聚合日线数据
+
+    参数:
+    df (DataFrame | dict): 日线数据，也可以是 {列名: 数据列} 的字典，不需要先拼成 DataFrame
+    group_tag (str): 周期列的名称，比如 'W起始日'，为空值的行不参与聚合
+    agg_dict (dict): 聚合规则，{列名: 聚合方式 或 聚合方式列表}，和 DataFrame.agg 的参数一致
+
+    返回:
+    DataFrame: 周期数据，index 为周期列的值（从小到大），columns 为 (列名, 聚合方式)
+    """
+    codes, uniques = pd.factorize(_to_array(df[group_tag]), sort=True)
+    # 每个周期的数据在 order 中是连续的一段，bounds 为每一段的起止位置
+    if len(codes) == 0 or np.all(codes[1:] >= codes[:-1]):
+        order = np.arange(len(codes), dtype=np.int64)
+        sorted_codes = codes
+    else:
+        order = np.argsort(codes, kind='stable').astype(np.int64)
+        sorted_codes = codes[order]
+    bounds = np.searchsorted(sorted_codes, np.arange(len(uniques) + 1), side='left').astype(np.int64)
+    index = pd.Index(uniques, name=group_tag)
+
+    results = []
+    col_names, how_names = [], []
+    for col_name, how_list in agg_dict.items():
+        values = _to_array(df[col_name])
+        for how in (how_list if isinstance(how_list, list) else [how_list]):
+            result = _aggregate_column(values, how, order, bounds) if isinstance(how, str) else None
+            if result is None:
+                # 不支持的聚合方式，仍然使用 pandas 计算
+                valid = codes >= 0
+                result = pd.Series(values)[valid].groupby(codes[valid]).agg(how).reindex(range(len(uniques))).array
+            results.append(result)
+            col_names.append(col_name)
+            how_names.append(how if isinstance(how, str) else how.__name__)
+
+    period_df = pd.DataFrame(dict(enumerate(results)), index=index, copy=False)
+    # 直接由编码创建列名，比 MultiIndex.from_tuples 快很多
+    col_codes, col_levels = pd.factorize(pd.Index(col_names))
+    how_codes, how_levels = pd.factorize(pd.Index(how_names))
+    period_df.columns = pd.MultiIndex(levels=[col_levels, how_levels], codes=[col_codes, how_codes],
+                                      verify_integrity=False)
+    return period_df
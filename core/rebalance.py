@@ -67,6 +67,52 @@ class RebAlways:
 
         return target_pos
 
+    def calc_delta_lots(self, equity, prices, ratios, pos_values):
+        """
+        差额调仓：计算每个股票需要买卖的股数，只交易当前持仓和目标持仓之间的差额
+        目标持仓和 calc_lots 一样计算，差额同样遵守最小交易单位：科创板至少 200 股，其他板块按 100 的整数倍，
+        不足一个交易单位的差额不交易，目标持仓为 0 时卖出全部持仓（包括零股）
+        :param equity: 总权益（现金 + 持仓市值）
+        :param prices: 股票最新价格
+        :param ratios: 股票的资金比例
+        :param pos_values: 股票当前的仓位价值
+        :return: 股票需要买卖的股数，正数买入，负数卖出
+        """
+        target_pos = self.calc_lots(equity, prices, ratios)
+
+        n_syms = len(prices)
+        delta_pos = np.zeros(n_syms, dtype=np.float64)
+
+        for idx_sym in range(n_syms):
+            pr = prices[idx_sym]
+
+            # 价格无效（停牌），无法交易，保持当前持仓
+            if np.isnan(pr):
+                continue
+
+            # 当前持仓股数，除权除息之后可能不是整数
+            cur_pos = pos_values[idx_sym] / pr
+
+            # 目标持仓为 0，卖出全部持仓
+            if target_pos[idx_sym] == 0:
+                delta_pos[idx_sym] = -cur_pos
+                continue
+
+            # 差额向 0 取整，只交易完整的交易单位
+            diff = int(target_pos[idx_sym] - cur_pos)
+            size = abs(diff)
+            if self.types[idx_sym] == SSE_STAR:
+                # 科创板单笔至少 200 股
+                if size < 200:
+                    size = 0
+            else:
+                # 其他板块必须按 100 的整数倍
+                size -= size % 100
+
+            delta_pos[idx_sym] = size if diff > 0 else -size
+
+        return delta_pos
+
 
 # Only for test purpose, lots are not considered
 @jitclass
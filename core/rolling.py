@@ -0,0 +1,448 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numba as nb
+import numpy as np
+import pandas as pd
+
+# 滚动窗口计算的numba实现，供因子库中的因子使用
+#
+# - 支持一维数组（单个股票的时间序列）和二维数组（交易日期 x 股票代码 的宽表，按列独立计算），
+#   也可以直接传入 Series / DataFrame，返回相同索引的 Series / DataFrame
+# - 空值的处理和 pandas 一致：窗口内的空值不参与计算，有效数据的数量不足 min_periods 时结果为空值，
+#   min_periods 默认等于窗口长度
+# - sum、mean、var、std 使用和 pandas 相同的在线算法（Kahan 补偿求和、Welford 方差），结果和 pandas 逐位一致
+
+# 计算结果只剩下3位左右有效数字时，认为出现了严重的抵消误差（和 pandas 一致）
+_INV_COND_TOL = np.finfo(np.float64).eps * 1e3
+
+
+def _apply(kernel, values, *args):
+    """
+    调用二维的numba函数，一维数据按单列处理，pandas对象保留原来的索引
+    """
+    array = np.asarray(values, dtype=np.float64)
+    if array.ndim not in (1, 2):
+        raise ValueError(f"只支持一维或二维数据，当前维度：{array.ndim}")
+    # 按列计算，列优先的内存布局可以让每一列的数据连续
+    array_2d = np.asfortranarray(array.reshape(array.shape[0], -1 if array.ndim == 2 else 1))
+    out = np.empty_like(array_2d)
+    kernel(array_2d, *args, out)
+    return _wrap_like(values, out.reshape(array.shape))
+
+
+def _wrap_like(values, out):
+    if isinstance(values, pd.DataFrame):
+        return pd.DataFrame(out, index=values.index, columns=values.columns)
+    if isinstance(values, pd.Series):
+        return pd.Series(out, index=values.index, name=values.name)
+    return out
+
+
+def _get_min_periods(window, min_periods):
+    if window < 1:
+        raise ValueError(f"窗口长度必须大于0：{window}")
+    if min_periods is None:
+        return window
+    if min_periods > window:
+        raise ValueError(f"min_periods({min_periods})不能大于窗口长度({window})")
+    return max(min_periods, 0)
+
+
+# ====================================================================================================
+# sum / mean
+# ====================================================================================================
+@nb.njit(cache=True)
+def _roll_sum_mean(values, window, min_periods, is_mean, out):
+    n_rows, n_cols = values.shape
+    for col in range(n_cols):
+        x = values[:, col]
+        nobs = 0
+        neg_ct = 0
+        sum_x = 0.0
+        compensation_add = 0.0
+        compensation_remove = 0.0
+        prev_value = np.nan
+        num_consecutive_same_value = 0
+
+        for i in range(n_rows):
+            start = max(i - window + 1, 0)
+            if i == 0 or start >= i:
+                # 第一个窗口（或者窗口长度为1），重新开始累计
+                nobs = 0
+                neg_ct = 0
+                sum_x = 0.0
+                compensation_add = 0.0
+                compensation_remove = 0.0
+                prev_value = x[start]
+                num_consecutive_same_value = 0
+                first_add = start
+            else:
+                # 移除离开窗口的数据
+                if start > 0:
+                    val = x[start - 1]
+                    if not np.isnan(val):
+                        nobs -= 1
+                        y = -val - compensation_remove
+                        t = sum_x + y
+                        compensation_remove = t - sum_x - y
+                        sum_x = t
+                        if np.signbit(val):
+                            neg_ct -= 1
+                first_add = i
+
+            # 加入新的数据
+            for j in range(first_add, i + 1):
+                val = x[j]
+                if not np.isnan(val):
+                    nobs += 1
+                    y = val - compensation_add
+                    t = sum_x + y
+                    compensation_add = t - sum_x - y
+                    sum_x = t
+                    if np.signbit(val):
+                        neg_ct += 1
+                    if val == prev_value:
+                        num_consecutive_same_value += 1
+                    else:
+                        num_consecutive_same_value = 1
+                    prev_value = val
+
+            if is_mean:
+                if nobs >= min_periods and nobs > 0:
+                    result = sum_x / nobs
+                    if num_consecutive_same_value >= nobs:
+                        # 窗口内的数据都相同，避免浮点误差
+                        result = prev_value
+                    elif neg_ct == 0 and result < 0:
+                        result = 0.0
+                    elif neg_ct == nobs and result > 0:
+                        result = 0.0
+                else:
+                    result = np.nan
+            else:
+                if nobs == 0 == min_periods:
+                    result = 0.0
+                elif nobs >= min_periods:
+                    if num_consecutive_same_value >= nobs:
+                        result = prev_value * nobs
+                    else:
+                        result = sum_x
+                else:
+                    result = np.nan
+            out[i, col] = result
+
+
+def rolling_sum(values, window, min_periods=None):
+    """
+    滚动求和，和 pandas rolling(window, min_periods).sum() 一致
+    """
+    return _apply(_roll_sum_mean, values, window, _get_min_periods(window, min_periods), False)
+
+
+def rolling_mean(values, window, min_periods=None):
+    """
+    滚动均值，和 pandas rolling(window, min_periods).mean() 一致
+    """
+    return _apply(_roll_sum_mean, values, window, _get_min_periods(window, min_periods), True)
+
+
+# ====================================================================================================
+# var / std
+# ====================================================================================================
+# 方差计算的中间状态：有效数据个数、均值、离差平方和、加入数据的补偿项、移除数据的补偿项、是否数值不稳定
+_NOBS, _MEAN, _SSQDM, _COMP_ADD, _COMP_REMOVE, _UNSTABLE = range(6)
+
+
+@nb.njit(cache=True)
+def _add_var(val, state):
+    if np.isnan(val):
+        return
+    prev_m2 = state[_SSQDM]
+    state[_NOBS] += 1
+    # Welford 在线算法，配合 Kahan 补偿求和
+    prev_mean = state[_MEAN] - state[_COMP_ADD]
+    y = val - state[_COMP_ADD]
+    t = y - state[_MEAN]
+    state[_COMP_ADD] = t + state[_MEAN] - y
+    state[_MEAN] = state[_MEAN] + t / state[_NOBS]
+    state[_SSQDM] = state[_SSQDM] + (val - prev_mean) * (val - state[_MEAN])
+    if prev_m2 * _INV_COND_TOL > state[_SSQDM]:
+        # 可能出现了严重的抵消误差，需要重新计算整个窗口
+        state[_UNSTABLE] = 1.0
+
+
+@nb.njit(cache=True)
+def _remove_var(val, state):
+    if np.isnan(val):
+        return
+    prev_m2 = state[_SSQDM]
+    state[_NOBS] -= 1
+    if state[_NOBS]:
+        prev_mean = state[_MEAN] - state[_COMP_REMOVE]
+        y = val - state[_COMP_REMOVE]
+        t = y - state[_MEAN]
+        state[_COMP_REMOVE] = t + state[_MEAN] - y
+        state[_MEAN] = state[_MEAN] - t / state[_NOBS]
+        state[_SSQDM] = state[_SSQDM] - (val - prev_mean) * (val - state[_MEAN])
+        if prev_m2 * _INV_COND_TOL > state[_SSQDM]:
+            state[_UNSTABLE] = 1.0
+    else:
+        state[_MEAN] = 0.0
+        state[_SSQDM] = 0.0
+        state[_UNSTABLE] = 0.0
+
+
+@nb.njit(cache=True)
+def _roll_var(values, window, min_periods, ddof, take_sqrt, out):
+    n_rows, n_cols = values.shape
+    min_periods = max(min_periods, 1)
+    state = np.zeros(6)
+    for col in range(n_cols):
+        x = values[:, col]
+        for i in range(n_rows):
+            start = max(i - window + 1, 0)
+            requires_recompute = i == 0 or start >= i
+            if not requires_recompute:
+                # 移除离开窗口的数据，再加入新的数据
+                if start > 0:
+                    _remove_var(x[start - 1], state)
+                _add_var(x[i], state)
+
+            if requires_recompute or state[_UNSTABLE]:
+                # 第一个窗口，或者出现了数值不稳定，重新开始累计
+                state[:] = 0.0
+                for j in range(start, i + 1):
+                    _add_var(x[j], state)
+                state[_UNSTABLE] = 0.0
+
+            nobs = state[_NOBS]
+            if nobs >= min_periods and nobs > ddof:
+                result = state[_SSQDM] / (nobs - ddof)
+                if take_sqrt:
+                    result = np.sqrt(result) if result >= 0 else 0.0
+            else:
+                result = np.nan
+            out[i, col] = result
+
+
+def rolling_var(values, window, min_periods=None, ddof=1):
+    """
+    滚动方差，和 pandas rolling(window, min_periods).var(ddof) 一致
+    """
+    return _apply(_roll_var, values, window, _get_min_periods(window, min_periods), ddof, False)
+
+
+def rolling_std(values, window, min_periods=None, ddof=1):
+    """
+    滚动标准差，和 pandas rolling(window, min_periods).std(ddof) 一致
+    """
+    return _apply(_roll_var, values, window, _get_min_periods(window, min_periods), ddof, True)
+
+
+def rolling_zscore(values, window, min_periods=None, ddof=1):
+    """
+    滚动标准分：(当前值 - 窗口均值) / 窗口标准差，标准差为0时结果为空值
+    """
+    mean = rolling_mean(values, window, min_periods)
+    std = rolling_std(values, window, min_periods, ddof)
+    array = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zscore = (array - np.asarray(mean)) / np.asarray(std)
+    zscore[np.asarray(std) == 0] = np.nan
+    return _wrap_like(values, zscore)
+
+
+# ====================================================================================================
+# min / max
+# ====================================================================================================
+@nb.njit(cache=True)
+def _roll_min_max(values, window, min_periods, is_max, out):
+    n_rows, n_cols = values.shape
+    # 单调队列，保存窗口内候选值的行号
+    queue = np.empty(n_rows, dtype=np.int64)
+    for col in range(n_cols):
+        x = values[:, col]
+        head = 0
+        tail = 0
+        nobs = 0
+        for i in range(n_rows):
+            if i >= window:
+                if not np.isnan(x[i - window]):
+                    nobs -= 1
+                if head < tail and queue[head] <= i - window:
+                    head += 1
+
+            val = x[i]
+            if not np.isnan(val):
+                nobs += 1
+                if is_max:
+                    while head < tail and x[queue[tail - 1]] <= val:
+                        tail -= 1
+                else:
+                    while head < tail and x[queue[tail - 1]] >= val:
+                        tail -= 1
+                queue[tail] = i
+                tail += 1
+
+            if nobs >= min_periods and nobs > 0:
+                out[i, col] = x[queue[head]]
+            else:
+                out[i, col] = np.nan
+
+
+def rolling_min(values, window, min_periods=None):
+    """
+    滚动最小值，和 pandas rolling(window, min_periods).min() 一致
+    """
+    return _apply(_roll_min_max, values, window, _get_min_periods(window, min_periods), False)
+
+
+def rolling_max(values, window, min_periods=None):
+    """
+    滚动最大值，和 pandas rolling(window, min_periods).max() 一致
+    """
+    return _apply(_roll_min_max, values, window, _get_min_periods(window, min_periods), True)
+
+
+# ====================================================================================================
+# rank
+# ====================================================================================================
+@nb.njit(cache=True)
+def _roll_rank(values, window, min_periods, ascending, pct, out):
+    n_rows, n_cols = values.shape
+    for col in range(n_cols):
+        x = values[:, col]
+        nobs = 0
+        for i in range(n_rows):
+            if i >= window and not np.isnan(x[i - window]):
+                nobs -= 1
+            val = x[i]
+            if not np.isnan(val):
+                nobs += 1
+
+            if np.isnan(val) or nobs < min_periods or nobs == 0:
+                out[i, col] = np.nan
+                continue
+
+            # 当前值在窗口内的排名，相同的值取平均排名
+            n_before = 0
+            n_equal = 0
+            for j in range(max(i - window + 1, 0), i + 1):
+                other = x[j]
+                if np.isnan(other):
+                    continue
+                if other == val:
+                    n_equal += 1
+                elif (other < val) == ascending:
+                    n_before += 1
+            rank = n_before + (n_equal + 1) / 2
+            out[i, col] = rank / nobs if pct else rank
+
+
+def rolling_rank(values, window, min_periods=None, ascending=True, pct=False):
+    """
+    当前值在滚动窗口内的排名，相同的值取平均排名，和 pandas rolling(window, min_periods).rank() 一致
+    计算复杂度为 O(数据长度 x 窗口长度)，适合因子中常用的短窗口
+    """
+    return _apply(_roll_rank, values, window, _get_min_periods(window, min_periods), ascending, pct)
+
+
+# ====================================================================================================
+# EWMA
+# ====================================================================================================
+@nb.njit(cache=True)
+def _ewm_mean(values, alpha, min_periods, adjust, ignore_na, out):
+    n_rows, n_cols = values.shape
+    old_wt_factor = 1.0 - alpha
+    new_wt = 1.0 if adjust else alpha
+    for col in range(n_cols):
+        x = values[:, col]
+        if n_rows == 0:
+            continue
+        weighted = x[0]
+        nobs = 0 if np.isnan(weighted) else 1
+        out[0, col] = weighted if nobs >= min_periods else np.nan
+        old_wt = 1.0
+        for i in range(1, n_rows):
+            cur = x[i]
+            is_observation = not np.isnan(cur)
+            if is_observation:
+                nobs += 1
+            if not np.isnan(weighted):
+                if is_observation or not ignore_na:
+                    old_wt *= old_wt_factor
+                    if is_observation:
+                        # 避免常数序列产生浮点误差
+                        if weighted != cur:
+                            weighted = old_wt * weighted + new_wt * cur
+                            weighted /= old_wt + new_wt
+                        if adjust:
+                            old_wt += new_wt
+                        else:
+                            old_wt = 1.0
+            elif is_observation:
+                weighted = cur
+            out[i, col] = weighted if nobs >= min_periods else np.nan
+
+
+def ewm_mean(values, span=None, alpha=None, min_periods=0, adjust=True, ignore_na=False):
+    """
+    指数加权移动平均，和 pandas ewm(span / alpha, min_periods, adjust, ignore_na).mean() 一致
+    :param span: 跨度，alpha = 2 / (span + 1)
+    :param alpha: 平滑系数，和 span 二选一
+    """
+    if (span is None) == (alpha is None):
+        raise ValueError("span 和 alpha 必须指定其中一个")
+    if alpha is None:
+        if span < 1:
+            raise ValueError(f"span 必须大于等于1：{span}")
+        alpha = 2.0 / (span + 1.0)
+    if not 0 < alpha <= 1:
+        raise ValueError(f"alpha 必须在 (0, 1] 之间：{alpha}")
+    # pandas 先换算成 com，再换算回 alpha，这里保持一样的计算方式
+    com = 1.0 / alpha - 1.0
+    return _apply(_ewm_mean, values, 1.0 / (1.0 + com), max(min_periods, 1), adjust, ignore_na)
+
+
+# ====================================================================================================
+# 线性回归斜率
+# ====================================================================================================
+@nb.njit(cache=True)
+def _roll_slope(values, window, min_periods, out):
+    n_rows, n_cols = values.shape
+    for col in range(n_cols):
+        x = values[:, col]
+        for i in range(n_rows):
+            start = max(i - window + 1, 0)
+            # 以窗口内的位置作为自变量，空值不参与回归
+            nobs = 0
+            sum_t = 0.0
+            sum_y = 0.0
+            for j in range(start, i + 1):
+                if not np.isnan(x[j]):
+                    nobs += 1
+                    sum_t += j - start
+                    sum_y += x[j]
+            if nobs < min_periods or nobs < 2:
+                out[i, col] = np.nan
+                continue
+            mean_t = sum_t / nobs
+            mean_y = sum_y / nobs
+            cov = 0.0
+            var = 0.0
+            for j in range(start, i + 1):
+                if not np.isnan(x[j]):
+                    dt = j - start - mean_t
+                    cov += dt * (x[j] - mean_y)
+                    var += dt * dt
+            out[i, col] = cov / var
+
+
+def rolling_slope(values, window, min_periods=None):
+    """
+    滚动线性回归斜率：以窗口内的位置（0, 1, 2, ...）为自变量，对数值做最小二乘回归，返回斜率
+    窗口内有效数据少于2个时结果为空值，计算复杂度为 O(数据长度 x 窗口长度)
+    """
+    return _apply(_roll_slope, values, window, _get_min_periods(window, min_periods))
+
@@ -0,0 +1,109 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+from numba import njit
+
+# 按交易日期分组选股：每个交易日选出因子值最小（或最大）的若干只股票，并平均分配资金
+#
+# 结果和 groupby('交易日期').rank(method='min') 之后按排名筛选完全一致：
+# 排名 <= N 等价于 因子值 <= 第N小的因子值，所以每个交易日只需要用 np.partition 找到第N小的因子值，
+# 再对选中的少量股票排序计算排名，不需要对全部股票排序
+
+
+@njit(cache=True)
+def _select_top_k(values, order, bounds, select_num, by_pct):
+    """
+    每个交易日按因子值从小到大选股，因子值为空值的股票不参与排名
+
+    :param values: 因子值
+    :param order: 按交易日期排列的行号，每个交易日是连续的一段
+    :param bounds: 每个交易日在 order 中的起止位置
+    :param select_num: 选股数量，或者选股比例
+    :param by_pct: True 表示 select_num 是比例，选股数量为 当天股票数量 * select_num
+    :return: 选中的行号、排名（method='min'）、目标资金占比，按交易日期和排名排序，排名相同的保持原来的顺序
+    """
+    n = len(order)
+    out_index = np.empty(n, dtype=np.int64)
+    out_rank = np.empty(n, dtype=np.float64)
+    out_weight = np.empty(n, dtype=np.float64)
+    buf = np.empty(n, dtype=np.float64)
+    n_out = 0
+    for g in range(len(bounds) - 1):
+        start, end = bounds[g], bounds[g + 1]
+        # 排名 <= limit 的股票入选，排名是整数，和 pandas 一样用浮点数计算 股票数量 * 比例 之后向下取整
+        limit = np.floor((end - start) * select_num) if by_pct else np.floor(select_num)
+        if limit < 1:
+            continue
+
+        m = 0
+        for k in range(start, end):
+            val = values[order[k]]
+            if val == val:
+                buf[m] = val
+                m += 1
+        if m == 0:
+            continue
+
+        # 第 limit 小的因子值，因子值不超过它的股票排名都不超过 limit
+        if limit < m:
+            threshold = np.partition(buf[:m], int(limit) - 1)[int(limit) - 1]
+        else:
+            threshold = np.inf
+
+        s = 0
+        for k in range(start, end):
+            i = order[k]
+            val = values[i]
+            if val == val and val <= threshold:
+                out_index[n_out + s] = i
+                buf[s] = val
+                s += 1
+
+        # 入选的股票按因子值稳定排序，排名为第一个相同因子值的位置
+        sorted_pos = np.argsort(buf[:s], kind='mergesort')
+        selected = out_index[n_out:n_out + s].copy()
+        rank = 1
+        for j in range(s):
+            pos = sorted_pos[j]
+            if j > 0 and buf[pos] != buf[sorted_pos[j - 1]]:
+                rank = j + 1
+            out_index[n_out + j] = selected[pos]
+            out_rank[n_out + j] = rank
+            out_weight[n_out + j] = 1 / s
+        n_out += s
+    return out_index[:n_out], out_rank[:n_out], out_weight[:n_out]
+
+
+def select_top_k(dates, values, select_num: float | int, ascending: bool = True):
+    """
+    每个交易日选出因子值排名靠前的股票
+    结果和 groupby('交易日期')[因子].rank(method='min') 之后筛选 排名 <= 选股数量（或者 当天股票数量 * 选股比例）一致，
+    但不需要对全部股票分组排名和排序
+
+    参数:
+    dates (Series | ndarray): 每一行的交易日期
+    values (Series | ndarray): 每一行的因子值，空值不参与排名
+    select_num (float | int): 选股数量，小于1时表示选股比例（当天股票数量 * select_num，包括因子值为空的股票）
+    ascending (bool): True 表示因子值越小排名越靠前
+
+    返回:
+    ndarray: 选中的行号（从0开始的位置），按交易日期和排名排序，排名相同的保持原来的顺序
+    ndarray: 排名，和 rank(method='min') 一致
+    ndarray: 目标资金占比，每个交易日选中的股票平均分配
+    """
+    codes, uniques = pd.factorize(np.asarray(dates), sort=True)
+    if len(codes) == 0 or np.all(codes[1:] >= codes[:-1]):
+        order = np.arange(len(codes), dtype=np.int64)
+        sorted_codes = codes
+    else:
+        order = np.argsort(codes, kind='stable').astype(np.int64)
+        sorted_codes = codes[order]
+    bounds = np.searchsorted(sorted_codes, np.arange(len(uniques) + 1), side='left').astype(np.int64)
+
+    values = np.asarray(values, dtype=np.float64)
+    if not ascending:
+        values = -values
+    by_pct = int(select_num) == 0
+    return _select_top_k(values, order, bounds, float(select_num), by_pct)
@@ -52,6 +52,11 @@ class Simulator:
 
     last_prices: nb.float64[:]  # 最新价格
 
+    # 稀疏持仓：只记录有仓位的股票序号（从小到大），每根K线只需要处理持仓的股票，而不是全部股票
+    # 价格和仓位价值仍然按照股票序号存储，没有持仓的股票仓位价值为0，最新价格只对持仓股票有意义
+    held_idx: nb.int64[:]  # 持仓股票的序号
+    n_held: int  # 持仓股票的数量
+
     def __init__(self, init_capital, commission_rate, stamp_tax_rate, init_pos_values):
         """
         初始化
@@ -72,9 +77,31 @@ class Simulator:
         # 前收盘价
         self.last_prices = np.zeros(n, dtype=np.float64)
 
+        # 持仓股票
+        self.held_idx = np.zeros(n, dtype=np.int64)
+        self.n_held = 0
+        self.update_held()
+
+    def update_held(self):
+        """
+        根据仓位价值，重新整理持仓股票的序号。只在调仓时调用
+        """
+        n_held = 0
+        for idx_sym in range(len(self.pos_values)):
+            if self.pos_values[idx_sym] != 0:
+                self.held_idx[n_held] = idx_sym
+                n_held += 1
+        self.n_held = n_held
+
     def fill_last_prices(self, prices):
-        mask = np.logical_not(np.isnan(prices))
-        self.last_prices[mask] = prices[mask]
+        """
+        更新持仓股票的最新价格，价格为空时保留之前的价格
+        :param prices: 当前价格
+        """
+        for k in range(self.n_held):
+            idx_sym = self.held_idx[k]
+            if not np.isnan(prices[idx_sym]):
+                self.last_prices[idx_sym] = prices[idx_sym]
 
     def settle_pos_values(self, prices):
         """
@@ -82,20 +109,23 @@ class Simulator:
         :param prices: 当前价格
         :return:
         """
-
-        mask = np.logical_and(self.pos_values > 1e-6, np.logical_not(np.isnan(prices)))
-
-        self.pos_values[mask] *= prices[mask] / self.last_prices[mask]
+        for k in range(self.n_held):
+            idx_sym = self.held_idx[k]
+            if self.pos_values[idx_sym] > 1e-6 and not np.isnan(prices[idx_sym]):
+                self.pos_values[idx_sym] *= prices[idx_sym] / self.last_prices[idx_sym]
 
     def get_pos_value(self):
-        return np.sum(self.pos_values)
+        pos_value = 0.0
+        for k in range(self.n_held):
+            pos_value += self.pos_values[self.held_idx[k]]
+        return pos_value
 
     def sell_all(self, exec_prices):
         # 根据调仓价和前最新价（开盘价），结算当前仓位价值
         self.settle_pos_values(exec_prices)
 
         # 卖出则卖出所有
-        pos_values_total = np.sum(self.pos_values)
+        pos_values_total = self.get_pos_value()
 
         # 印花税（仅卖出时收取）
         stamp_tax = pos_values_total * self.stamp_tax_rate
@@ -107,10 +137,9 @@ class Simulator:
         self.cash += pos_values_total - stamp_tax - commission
 
         # 仓位清空
-        self.pos_values[:] = 0
-
-        # 最新价为调仓价
-        self.fill_last_prices(exec_prices)
+        for k in range(self.n_held):
+            self.pos_values[self.held_idx[k]] = 0
+        self.n_held = 0
 
         # 返回印花税，和佣金
         return stamp_tax, commission
@@ -126,17 +155,19 @@ class Simulator:
         # 根据调仓价和前最新价（开盘价），结算当前仓位价值
         self.settle_pos_values(exec_prices)
 
-        # commission = 0.
-
         # 买入仓位价值
-        mask = target_pos > 0
-        buy_values = exec_prices[mask] * target_pos[mask]
-        buy_values_total = np.sum(buy_values)
-
-        self.pos_values[mask] = buy_values
+        buy_values_total = 0.0
+        for idx_sym in range(len(target_pos)):
+            if target_pos[idx_sym] > 0:
+                buy_value = exec_prices[idx_sym] * target_pos[idx_sym]
+                buy_values_total += buy_value
+                self.pos_values[idx_sym] = buy_value
+        self.update_held()
 
         # 券商佣金
-        commission = np.sum(self.pos_values * self.commission_rate)
+        commission = 0.0
+        for k in range(self.n_held):
+            commission += self.pos_values[self.held_idx[k]] * self.commission_rate
 
         # 账户现金扣除买入仓位价值和佣金
         self.cash -= buy_values_total + commission
@@ -146,3 +177,50 @@ class Simulator:
 
         # 返回和佣金
         return commission
+
+    def trade_delta(self, exec_prices, delta_pos):
+        """
+        差额调仓：只买卖当前持仓和目标持仓之间的差额，不变的持仓不产生交易
+        :param exec_prices: 执行价格
+        :param delta_pos:   需要买卖的股数，正数买入，负数卖出
+        :return:            印花税、券商佣金
+        """
+
+        # 根据调仓价和前最新价（开盘价），结算当前仓位价值
+        self.settle_pos_values(exec_prices)
+
+        sell_values_total = 0.0
+        buy_values_total = 0.0
+        for idx_sym in range(len(delta_pos)):
+            if delta_pos[idx_sym] == 0:
+                continue
+
+            trade_value = exec_prices[idx_sym] * delta_pos[idx_sym]
+            new_value = self.pos_values[idx_sym] + trade_value
+            if trade_value < 0:
+                if new_value < 0.01:
+                    # 剩余不到 1 分钱，视为清仓
+                    sell_values_total += self.pos_values[idx_sym]
+                    self.pos_values[idx_sym] = 0
+                else:
+                    sell_values_total -= trade_value
+                    self.pos_values[idx_sym] = new_value
+            else:
+                buy_values_total += trade_value
+                self.pos_values[idx_sym] = new_value
+        self.update_held()
+
+        # 印花税（仅卖出时收取）
+        stamp_tax = sell_values_total * self.stamp_tax_rate
+
+        # 券商佣金，买卖双向收取
+        commission = (sell_values_total + buy_values_total) * self.commission_rate
+
+        # 卖出所得扣除印花税和佣金，扣除买入仓位价值
+        self.cash += sell_values_total - buy_values_total - stamp_tax - commission
+
+        # 最新价为调仓价
+        self.fill_last_prices(exec_prices)
+
+        # 返回印花税，和佣金
+        return stamp_tax, commission
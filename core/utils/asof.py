@@ -0,0 +1,45 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+
+# 按日期对齐两张表，用于把财务数据、指数数据等按日期对齐到K线数据上
+#
+# 只需要一次排序和一次二分查找（searchsorted），代替 pd.merge / pd.merge_asof，并且右表不需要预先排序
+
+
+def asof_index(left_dates, right_dates, exact=False) -> np.ndarray:
+    """
+    对左表的每一行，在右表中查找日期不晚于左表日期的最后一行，和 merge_asof(direction='backward') 一致
+    :param left_dates: 左表的日期
+    :param right_dates: 右表的日期，不能重复
+    :param exact: True 表示只查找日期完全相同的行，和 pd.merge 一致
+    :return: 右表的行号（按右表原来的顺序），没有找到时为-1
+    """
+    left_dates = pd.DatetimeIndex(left_dates).as_unit('ns').asi8
+    right_dates = pd.DatetimeIndex(right_dates).as_unit('ns').asi8
+    if len(right_dates) == 0:
+        return np.full(len(left_dates), -1, dtype=np.int64)
+
+    order = np.argsort(right_dates, kind='stable')
+    right_sorted = right_dates[order]
+    if len(right_sorted) > 1 and (np.diff(right_sorted) == 0).any():
+        raise ValueError("右表中的日期不能重复")
+
+    pos = np.searchsorted(right_sorted, left_dates, side='right') - 1
+    found = pos >= 0
+    pos = np.where(found, pos, 0)
+    if exact:
+        found &= right_sorted[pos] == left_dates
+    return np.where(found, order[pos], -1)
+
+
+def take_rows(df: pd.DataFrame, index: np.ndarray) -> pd.DataFrame:
+    """
+    按行号取出数据，行号为-1时整行为空值，数据类型的变化和 pd.merge 缺少对应行时一致（比如整数变为浮点数）
+    :param df: 数据
+    :param index: 行号，asof_index 的结果
+    :return: 和 index 逐行对应的数据，索引为 0, 1, 2, ...
+    """
+    return df.reset_index(drop=True).reindex(index).reset_index(drop=True)
@@ -1,10 +1,14 @@
 """
 未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
 """
+import hashlib
 import importlib
 
+import numpy as np
 import pandas as pd
 
+from core.utils.intermediate import IntermediateGraph, Intermediates
+
 
 class FactorInterface:
     """
@@ -13,6 +17,21 @@ class FactorInterface:
     # 财务因子列：此列表用于存储财务因子相关的列名称
     fin_cols = []  # 财务因子列，配置后系统会自动加载对应的财务数据
 
+    # 自定义的中间结果，可选配置：{名称: (依赖的列或中间结果, 计算函数)}，详见 core/utils/intermediate.py
+    intermediate_funcs = {}
+
+    @staticmethod
+    def get_intermediates(param=None) -> list:
+        """
+        声明因子计算需要用到的中间结果，可选实现。
+        计算因子之前，会按依赖顺序一次性算好全部因子声明的中间结果，相同的中间结果每个股票只计算一次，
+        因子中通过 kwargs['intermediates'][名称] 获取，比如成交额缩量因子和成交额缩波因子共用 成交额 的滚动计算。
+
+        :param param: 因子参数。
+        :return: 中间结果名称的列表，比如 ['成交额_mean_5', '成交额_mean_20']。
+        """
+        return []
+
     @staticmethod
     def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
         """
@@ -28,6 +47,7 @@ class FactorInterface:
         :param kwargs: 其他关键字参数，包括：
             - col_name: 新计算的因子列名。
             - fin_data: 财务数据字典，格式为 {'财务数据': fin_df, '原始财务数据': raw_fin_df}，其中fin_df为处理后的财务数据，raw_fin_df为原始数据，后者可用于某些因子的自定义计算。
+            - intermediates: Intermediates，当前股票的中间结果，包含`get_intermediates`中声明的全部中间结果。
             - 其他参数：根据具体需求传入的其他因子参数。
         :return: tuple
             - pd.DataFrame: 包含新计算的因子列，与输入的df具有相同的索引。
@@ -63,13 +83,99 @@ class FactorInterface:
         # 我们只返回因子的列信息，以及周期转换时候因子列的聚合方式
         return df[[col_name]], agg_dict
 
-    def add_factors(self, df: pd.DataFrame, params=(), **kwargs) -> (pd.DataFrame, dict):
+    @staticmethod
+    def add_factors(df: pd.DataFrame, params=(), **kwargs) -> (pd.DataFrame, dict):
+        """
+        批量计算多个参数下的因子数值，可选实现。
+        因子文件中定义了`add_factors`时，计算因子会一次传入全部参数，否则逐个参数调用`add_factor`。
+        多个参数共用的中间结果（比如复权收盘价、换手率）只需要计算一次，也只需要复制一次K线数据。
+
+        :param df: pd.DataFrame，包含单只股票的K线数据，和`add_factor`相同。
+        :param params: 因子参数的列表。
+        :param kwargs: 其他关键字参数，包括：
+            - col_names: 因子列名的列表，和params一一对应。
+            - fin_data: 财务数据字典，和`add_factor`相同。
+            - intermediates: 当前股票的中间结果，和`add_factor`相同。
+        :return: tuple
+            - pd.DataFrame: 包含全部参数的因子列，与输入的df具有相同的索引。
+            - dict: 全部因子列的聚合方式字典。
+
+        注意事项：
+        - 批量计算的结果需要和逐个调用`add_factor`的结果完全一致。
         """
-        批量计算多个参数下的因子数值
+        # 默认实现：逐个参数调用add_factor，仅用于说明接口的含义
+        factor_df = pd.DataFrame(index=df.index)
+        agg_dict = {}
+        for param, col_name in zip(params, kwargs['col_names']):
+            param_df, param_agg_dict = FactorInterface.add_factor(df, param, **{**kwargs, 'col_name': col_name})
+            factor_df[col_name] = param_df[col_name]
+            agg_dict.update(param_agg_dict)
+        return factor_df, agg_dict
+
+    @staticmethod
+    def add_factor_panel(panel: "FactorPanel", param=None, **kwargs) -> (pd.DataFrame, dict):
+        """
+        截面因子，可选实现。基于全市场的 (交易日期 x 股票代码) 宽表一次计算全部股票的因子数值。
+        因子文件中定义了`add_factor_panel`时，计算因子会优先使用这个函数，结果会转换回每个股票的K线数据，
+        再和其他因子一样进行周期转换，可以和按股票计算的因子混合使用。
+        适合滚动窗口类的因子，比如均值、标准差、涨跌幅，不适合依赖财务数据的因子。
+
+        :param panel: FactorPanel，panel['成交额'] 返回成交额的宽表，股票没有K线的交易日为空值，
+                      panel['成交额_mean_20'] 返回中间结果的宽表。
+        :param param: 因子计算所需的参数。
+        :param kwargs: 其他关键字参数，包括：
+            - col_name: 新计算的因子列名。
+        :return: tuple
+            - pd.DataFrame: 因子数值的宽表，index为交易日期，columns为股票代码，数值会转换为float64。
+            - dict: 聚合方式字典。
+
+        注意事项：
+        - 每个股票的结果需要和按股票计算（`add_factor`）的结果一致。
+        - 宽表中每个股票在上市之前、退市之后都是空值，滚动计算时需要注意最小周期数（min_periods）。
         """
         raise NotImplementedError
 
 
+class FactorPanel:
+    """
+    全市场K线数据的宽表，用于截面因子（add_factor_panel）的计算
+    panel['成交额'] 返回 (交易日期 x 股票代码) 的DataFrame，股票在某个交易日没有K线时为空值，
+    每一列只在第一次访问时透视，之后直接使用缓存
+    panel['成交额_mean_20'] 返回中间结果的宽表，同样只计算一次
+    """
+
+    def __init__(self, candle_df: pd.DataFrame, graph: IntermediateGraph = None):
+        """
+        :param candle_df: 全部股票的K线数据（长表），必须包括交易日期和股票代码
+        :param graph: 中间结果的依赖关系，包含截面因子中的自定义中间结果
+        """
+        self.candle_df = candle_df
+        self.row_idx, dates = pd.factorize(candle_df['交易日期'], sort=True)
+        self.col_idx, symbols = pd.factorize(candle_df['股票代码'], sort=True)
+        self.dates = pd.DatetimeIndex(dates, name='交易日期')
+        self.symbols = pd.Index(symbols, name='股票代码')
+        self._cache = {}
+        self.intermediates = Intermediates(self, graph)
+
+    def __getitem__(self, col_name) -> pd.DataFrame:
+        if self.intermediates.graph.get_recipe(col_name) is not None:
+            return self.intermediates[col_name]
+        if col_name not in self._cache:
+            values = np.full((len(self.dates), len(self.symbols)), np.nan)
+            values[self.row_idx, self.col_idx] = self.candle_df[col_name].to_numpy(dtype=np.float64)
+            self._cache[col_name] = pd.DataFrame(values, index=self.dates, columns=self.symbols)
+        return self._cache[col_name]
+
+    def to_long(self, wide_df: pd.DataFrame) -> np.ndarray:
+        """
+        把宽表转换回K线数据（长表）的行顺序
+        :param wide_df: 宽表，index为交易日期，columns为股票代码
+        :return: 和K线数据逐行对应的数值
+        """
+        values = wide_df.reindex(index=self.dates, columns=self.symbols).to_numpy(dtype=np.float64)
+        return values[self.row_idx, self.col_idx]
+
+
 class FactorHub:
     _factor_cache = {}
 
@@ -106,3 +212,12 @@ class FactorHub:
             raise ValueError(f"Factor {factor_name} not found.")
         except AttributeError:
             raise ValueError(f"Error accessing factor content in module {factor_name}.")
+
+    @staticmethod
+    def get_source_hash(factor_name) -> str:
+        """
+        因子文件源码的哈希，因子代码修改之后，缓存的因子计算结果会失效
+        """
+        factor_module = importlib.import_module(f"因子库.{factor_name}")
+        with open(factor_module.__file__, "rb") as f:
+            return hashlib.md5(f.read()).hexdigest()
@@ -0,0 +1,152 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import re
+from functools import partial
+from graphlib import CycleError, TopologicalSorter
+
+from core import rolling
+
+# 因子计算的中间结果，多个因子（或者同一个因子的多个参数）用到同一个中间结果时，每个股票只计算一次
+#
+# 中间结果有两种：
+# - 滚动窗口类，按名称自动识别，格式为 {数据列}_{计算方式}_{窗口长度}，或者 {数据列}_{计算方式}_{窗口长度}_{min_periods}，
+#   比如 成交额_mean_20、总市值_mean_20_1。数据列可以是K线数据中的列，也可以是另一个中间结果，比如 日换手率_mean_5
+# - 自定义类，由因子文件中的 intermediate_funcs 定义：{名称: (依赖的列或中间结果, 计算函数)}，
+#   计算函数按顺序接收依赖的数值，比如 {'日换手率': (('成交额', '流通市值'), lambda amount, mv: amount / mv)}
+#
+# 中间结果的数值和K线数据的形式一致：按股票计算时是 Series，截面因子（FactorPanel）中是宽表
+
+# 滚动窗口类中间结果的计算方式
+ROLLING_FUNCS = {
+    'sum': rolling.rolling_sum,
+    'mean': rolling.rolling_mean,
+    'std': rolling.rolling_std,
+    'var': rolling.rolling_var,
+    'min': rolling.rolling_min,
+    'max': rolling.rolling_max,
+    'rank': rolling.rolling_rank,
+    'zscore': rolling.rolling_zscore,
+    'slope': rolling.rolling_slope,
+    'ewm': lambda values, span, min_periods: rolling.ewm_mean(values, span=span, min_periods=min_periods or 0),
+}
+_ROLLING_NAME = re.compile(rf"^(?P<source>.+)_(?P<method>{'|'.join(ROLLING_FUNCS)})_(?P<window>\d+)(?:_(?P<min_periods>\d+))?$")
+
+
+def _call_rolling(method, window, min_periods, values):
+    return ROLLING_FUNCS[method](values, window, min_periods)
+
+
+def _recipe_key(recipe) -> tuple:
+    """
+    自定义中间结果的比较依据：依赖的列和计算函数的代码。
+    不同因子文件中的函数（比如 lambda）是不同的对象，只要依赖和代码相同，就认为是同一个中间结果
+    """
+    deps, func = recipe
+    code = getattr(func, '__code__', None)
+    if code is None:
+        # 不是 python 函数（比如 numpy 的函数），直接比较函数对象
+        return tuple(deps), func
+    return tuple(deps), code.co_code, code.co_consts, code.co_names
+
+
+class IntermediateGraph:
+    """
+    中间结果之间的依赖关系，按依赖顺序（拓扑排序）确定计算顺序
+    """
+
+    def __init__(self, custom_funcs: dict = None):
+        """
+        :param custom_funcs: 自定义的中间结果，{名称: (依赖的列或中间结果, 计算函数)}
+        """
+        self.custom_funcs = dict(custom_funcs or {})
+
+    @classmethod
+    def from_factors(cls, factor_files) -> "IntermediateGraph":
+        """
+        汇总因子文件中定义的自定义中间结果，多个因子文件可以定义相同的中间结果（依赖和计算代码都相同），
+        定义了同名但不同的中间结果时报错
+        :param factor_files: 因子文件（FactorHub.get_by_name 的结果）的列表
+        """
+        custom_funcs = {}
+        for factor_file in factor_files:
+            for name, recipe in getattr(factor_file, 'intermediate_funcs', {}).items():
+                if name in custom_funcs and _recipe_key(custom_funcs[name]) != _recipe_key(recipe):
+                    raise ValueError(f"中间结果 {name} 在多个因子文件中有不同的定义，请检查！")
+                custom_funcs[name] = recipe
+        return cls(custom_funcs)
+
+    def get_recipe(self, name):
+        """
+        获取中间结果的计算方式
+        :return: (依赖的列或中间结果, 计算函数)，K线数据中的列返回 None
+        """
+        if name in self.custom_funcs:
+            deps, func = self.custom_funcs[name]
+            return tuple(deps), func
+        matched = _ROLLING_NAME.match(name)
+        if matched is None:
+            return None
+        min_periods = matched['min_periods']
+        func = partial(_call_rolling, matched['method'], int(matched['window']),
+                       None if min_periods is None else int(min_periods))
+        return (matched['source'],), func
+
+    def get_order(self, names) -> list:
+        """
+        计算 names 中的中间结果（包括间接依赖的中间结果）所需要的计算顺序，依赖的中间结果排在前面
+        """
+        graph = {}
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name in graph:
+                continue
+            recipe = self.get_recipe(name)
+            deps = () if recipe is None else recipe[0]
+            graph[name] = deps
+            pending.extend(deps)
+        try:
+            order = list(TopologicalSorter(graph).static_order())
+        except CycleError as e:
+            raise ValueError(f"中间结果之间存在循环依赖：{e.args[1]}") from e
+        # K线数据中的列不需要计算
+        return [name for name in order if self.get_recipe(name) is not None]
+
+
+class Intermediates:
+    """
+    单次计算中的中间结果，计算过的结果会保存下来，之后直接使用
+    intermediates['成交额_mean_20'] 返回中间结果的数值，没有提前计算的中间结果会在第一次访问时计算
+    """
+
+    def __init__(self, source, graph: IntermediateGraph = None):
+        """
+        :param source: 数据来源，source[列名] 返回K线数据中的列，比如单个股票的K线数据，或者 FactorPanel
+        :param graph: 中间结果的依赖关系，None 表示只使用滚动窗口类的中间结果
+        """
+        self.source = source
+        self.graph = graph or IntermediateGraph()
+        self._cache = {}
+
+    def compute(self, names):
+        """
+        按依赖顺序计算全部中间结果
+        """
+        for name in self.graph.get_order(names):
+            if name not in self._cache:
+                deps, func = self.graph.get_recipe(name)
+                self._cache[name] = func(*[self._get(dep) for dep in deps])
+
+    def _get(self, name):
+        if name in self._cache:
+            return self._cache[name]
+        return self.source[name]
+
+    def __getitem__(self, name):
+        if name not in self._cache and self.graph.get_recipe(name) is not None:
+            self.compute([name])
+        return self._get(name)
+
+    def __contains__(self, name):
+        return name in self._cache
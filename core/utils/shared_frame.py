@@ -0,0 +1,178 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import pickle
+import struct
+from multiprocessing import shared_memory, util
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# 每一列数据在共享内存中的起始位置按64字节对齐
+_ALIGNMENT = 64
+# 共享内存的开头8个字节，记录列信息的长度
+_HEADER = struct.Struct("<Q")
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class SharedFrame:
+    """
+    保存在共享内存中的DataFrame，用于主进程和子进程之间传递大块的数据
+    主进程把DataFrame按列写入一块共享内存，子进程只需要拿到共享内存的名称（handle），
+    就可以直接读取需要的行，不需要把DataFrame序列化之后发送给每一个子进程，所有子进程共用同一份数据
+
+    数值、布尔、日期列直接保存原始数组；文本列和category列保存编码后的整数，取值列表和列信息一起保存，
+    文本列的缺失值读取出来统一为 NaN
+    """
+
+    # 当前进程中已经挂载的共享内存，按名称缓存，每个子进程只需要挂载一次
+    _attached: Dict[str, "SharedFrame"] = {}
+
+    def __init__(self, shm: shared_memory.SharedMemory, meta: dict, owner: bool):
+        self.shm = shm
+        self.meta = meta
+        self.owner = owner  # 创建共享内存的主进程负责释放
+
+    @classmethod
+    def publish(cls, df: pd.DataFrame) -> "SharedFrame":
+        """
+        把DataFrame写入共享内存，索引不会保存
+        :param df: 需要共享的数据
+        :return: SharedFrame，使用结束之后需要调用 close 释放
+        """
+        n_rows = len(df)
+        columns = []
+        arrays = []
+        for col_name in df.columns:
+            series = df[col_name]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                kind, extra = "category", series.cat.categories
+                values = series.cat.codes.to_numpy(dtype=np.int32)
+            elif isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufmM":
+                kind, extra = "array", None
+                values = series.to_numpy()
+            else:
+                # 文本等其他类型的列，编码成整数，缺失值编码为-1
+                codes, uniques = pd.factorize(series, use_na_sentinel=True)
+                kind, extra = "text", (np.asarray(uniques, dtype=object), series.dtype)
+                values = codes.astype(np.int32)
+            columns.append({"name": col_name, "kind": kind, "dtype": values.dtype, "extra": extra})
+            arrays.append(values)
+
+        # 列的起始位置相对于数据区，数据区紧跟在列信息之后
+        offset = 0
+        for col, values in zip(columns, arrays):
+            col["offset"] = offset
+            offset = _align(offset + values.nbytes)
+        meta = {"n_rows": n_rows, "columns": columns}
+        meta_bytes = pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)
+        data_start = _align(_HEADER.size + len(meta_bytes))
+
+        shm = shared_memory.SharedMemory(create=True, size=data_start + offset)
+        shm.buf[:_HEADER.size] = _HEADER.pack(len(meta_bytes))
+        shm.buf[_HEADER.size:_HEADER.size + len(meta_bytes)] = meta_bytes
+        for col, values in zip(columns, arrays):
+            target = np.ndarray((n_rows,), dtype=values.dtype, buffer=shm.buf, offset=data_start + col["offset"])
+            target[:] = values
+            del target  # 释放对共享内存的引用，否则无法关闭
+        meta["data_start"] = data_start
+        return cls(shm, meta, owner=True)
+
+    @property
+    def handle(self) -> str:
+        """
+        共享内存的名称，传给子进程用于挂载
+        """
+        return self.shm.name
+
+    @classmethod
+    def attach(cls, handle: str) -> "SharedFrame":
+        """
+        在子进程中挂载主进程发布的共享内存，同一个进程中重复挂载会直接返回缓存
+        :param handle: 共享内存的名称
+        :return: SharedFrame
+        """
+        if handle not in cls._attached:
+            shm = shared_memory.SharedMemory(name=handle)
+            (meta_size,) = _HEADER.unpack(bytes(shm.buf[:_HEADER.size]))
+            meta = pickle.loads(bytes(shm.buf[_HEADER.size:_HEADER.size + meta_size]))
+            meta["data_start"] = _align(_HEADER.size + meta_size)
+            cls._attached[handle] = cls(shm, meta, owner=False)
+        return cls._attached[handle]
+
+    @classmethod
+    def detach(cls, handle: str):
+        """
+        关闭当前进程中挂载的共享内存，并从缓存中删除
+        to_frame(copy=False) 返回的数据直接引用共享内存，需要先释放这些数据，否则无法关闭
+        :param handle: 共享内存的名称
+        """
+        if handle in cls._attached:
+            cls._attached[handle].close()
+
+    @classmethod
+    def detach_all(cls):
+        """
+        关闭当前进程中挂载的全部共享内存
+        """
+        for handle in list(cls._attached):
+            cls.detach(handle)
+
+    @classmethod
+    def init_worker(cls):
+        """
+        子进程的初始化函数（ProcessPoolExecutor 的 initializer），子进程退出时关闭挂载的全部共享内存
+        """
+        util.Finalize(None, cls.detach_all, exitpriority=0)
+
+    def __len__(self):
+        return self.meta["n_rows"]
+
+    def to_frame(self, start: int = 0, length: Optional[int] = None, copy: bool = True) -> pd.DataFrame:
+        """
+        读取指定范围的行
+        :param start: 起始行
+        :param length: 行数，None表示读取到最后
+        :param copy: True 表示复制出来，可以随意修改；
+                     False 表示数值列直接引用共享内存（只读，修改会报错），不占用额外的内存
+        :return: DataFrame
+        """
+        n_rows = self.meta["n_rows"]
+        stop = n_rows if length is None else min(start + length, n_rows)
+        data = {}
+        for col in self.meta["columns"]:
+            values = np.ndarray((n_rows,), dtype=col["dtype"], buffer=self.shm.buf,
+                                offset=self.meta["data_start"] + col["offset"])
+            values = values[start:stop]
+            if copy:
+                values = values.copy()
+            else:
+                values.flags.writeable = False
+            if col["kind"] == "category":
+                values = pd.Categorical.from_codes(values, categories=col["extra"])
+            elif col["kind"] == "text":
+                uniques, dtype = col["extra"]
+                # 使用 Series 保持原来的数据类型，object 数组直接构造 DataFrame 时会被推断为 str
+                values = pd.Series(pd.Categorical.from_codes(values, categories=uniques)).astype(dtype)
+            data[col["name"]] = values
+        return pd.DataFrame(data, copy=False)
+
+    def close(self):
+        """
+        关闭共享内存，主进程关闭时会同时释放共享内存，子进程关闭时从挂载的缓存中删除
+        """
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        elif self._attached.get(self.shm.name) is self:
+            del self._attached[self.shm.name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,8 +1,10 @@
 """
 未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
 """
+import hashlib
 import time
 import warnings
+from collections import Counter
 from concurrent.futures.process import ProcessPoolExecutor
 from pathlib import Path
 
@@ -11,9 +13,12 @@ import pandas as pd
 from tqdm import tqdm
 
 from config import n_jobs
+from core.data_store import CandleStore, MarketPivot
+from core.fin_essentials import update_fin_store
 from core.model.backtest_config import load_config, BacktestConfig
-from core.utils.path_kit import get_file_path
-from core.market_essentials import cal_fuquan_price, cal_zdt_price, merge_with_index_data
+from core.model.type_def import NAME_DELIST, NAME_S, NAME_ST
+from core.utils.shared_frame import SharedFrame
+from core.market_essentials import cal_fuquan_price, cal_name_state, cal_zdt_price, merge_with_index_data
 
 # ====================================================================================================
 # ** 配置与初始化 **
@@ -40,6 +45,15 @@ STOCK_DATA_COLS = [
     "总市值",
 ]
 
+# 构建行情透视表所需的列
+MARKET_PIVOT_COLS = ["交易日期", "股票代码", "开盘价", "收盘价", "前收盘价"]
+
+# 预处理数据的格式版本，增加或者修改了预处理数据的列之后需要加1，旧版本的缓存会全量重建
+CANDLE_DATA_VERSION = 3
+
+# 涨跌停状态列，合并指数数据时停牌日期由前一日补全，类型会变成 object，统一转为 bool
+LIMIT_FLAG_COLS = ["一字涨停", "一字跌停", "开盘涨停", "开盘跌停"]
+
 
 def prepare_data(conf: BacktestConfig):
     start_time = time.time()  # 记录数据准备开始时间
@@ -78,57 +92,152 @@ def prepare_data(conf: BacktestConfig):
 
     # 2. 读取并处理指数数据，确保股票数据与指数数据的时间对齐
     index_data = conf.read_index_with_trading_date()
-    all_candle_data_dict = {}  # 用于存储所有股票的K线数据
-    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+    # 预处理后的数据由子进程直接写入按股票分区的缓存，不再通过进程间通信传回主进程
+    candle_store = CandleStore()
+    market_pivot = MarketPivot()
+
+    # 增量模式下，读取上次运行的清单。数据配置发生变化时，需要全量重建
+    data_settings = {
+        "version": CANDLE_DATA_VERSION,
+        "start_date": conf.start_date,
+        "end_date": conf.end_date,
+        "excluded_boards": sorted(conf.excluded_boards),
+    }
+    manifest = candle_store.load_manifest() if conf.incremental_data else {}
+    if manifest.get("settings") != data_settings or not market_pivot.exists():
+        if conf.incremental_data:
+            print("ℹ️ 增量缓存不存在或数据配置发生变化，全量准备数据...")
+        candle_store.clear()
+        manifest = {"settings": data_settings, "files": {}}
+    last_file_metas = manifest["files"]
+
+    # 指数数据只写入一次共享内存，子进程通过名称读取，不需要在每个任务中重复序列化
+    with SharedFrame.publish(index_data) as shared_index, ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=SharedFrame.init_worker
+    ) as executor:
         futures = []
         for code in stock_code_list:
             file_path = conf.stock_data_path / f'{code}.csv'
-            futures.append(executor.submit(pre_process, file_path, index_data))
+            futures.append(executor.submit(
+                pre_process_and_save, file_path, shared_index.handle, candle_store.folder, last_file_metas.get(code)
+            ))
 
-        for future in tqdm(futures, desc='预处理数据', total=len(futures)):
-            df = future.result()
-            if not df.empty:
-                code = df['股票代码'].iloc[0]
-                all_candle_data_dict[code] = df  # 仅存储非空数据
+        results = [future.result() for future in tqdm(futures, desc='预处理数据', total=len(futures))]
+
+    # 源文件被删除，或者板块被排除的股票，需要从缓存中删除
+    removed_codes = set(last_file_metas) - set(stock_code_list)
+    for code in removed_codes:
+        candle_store.remove(code)
+    manifest["files"] = {code: file_meta for code, _, file_meta in results}
 
     # 3. 缓存预处理后的数据
-    cache_path = get_file_path("data", "运行缓存", "股票预处理数据.pkl")
-    print("💾 保存到缓存文件...", cache_path)
-    pd.to_pickle(all_candle_data_dict, cache_path)
+    if last_file_metas:
+        mode_count = Counter(mode for _, mode, _ in results)
+        print(f"ℹ️ 增量更新：跳过{mode_count['skip']}，追加{mode_count['append']}，全量重算{mode_count['full']}")
+    print("💾 已保存到缓存目录...", candle_store.folder)
 
     # 4. 准备并缓存pivot透视表数据，用于后续回测
     print("ℹ️ 准备透视表数据...")
-    market_pivot_dict = make_market_pivot(all_candle_data_dict)
-    pivot_cache_path = get_file_path("data", "运行缓存", "全部股票行情pivot.pkl")
-    print("💾 保存到缓存文件...", pivot_cache_path)
-    pd.to_pickle(market_pivot_dict, pivot_cache_path)
+    if last_file_metas:
+        market_pivot_dict = update_market_pivot(
+            market_pivot.to_dict(), candle_store, results, last_file_metas, removed_codes
+        )
+    else:
+        market_pivot_dict = make_market_pivot(candle_store.read_all(columns=MARKET_PIVOT_COLS))
+    print("💾 保存到缓存目录...", market_pivot.folder)
+    market_pivot.save(market_pivot_dict)
+
+    # 清单最后保存，中途中断时，下次运行会基于上一次的清单重新处理
+    candle_store.save_manifest(manifest)
+
+    # 5. 策略用到财务因子时，把财务数据整理成时点表，计算因子时直接读取需要的列
+    if conf.fin_cols and conf.has_fin_data:
+        fin_store = update_fin_store(conf, n_jobs)
+        print("💾 财务数据已保存到缓存目录...", fin_store.folder)
 
     print(f"✅ 数据准备耗时：{time.time() - start_time} 秒\n")
 
 
-def pre_process(stock_file_path: str | Path, index_data: pd.DataFrame) -> pd.DataFrame:
+def read_stock_data(stock_file_path: str | Path) -> pd.DataFrame:
     """
-    对股票数据进行预处理，包括合并指数数据和计算未来交易日状态。
+    读取股票日线数据的原始csv文件
+    """
+    return pd.read_csv(stock_file_path, encoding='gbk', skiprows=1, parse_dates=['交易日期'], usecols=STOCK_DATA_COLS)
+
+
+def hash_stock_data(df: pd.DataFrame) -> str:
+    """
+    计算原始日线数据的内容哈希，用于判断历史数据是否被修改
+    """
+    return hashlib.md5(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def cal_basic_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    计算涨跌幅、换手率等关键指标、名称状态，以及后复权价格。这些计算都是整列的向量运算，开销很小
+    名称状态由股票名称一次算好，后续的涨跌停价格、未来交易日状态、选股过滤都直接按二进制位判断，不需要再对股票名称做字符串匹配
 
     参数:
-    stock_file_path (str | Path): 股票日线数据的路径
-    index_data (DataFrame): 指数数据
+    df (DataFrame): 原始日线数据
 
     返回:
-    df (DataFrame): 预处理后的数据
+    df (DataFrame): 增加了关键指标和复权价格的数据
     """
-    # 计算涨跌幅、换手率等关键指标
-    df = pd.read_csv(stock_file_path, encoding='gbk', skiprows=1, parse_dates=['交易日期'], usecols=STOCK_DATA_COLS)
     pct_change = df['收盘价'] / df['前收盘价'] - 1
     turnover_rate = df['成交额'] / df['流通市值']
     trading_days = df.index.astype('int') + 1
     avg_price = df['成交额'] / df['成交量']
 
     # 一次性赋值提高性能
-    df = df.assign(涨跌幅=pct_change, 换手率=turnover_rate, 上市至今交易天数=trading_days, 均价=avg_price)
+    df = df.assign(涨跌幅=pct_change, 换手率=turnover_rate, 上市至今交易天数=trading_days, 均价=avg_price,
+                   名称状态=cal_name_state(df['股票名称']))
+
+    # 复权价计算
+    return cal_fuquan_price(df, fuquan_type="后复权")
+
+
+def cal_next_day_state(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    计算未来交易日状态，最后一根K线的状态默认沿用前一日的数据
+    """
+    # 合并指数数据时，停牌日期的名称状态由前一日补全，类型变成了浮点数，这里转回 int8
+    name_state = df["名称状态"].to_numpy().astype("int8")
+    # 全量计算和增量追加得到的数据类型保持一致
+    df = df.astype({col: bool for col in LIMIT_FLAG_COLS})
+    df = df.assign(
+        名称状态=name_state,
+        下日_是否交易=df["是否交易"].astype("int8").shift(-1),
+        下日_一字涨停=df["一字涨停"].astype("int8").shift(-1),
+        下日_开盘涨停=df["开盘涨停"].astype("int8").shift(-1),
+        下日_是否ST=pd.Series((name_state & NAME_ST) != 0, index=df.index).astype("int8").shift(-1),
+        下日_是否S=pd.Series((name_state & NAME_S) != 0, index=df.index).astype("int8").shift(-1),
+        下日_是否退市=pd.Series((name_state & NAME_DELIST) != 0, index=df.index).astype("int8").shift(-1),
+    )
+
+    # 处理最后一根K线的数据：最后一根K线默认沿用前一日的数据
+    state_cols = ["下日_是否交易", "下日_是否ST", "下日_是否S", "下日_是否退市"]
+    df[state_cols] = df[state_cols].ffill()
+    return df
+
+
+def pre_process(stock_file_path: str | Path, index_data: pd.DataFrame, raw_df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    对股票数据进行预处理，包括合并指数数据和计算未来交易日状态。
+
+    参数:
+    stock_file_path (str | Path): 股票日线数据的路径
+    index_data (DataFrame): 指数数据
+    raw_df (DataFrame, optional): 已经读取好的原始日线数据，为空时从stock_file_path读取
+
+    返回:
+    df (DataFrame): 预处理后的数据
+    """
+    # 计算涨跌幅、换手率等关键指标
+    if raw_df is None:
+        raw_df = read_stock_data(stock_file_path)
 
     # 复权价计算及涨跌停价格计算
-    df = cal_fuquan_price(df, fuquan_type="后复权")
+    df = cal_basic_indicators(raw_df)
     df = cal_zdt_price(df)
 
     # 合并股票与指数数据，补全停牌日期等信息
@@ -140,21 +249,19 @@ def pre_process(stock_file_path: str | Path, index_data: pd.DataFrame) -> pd.Dat
         return pd.DataFrame(columns=STOCK_DATA_COLS)
 
     # 计算开盘买入涨跌幅和未来交易日状态
-    df = df.assign(
-        下日_是否交易=df["是否交易"].astype("int8").shift(-1),
-        下日_一字涨停=df["一字涨停"].astype("int8").shift(-1),
-        下日_开盘涨停=df["开盘涨停"].astype("int8").shift(-1),
-        下日_是否ST=df["股票名称"].str.contains("ST").astype("int8").shift(-1),
-        下日_是否S=df["股票名称"].str.contains("S").astype("int8").shift(-1),
-        下日_是否退市=df["股票名称"].str.contains("退").astype("int8").shift(-1),
-    )
-
-    # 处理最后一根K线的数据：最后一根K线默认沿用前一日的数据
-    state_cols = ["下日_是否交易", "下日_是否ST", "下日_是否S", "下日_是否退市"]
-    df[state_cols] = df[state_cols].ffill()
+    df = cal_next_day_state(df)
 
     # 清理退市数据，保留有效交易数据
-    if ("退" in df["股票名称"].iloc[-1]) or ("S" in df["股票名称"].iloc[-1]):
+    df = clear_delisted_data(df)
+
+    return df if not df.empty else pd.DataFrame(columns=STOCK_DATA_COLS)
+
+
+def clear_delisted_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    清理退市数据，保留有效交易数据
+    """
+    if df["名称状态"].iloc[-1] & (NAME_DELIST | NAME_S):
         if df["成交额"].iloc[-1] == 0 and np.all(df["成交额"] == 0):
             return pd.DataFrame(columns=STOCK_DATA_COLS)
         # @马超 同学于2024年11月20日提供退市逻辑优化处理。
@@ -165,8 +272,119 @@ def pre_process(stock_file_path: str | Path, index_data: pd.DataFrame) -> pd.Dat
         else:
             end_date = df_tmp.iloc[-1]["交易日期"]
         df = df[df["交易日期"] <= end_date]
+    return df
 
-    return df if not df.empty else pd.DataFrame(columns=STOCK_DATA_COLS)
+
+def append_pre_process(raw_df: pd.DataFrame, index_data: pd.DataFrame, cached_df: pd.DataFrame, cached_rows: int):
+    """
+    增量预处理：只对新增的K线计算涨跌停价格，并只合并缓存最后一天之后的指数日期。
+    后复权价格以第一根K线为基准，新增K线上的除权除息不会改变历史复权价；
+    历史数据被修改的情况，已经在调用前通过内容哈希排除。
+
+    参数:
+    raw_df (DataFrame): 最新的原始日线数据
+    index_data (DataFrame): 指数数据
+    cached_df (DataFrame): 上次预处理后缓存的数据
+    cached_rows (int): 上次预处理时原始日线数据的行数
+
+    返回:
+    df (DataFrame): 预处理后的数据
+    """
+    last_date = cached_df["交易日期"].iloc[-1]
+    # 只保留股票本身的列，指数列和衍生的状态列在合并之后重新生成
+    state_cols = [col for col in cached_df.columns if col.startswith("下日_")]
+    stock_cols = ["交易日期"] + [
+        col for col in cached_df.columns
+        if col not in index_data.columns and col != "是否交易" and col not in state_cols
+    ]
+
+    # 复权价需要完整的累乘，计算开销很小；涨跌停价格逐行计算，只处理新增的K线
+    new_df = cal_basic_indicators(raw_df).iloc[cached_rows:]
+    new_df = new_df[new_df["交易日期"] > last_date]
+
+    # 用缓存的最后一根K线作为前值，保证停牌日期的补全和全量计算一致
+    merge_df = cached_df.iloc[[-1]][stock_cols]
+    if not new_df.empty:
+        merge_df = pd.concat([merge_df, cal_zdt_price(new_df.copy())[stock_cols]], ignore_index=True)
+    new_df = merge_with_index_data(merge_df, index_data[index_data["交易日期"] >= last_date].copy(), fill_0_list=["换手率"])
+    new_df = new_df[new_df["交易日期"] > last_date]
+
+    # 合并之后，重新计算未来交易日状态，缓存的最后一根K线的状态也会被更新
+    df = pd.concat([cached_df.drop(columns=state_cols), new_df], ignore_index=True)
+    df = cal_next_day_state(df)
+
+    # 清理退市数据，缓存没有被截断过，所以和全量计算的结果一致
+    df = clear_delisted_data(df)
+    return df[cached_df.columns] if not df.empty else pd.DataFrame(columns=STOCK_DATA_COLS)
+
+
+def pre_process_and_save(stock_file_path: str | Path, index_handle: str, store_folder: Path,
+                         file_meta: dict = None):
+    """
+    在子进程中预处理单个股票，并直接写入按股票分区的缓存。
+    提供上次运行的源文件状态时，会尽量跳过或者只追加新增的K线
+
+    参数:
+    stock_file_path (str | Path): 股票日线数据的路径
+    index_handle (str): 指数数据所在共享内存的名称
+    store_folder (Path): 缓存目录
+    file_meta (dict, optional): 上次运行时的源文件状态，为空时全量计算
+
+    返回:
+    tuple: 股票代码，处理方式（skip、append、full），最新的源文件状态
+    """
+    stock_file_path = Path(stock_file_path)
+    code = stock_file_path.stem
+    store = CandleStore(store_folder)
+    index_data = SharedFrame.attach(index_handle).to_frame()
+    file_stat = stock_file_path.stat()
+    index_last_date = f"{index_data['交易日期'].max().date()}"
+
+    # 源文件没有变化，并且指数没有新的交易日（或者已经退市），直接跳过
+    if (
+        file_meta is not None
+        and file_meta["mtime_ns"] == file_stat.st_mtime_ns
+        and file_meta["size"] == file_stat.st_size
+        and (file_meta["frozen"] or file_meta["index_last_date"] == index_last_date)
+    ):
+        return code, "skip", file_meta
+
+    raw_df = read_stock_data(stock_file_path)
+    # 历史K线没有被修改，并且缓存没有因为退市被截断时，只追加新增的K线
+    if (
+        file_meta is not None
+        and not file_meta["truncated"]
+        and store.exists(code)
+        and len(raw_df) >= file_meta["rows"]
+        and hash_stock_data(raw_df.iloc[:file_meta["rows"]]) == file_meta["hash"]
+    ):
+        df, mode = append_pre_process(raw_df, index_data, store.read(code), file_meta["rows"]), "append"
+    else:
+        df, mode = pre_process(stock_file_path, index_data, raw_df=raw_df), "full"
+
+    if df.empty:
+        store.remove(code)
+        last_date = None
+    else:
+        store.save(code, df)
+        last_date = f"{df['交易日期'].iloc[-1].date()}"
+
+    # 数据为空，或者因为退市被截断，并且源文件没有最新的K线时，后续交易日不会再改变结果
+    truncated = last_date is None or last_date < index_last_date
+    raw_last_date = f"{raw_df['交易日期'].iloc[-1].date()}" if not raw_df.empty else None
+    frozen = last_date is None or (truncated and raw_last_date < index_last_date)
+
+    new_file_meta = {
+        "mtime_ns": file_stat.st_mtime_ns,
+        "size": file_stat.st_size,
+        "rows": len(raw_df),
+        "hash": hash_stock_data(raw_df),
+        "last_date": last_date,
+        "index_last_date": index_last_date,
+        "truncated": truncated,
+        "frozen": frozen,
+    }
+    return code, mode, new_file_meta
 
 
 def make_market_pivot(market_dict):
@@ -179,8 +397,7 @@ def make_market_pivot(market_dict):
     返回:
     dict: 包含开盘价、收盘价及前收盘价的透视表数据
     """
-    cols = ["交易日期", "股票代码", "开盘价", "收盘价", "前收盘价"]
-    df_list = [df[cols].dropna(subset="股票代码") for df in market_dict.values()]
+    df_list = [df[MARKET_PIVOT_COLS].dropna(subset="股票代码") for df in market_dict.values()]
     df_all_market = pd.concat(df_list, ignore_index=True)
     df_open = df_all_market.pivot(values="开盘价", index="交易日期", columns="股票代码")
     df_close = df_all_market.pivot(values="收盘价", index="交易日期", columns="股票代码")
@@ -189,6 +406,46 @@ def make_market_pivot(market_dict):
     return {"open": df_open, "close": df_close, "preclose": df_preclose}
 
 
+def update_market_pivot(market_pivot_dict, candle_store: CandleStore, results, last_file_metas, removed_codes):
+    """
+    增量更新市场数据的pivot透视表。追加的股票只合并新增的交易日，全量重算的股票整列替换
+
+    参数:
+    market_pivot_dict (dict): 上次缓存的透视表数据
+    candle_store (CandleStore): 预处理数据的缓存
+    results (list): 每个股票的处理结果，(股票代码, 处理方式, 源文件状态)
+    last_file_metas (dict): 上次运行时的源文件状态
+    removed_codes (set): 需要删除的股票代码
+
+    返回:
+    dict: 包含开盘价、收盘价及前收盘价的透视表数据
+    """
+    drop_codes = set(removed_codes)
+    new_market_dict = {}
+    for code, mode, file_meta in results:
+        if mode == "skip":
+            continue
+        if mode == "full":
+            drop_codes.add(code)
+        if file_meta["last_date"] is None:
+            continue
+        df = candle_store.read(code, columns=MARKET_PIVOT_COLS)
+        if mode == "append":
+            df = df[df["交易日期"] > pd.to_datetime(last_file_metas[code]["last_date"])]
+        new_market_dict[code] = df
+
+    new_pivot_dict = make_market_pivot(new_market_dict) if new_market_dict else {}
+    for key, df_pivot in market_pivot_dict.items():
+        df_pivot = df_pivot.drop(columns=[code for code in drop_codes if code in df_pivot.columns])
+        if key in new_pivot_dict:
+            df_pivot = new_pivot_dict[key].combine_first(df_pivot)
+        df_pivot = df_pivot.dropna(how="all").sort_index().sort_index(axis=1)
+        df_pivot.columns.name = "股票代码"
+        market_pivot_dict[key] = df_pivot
+
+    return market_pivot_dict
+
+
 if __name__ == "__main__":
     backtest_config = load_config()
     prepare_data(backtest_config)
@@ -1,20 +1,26 @@
 """
 未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
 """
+import hashlib
+import importlib
 import time
 import warnings
 from concurrent.futures import ProcessPoolExecutor
+from copy import copy
 from typing import Dict
 
 import pandas as pd
 from tqdm import tqdm
 
 from config import n_jobs
+from core.data_store import CandleStore, FactorStore, get_period_df_path
 from core.model.backtest_config import load_config, BacktestConfig
 from core.model.strategy_config import get_col_name
-from core.utils.factor_hub import FactorHub
+from core.utils.factor_hub import FactorHub, FactorPanel
+from core.utils.intermediate import IntermediateGraph, Intermediates
 from core.utils.path_kit import get_file_path
-from core.fin_essentials import merge_with_finance_data
+from core.utils.shared_frame import SharedFrame
+from core.fin_essentials import FinColumns, load_finance_data, update_fin_store
 from core.market_essentials import transfer_to_period_data
 
 # ====================================================================================================
@@ -28,13 +34,21 @@ pd.set_option("display.unicode.east_asian_width", True)
 
 # 因子计算之后，需要保存的行情数据
 FACTOR_COLS = [
-    '交易日期', '股票代码', '股票名称', '周频起始日', '月频起始日', '3D起始日', '5D起始日', '10D起始日',
+    '交易日期', '股票代码', '股票名称', '名称状态', '周频起始日', '月频起始日', '3D起始日', '5D起始日', '10D起始日',
     '上市至今交易天数', '复权因子', '开盘价', '最高价', '最低价', '收盘价', '成交额', '是否交易', '流通市值', '总市值',
     '下日_开盘涨停', '下日_是否ST', '下日_是否交易', '下日_是否退市'
 ]
 
+# 决定因子计算结果的模块：滚动计算、中间结果、截面因子、周期转换、财务数据的计算和合并。
+# 这些模块和 step2 本身的源码是因子缓存键的一部分，代码修改之后，缓存的因子计算结果会失效
+FACTOR_ENGINE_MODULES = [
+    'core.rolling', 'core.utils.intermediate', 'core.utils.factor_hub', 'core.period_agg', 'core.market_essentials',
+    'core.fin_essentials', 'core.utils.asof',
+]
+
 
-def cal_strategy_factors(conf: BacktestConfig, stock_code, candle_df, fin_data: Dict[str, pd.DataFrame] = None):
+def cal_strategy_factors(conf: BacktestConfig, stock_code, candle_df, fin_data: Dict[str, pd.DataFrame] = None,
+                         panel_agg_dict: dict = None, fin_columns: FinColumns = None):
     """
     计算指定股票的策略因子。
 
@@ -43,68 +57,229 @@ def cal_strategy_factors(conf: BacktestConfig, stock_code, candle_df, fin_data:
     stock_code (str): 股票代码
     candle_df (DataFrame): 股票的K线数据
     fin_data (dict): 财务数据
+    panel_agg_dict (dict): 已经在K线数据中计算好的截面因子列，及其周期转换规则
+    fin_columns (FinColumns): 按需合并的财务数据列，只合并到用到财务数据的因子的K线数据上
 
     返回:
-    DataFrame: 包含计算因子的K线数据
+    dict: 包含计算因子的K线数据，{列名: 数据列}，按交易日期排序。周期转换直接使用各列的数据，不再拼成日线的 DataFrame
     dict: 因子列的周期转换规则
     """
-    factor_series_dict = {}
     before_len = len(candle_df)
+
+    # 每个因子拿到的是K线数据的浅拷贝，所有因子共用同一份数据，不再复制整个DataFrame。依赖 pandas 的写时复制：
+    # - 因子可以添加新的列，或者整列替换已有的列，只会影响自己拿到的浅拷贝
+    # - 通过 .values / .to_numpy() 拿到的数组是只读的，直接修改会报错
+    # - 链式赋值（比如 df['收盘价'][0] = 1）不会生效，这里转成报错，避免因子计算结果悄悄出错
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.ChainedAssignmentError)
+        factor_series_dict, agg_dict = cal_factor_columns(
+            conf, stock_code, candle_df, fin_data, before_len, fin_columns
+        )
+
+    # 截面因子已经由主进程计算好，直接取出
+    for col_name, column_agg in (panel_agg_dict or {}).items():
+        factor_series_dict[col_name] = candle_df[col_name].values
+        agg_dict[col_name] = column_agg
+
+    kline_with_factor_dict = {
+        **{col_name: candle_df[col_name].array for col_name in FACTOR_COLS}, **factor_series_dict
+    }
+    # K线数据一般已经按交易日期排好序，只有乱序时才需要重新排列
+    if not candle_df['交易日期'].is_monotonic_increasing:
+        order = candle_df['交易日期'].to_numpy().argsort(kind='stable')
+        kline_with_factor_dict = {col_name: values[order] for col_name, values in kline_with_factor_dict.items()}
+    return kline_with_factor_dict, agg_dict
+
+
+def cal_factor_columns(conf: BacktestConfig, stock_code, candle_df, fin_data, before_len,
+                       fin_columns: FinColumns = None):
+    """
+    逐个因子计算因子列，因子文件支持批量计算时，一次计算全部参数
+    计算因子之前，先按依赖顺序算好全部因子声明的中间结果，所有因子共用
+    财务数据列只合并到声明了 fin_cols 的因子的K线数据上，其他因子拿到的K线数据不包含财务数据
+
+    返回:
+    dict: {因子列名: 因子数值}
+    dict: 因子列的周期转换规则
+    """
+    factor_series_dict = {}
     agg_dict = {}  # 用于数据周期转换的规则
 
+    graph, intermediate_names = get_factor_intermediates(conf.factor_params_dict)
+    intermediates = Intermediates(candle_df, graph)
+    intermediates.compute(intermediate_names)
+
     for factor_name, param_list in conf.factor_params_dict.items():
         factor_file = FactorHub.get_by_name(factor_name)
-        for param in param_list:
-            col_name = get_col_name(factor_name, param)
-            factor_df, column_dict = factor_file.add_factor(
-                candle_df.copy(), param, fin_data=fin_data, col_name=col_name
+        param_list = list(param_list)
+        col_names = [get_col_name(factor_name, param) for param in param_list]
+        if fin_columns is not None and factor_file.fin_cols:
+            factor_input = fin_columns.attach(candle_df, factor_file.fin_cols)
+        else:
+            factor_input = candle_df
+
+        if hasattr(factor_file, "add_factors"):
+            # 因子文件支持批量计算，一次计算全部参数
+            factor_df, column_dict = factor_file.add_factors(
+                factor_input.copy(deep=False), param_list, fin_data=fin_data, col_names=col_names,
+                intermediates=intermediates
             )
+            factor_dfs = [factor_df] * len(param_list)
+            agg_dict.update(column_dict)
+        else:
+            factor_dfs = []
+            for param, col_name in zip(param_list, col_names):
+                factor_df, column_dict = factor_file.add_factor(
+                    factor_input.copy(deep=False), param, fin_data=fin_data, col_name=col_name,
+                    intermediates=intermediates
+                )
+                factor_dfs.append(factor_df)
+                agg_dict.update(column_dict)
 
+        for param, col_name, factor_df in zip(param_list, col_names, factor_dfs):
             factor_series_dict[col_name] = factor_df[col_name].values
             # 检查因子计算是否出错
             if before_len != len(factor_series_dict[col_name]):
                 print(f"{stock_code}的{factor_name}因子({param}，{col_name})导致数据长度发生变化，请检查！")
                 raise Exception("因子计算出错，请避免在cal_factors中修改数据行数")
-            agg_dict.update(column_dict)
 
-    kline_with_factor_dict = {**{col_name: candle_df[col_name] for col_name in FACTOR_COLS}, **factor_series_dict}
-    kline_with_factor_df = pd.DataFrame(kline_with_factor_dict)
-    kline_with_factor_df.sort_values(by="交易日期", inplace=True)
-    return kline_with_factor_df, agg_dict
+    return factor_series_dict, agg_dict
+
+
+def get_factor_intermediates(factor_params_dict: dict):
+    """
+    汇总因子声明的中间结果
 
+    参数:
+    factor_params_dict (dict): {因子名: 参数集合}
 
-def process_by_stock(conf: BacktestConfig, stock_code: str, candle_df: pd.DataFrame):
-    # 导入财务数据，将个股数据与财务数据合并，并计算财务指标的衍生指标
+    返回:
+    IntermediateGraph: 中间结果的依赖关系
+    list: 全部因子声明的中间结果名称，重复的只保留一个
+    """
+    factor_files = [FactorHub.get_by_name(factor_name) for factor_name in factor_params_dict]
+    names = {}
+    for factor_file, param_list in zip(factor_files, factor_params_dict.values()):
+        if hasattr(factor_file, "get_intermediates"):
+            for param in param_list:
+                names.update(dict.fromkeys(factor_file.get_intermediates(param)))
+    return IntermediateGraph.from_factors(factor_files), list(names)
+
+
+def process_by_stock(conf: BacktestConfig, stock_code: str, panel_handle: str, offset: int, length: int,
+                     panel_agg_dict: dict = None, hold_period_names: list = None):
+    """
+    计算单个股票的因子，并转换为每个持仓周期的周期数据，日线因子只计算一次
+
+    返回:
+    dict: {持仓周期名称: 周期数据}
+    dict: 因子列的周期转换规则
+    """
+    # 全部股票的K线数据由主进程写入共享内存，子进程只读取当前股票所在的行，数值列直接引用共享内存（只读），不复制
+    candle_df = SharedFrame.attach(panel_handle).to_frame(offset, length, copy=False)
+
+    # 导入财务数据，财务数据列不直接合并到K线数据上，计算因子时按照因子的 fin_cols 按需合并
     if conf.fin_cols:  # 前面已经做了预检，这边只需要动态台南佳即可
-        # 分别为：个股数据、财务数据、原始财务数据（不抛弃废弃的报告数据）
-        candle_df, fin_df, raw_fin_df = merge_with_finance_data(conf, stock_code, candle_df)
+        # 分别为：按需合并的财务数据列、财务数据、原始财务数据（不抛弃废弃的报告数据）
+        fin_columns, fin_df, raw_fin_df = load_finance_data(conf, stock_code, candle_df)
         fin_data = {'财务数据': fin_df, '原始财务数据': raw_fin_df}
     else:
-        fin_data = None
+        fin_columns, fin_data = None, None
 
     # 计算因子，并且获得新的因子列的周期转换规则
-    factor_df, agg_dict = cal_strategy_factors(conf, stock_code, candle_df, fin_data=fin_data)
+    kline_with_factor_dict, agg_dict = cal_strategy_factors(
+        conf, stock_code, candle_df, fin_data=fin_data, panel_agg_dict=panel_agg_dict, fin_columns=fin_columns
+    )
+
+    # 对因子数据进行交易周期转换，直接按列聚合，不创建日线的 DataFrame
+    period_df_dict = {
+        hold_period_name: transfer_to_period_data(kline_with_factor_dict, hold_period_name, agg_dict)
+        for hold_period_name in (hold_period_names or [conf.strategy.hold_period_name])
+    }
+    return period_df_dict, agg_dict
+
+
+def cal_panel_factors(candle_panel: pd.DataFrame, panel_params_dict: dict):
+    """
+    基于全市场的宽表计算截面因子
+
+    参数:
+    candle_panel (DataFrame): 全部股票的K线数据（长表）
+    panel_params_dict (dict): 截面因子，{因子名: 参数集合}
+
+    返回:
+    dict: {因子列名: 和K线数据逐行对应的因子数值}
+    dict: 因子列的周期转换规则
+    """
+    if not panel_params_dict:
+        return {}, {}
+
+    s_time = time.time()
+    graph, intermediate_names = get_factor_intermediates(panel_params_dict)
+    panel = FactorPanel(candle_panel, graph)
+    panel.intermediates.compute(intermediate_names)
+    factor_dict = {}
+    agg_dict = {}
+    for factor_name, param_list in panel_params_dict.items():
+        factor_file = FactorHub.get_by_name(factor_name)
+        for param in param_list:
+            col_name = get_col_name(factor_name, param)
+            factor_df, column_dict = factor_file.add_factor_panel(panel, param, col_name=col_name)
+            factor_dict[col_name] = panel.to_long(factor_df)
+            agg_dict.update(column_dict)
+    print(f"ℹ️ 截面因子计算完成：{list(factor_dict)}，耗时：{time.time() - s_time:.2f}秒")
+    return factor_dict, agg_dict
+
 
-    # 对因子数据进行交易周期转换
-    period_df = transfer_to_period_data(factor_df, conf.strategy.hold_period_name, agg_dict)
-    return period_df, agg_dict
+def get_fin_data_version(conf: BacktestConfig) -> str:
+    """
+    财务数据的版本，根据财务数据文件的路径、大小和修改时间计算哈希
+    """
+    md5 = hashlib.md5()
+    for path in sorted(conf.fin_data_path.rglob("*.csv")):
+        stat = path.stat()
+        md5.update(f"{path.relative_to(conf.fin_data_path)}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+    return md5.hexdigest()
 
 
-def calculate_factors(conf: BacktestConfig):
+def get_engine_version() -> str:
+    """
+    因子计算代码的版本，根据 FACTOR_ENGINE_MODULES 和 step2 的源码计算哈希
+    """
+    md5 = hashlib.md5()
+    for path in [importlib.import_module(name).__file__ for name in FACTOR_ENGINE_MODULES] + [__file__]:
+        with open(path, "rb") as f:
+            md5.update(f.read())
+    return md5.hexdigest()
+
+
+def get_cache_key(*parts) -> str:
+    return hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def calculate_factors(conf: BacktestConfig, hold_period_names: list = None):
     """
     计算所有股票的因子，分为三步：
     1. 加载股票K线数据
     2. 计算每个股票的因子，并存储到列表
     3. 合并所有因子数据并存储
 
+    每个因子列单独缓存，缓存键包括因子文件源码的哈希、因子计算代码（FACTOR_ENGINE_MODULES）的版本、输入数据的版本和持仓周期，
+    只有新增的或者发生变化的因子需要重新计算，其他因子直接读取缓存
+
+    可以一次计算多个持仓周期：日线因子只计算一次，再分别转换为每个持仓周期的周期数据，
+    每个持仓周期的因子计算结果单独保存，参数遍历不同的持仓周期时，不需要重复计算因子
+
     参数:
     conf (BacktestConfig): 回测配置
+    hold_period_names (list, optional): 需要计算的持仓周期名称，比如 ['周频', '月频', '5D']，默认为策略的持仓周期
     """
     print("🌀 开始计算因子...")
     s_time = time.time()
+    hold_period_names = list(dict.fromkeys(hold_period_names or [conf.strategy.hold_period_name]))
 
     # ====================================================================================================
-    # 1. 加载股票K线数据
+    # 1. 配置信息检查
     # ====================================================================================================
     print("ℹ️ 配置信息检查...")
     if len(conf.fin_cols) > 0 and not conf.has_fin_data:
@@ -113,50 +288,192 @@ def calculate_factors(conf: BacktestConfig):
     elif len(conf.fin_cols) > 0:
         print(f"ℹ️ 检测到财务因子：{conf.fin_cols}")
 
-    print("ℹ️ 读取股票K线数据...")
-    candle_df_dict: Dict[str, pd.DataFrame] = pd.read_pickle(get_file_path("data", "运行缓存", "股票预处理数据.pkl"))
+    # ====================================================================================================
+    # 2. 检查因子缓存，只计算缓存键不一致的因子，任何一个持仓周期缺少缓存的因子，都在同一次计算中补齐
+    # ====================================================================================================
+    candle_store = CandleStore()
+    data_version = candle_store.data_version()
+    engine_version = get_engine_version()
+    fin_data_version = get_fin_data_version(conf) if conf.fin_cols else None
+
+    period_caches = {}  # {持仓周期名称: 缓存信息}
+    missing_params_dict = {}  # 需要重新计算的因子
+    missing_fin_cols = set()
+    for hold_period_name in hold_period_names:
+        factor_store = FactorStore(hold_period_name)
+        base_key = get_cache_key(engine_version, data_version, hold_period_name)
+        factor_keys = {}  # {因子列名: 缓存键}
+        cached_factors = {}  # {因子列名: (因子数值, 周期转换规则)}
+        for factor_name, param_list in conf.factor_params_dict.items():
+            factor_file = FactorHub.get_by_name(factor_name)
+            source_hash = FactorHub.get_source_hash(factor_name)
+            for param in param_list:
+                col_name = get_col_name(factor_name, param)
+                factor_keys[col_name] = get_cache_key(
+                    source_hash,
+                    engine_version,
+                    data_version,
+                    fin_data_version if factor_file.fin_cols else None,
+                    hold_period_name,
+                    col_name,
+                )
+                cached = factor_store.load(col_name, factor_keys[col_name])
+                if cached is not None:
+                    cached_factors[col_name] = cached
+                else:
+                    missing_params_dict.setdefault(factor_name, set()).add(param)
+                    missing_fin_cols.update(factor_file.fin_cols)
+        base_df = factor_store.load_base(base_key)
+        period_caches[hold_period_name] = (factor_store, base_key, factor_keys, cached_factors, base_df)
+        print(f"ℹ️ [{hold_period_name}] 因子缓存：命中{len(cached_factors)}个，"
+              f"需要计算{len(factor_keys) - len(cached_factors)}个")
+
+    # 缺少缓存的持仓周期，一起计算
+    missing_period_names = [
+        hold_period_name
+        for hold_period_name, (_, _, factor_keys, cached_factors, base_df) in period_caches.items()
+        if len(cached_factors) < len(factor_keys) or base_df is None
+    ]
+    if missing_period_names:
+        all_factors_df_dict, factor_col_info = calc_missing_factors(
+            conf, candle_store, missing_params_dict, missing_fin_cols, missing_period_names
+        )
+    else:
+        all_factors_df_dict, factor_col_info = {}, {}
 
     # ====================================================================================================
-    # 2. 计算因子并存储结果
+    # 3. 合并因子数据并存储
     # ====================================================================================================
-    all_factor_df_list = []  # 计算结果会存储在这个列表
+    for hold_period_name, (factor_store, base_key, factor_keys, cached_factors, base_df) in period_caches.items():
+        new_factors = {}
+        if hold_period_name in all_factors_df_dict:
+            all_factors_df = all_factors_df_dict.pop(hold_period_name)
+            # 保存新计算的因子列和行情基础列
+            factor_cols = [col for col in all_factors_df.columns if col in factor_keys]
+            for col_name in factor_cols:
+                factor_store.save(
+                    col_name,
+                    factor_keys[col_name],
+                    all_factors_df[col_name].to_numpy(),
+                    {col_name: factor_col_info[col_name]},
+                )
+            base_df = all_factors_df.drop(columns=factor_cols)
+            factor_store.save_base(base_key, base_df)
+            new_factors = {col_name: all_factors_df[col_name].to_numpy() for col_name in factor_cols}
+            del all_factors_df
+
+        factor_columns = {}
+        for col_name in factor_keys:
+            if col_name in new_factors:
+                factor_columns[col_name] = new_factors[col_name]
+            else:
+                values, agg_dict = cached_factors[col_name]
+                if len(values) != len(base_df):
+                    raise ValueError(f"因子缓存{col_name}的行数和行情数据不一致，请删除因子缓存目录：{factor_store.folder}")
+                factor_columns[col_name] = values
+                factor_col_info.update(agg_dict)
+        all_factors_df = pd.concat([base_df, pd.DataFrame(factor_columns, index=base_df.index)], axis=1)
+        print(f"[{hold_period_name}]")
+        print(all_factors_df)
+
+        print(f"💾 存储因子数据：{hold_period_name}...")
+        all_factors_df.to_pickle(get_period_df_path(hold_period_name))
+    pd.to_pickle(factor_col_info, get_file_path("data", "运行缓存", "策略因子列信息.pkl"))
+
+    print(f"✅ 因子计算完成，耗时：{time.time() - s_time:.2f}秒\n")
+
+
+def calc_missing_factors(conf: BacktestConfig, candle_store: CandleStore, factor_params_dict: dict, fin_cols: set,
+                         hold_period_names: list = None):
+    """
+    多进程计算需要重新计算的因子，同时完成行情数据的周期转换
+
+    参数:
+    conf (BacktestConfig): 回测配置
+    candle_store (CandleStore): 股票K线数据缓存
+    factor_params_dict (dict): 需要计算的因子，{因子名: 参数集合}
+    fin_cols (set): 需要计算的因子用到的财务数据列
+    hold_period_names (list, optional): 需要转换的持仓周期名称，默认为策略的持仓周期
+
+    返回:
+    dict: {持仓周期名称: 周期数据}，周期数据包括行情基础列和需要计算的因子列，按交易日期和股票代码排序
+    dict: 因子列的周期转换规则
+    """
+    hold_period_names = hold_period_names or [conf.strategy.hold_period_name]
+    # 定义了 add_factor_panel 的截面因子在主进程中基于全市场宽表计算，其他因子在子进程中按股票计算
+    panel_params_dict = {
+        factor_name: param_list
+        for factor_name, param_list in factor_params_dict.items()
+        if hasattr(FactorHub.get_by_name(factor_name), "add_factor_panel")
+    }
+
+    # 子进程只计算缺少缓存的因子，只加载这些因子需要的财务数据
+    task_conf = copy(conf)
+    task_conf.factor_params_dict = {
+        factor_name: param_list
+        for factor_name, param_list in factor_params_dict.items()
+        if factor_name not in panel_params_dict
+    }
+    task_conf.fin_cols = list(fin_cols)
+    if task_conf.fin_cols:
+        # 财务数据发生变化时，先更新财务数据的时点表，子进程中只读取需要的列
+        update_fin_store(conf, n_jobs)
+
+    print("ℹ️ 读取股票K线数据...")
+    candle_df_dict = candle_store.read_all()
+    # 记录每个股票在合并后的数据中的起始位置和行数
+    stock_slices = {}
+    offset = 0
+    for stock_code, candle_df in candle_df_dict.items():
+        stock_slices[stock_code] = (offset, len(candle_df))
+        offset += len(candle_df)
+    candle_panel = pd.concat(candle_df_dict.values(), ignore_index=True)
+    del candle_df_dict
+
+    # 截面因子的结果作为新的列加入K线数据，在子进程中和其他因子一起进行周期转换
+    panel_factor_dict, panel_agg_dict = cal_panel_factors(candle_panel, panel_params_dict)
+    candle_panel = candle_panel.assign(**panel_factor_dict)
+
+    all_factor_df_lists = {hold_period_name: [] for hold_period_name in hold_period_names}  # 计算结果会存储在这里
     factor_col_info = dict()
     # ** 注意 **
     # `tqdm`是一个显示为进度条的，非常有用的工具
     # 目前是串行模式，比较适合debug和测试。
     # 可以用 python自带的 concurrent.futures.ProcessPoolExecutor() 并行优化，速度可以提升超过5x
-    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+    # K线数据只写入一次共享内存，子进程通过名称和行范围读取，不需要序列化每个股票的数据
+    shared_panel = SharedFrame.publish(candle_panel)
+    del candle_panel
+    with shared_panel, ProcessPoolExecutor(max_workers=n_jobs, initializer=SharedFrame.init_worker) as executor:
         futures = []
-        for stock_code, candle_df in candle_df_dict.items():
-            futures.append(executor.submit(process_by_stock, conf, stock_code, candle_df))
+        for stock_code, (offset, length) in stock_slices.items():
+            futures.append(
+                executor.submit(
+                    process_by_stock, task_conf, stock_code, shared_panel.handle, offset, length, panel_agg_dict,
+                    hold_period_names
+                )
+            )
 
         for future in tqdm(futures, desc='计算因子', total=len(futures)):
-            period_df, agg_dict = future.result()
+            period_df_dict, agg_dict = future.result()
             factor_col_info.update(agg_dict)  # 更新因子列的周期转换规则
-            all_factor_df_list.append(period_df)
-
-    # ====================================================================================================
-    # 3. 合并因子数据并存储
-    # ====================================================================================================
-    all_factors_df = pd.concat(all_factor_df_list, ignore_index=True)
-
-    # 转化一下symbol的类型为category，可以加快因子计算速度，节省内存
-    # 并且排序和整理index
-    all_factors_df = (
-        all_factors_df.assign(
-            股票代码=all_factors_df["股票代码"].astype("category"),
-            股票名称=all_factors_df["股票名称"].astype("category"),
-        )
-        .sort_values(by=["交易日期", "股票代码"])
-        .reset_index(drop=True)
-    )
-    print(all_factors_df)
+            for hold_period_name, period_df in period_df_dict.items():
+                all_factor_df_lists[hold_period_name].append(period_df)
 
-    print("💾 存储因子数据...")
-    all_factors_df.to_pickle(get_file_path("data", "运行缓存", "因子计算结果.pkl"))
-    pd.to_pickle(factor_col_info, get_file_path("data", "运行缓存", "策略因子列信息.pkl"))
+    all_factors_df_dict = {}
+    for hold_period_name in hold_period_names:
+        all_factors_df = pd.concat(all_factor_df_lists.pop(hold_period_name), ignore_index=True)
 
-    print(f"✅ 因子计算完成，耗时：{time.time() - s_time:.2f}秒\n")
+        # 转化一下symbol的类型为category，可以加快因子计算速度，节省内存
+        # 并且排序和整理index
+        all_factors_df_dict[hold_period_name] = (
+            all_factors_df.assign(
+                股票代码=all_factors_df["股票代码"].astype("category"),
+                股票名称=all_factors_df["股票名称"].astype("category"),
+            )
+            .sort_values(by=["交易日期", "股票代码"])
+            .reset_index(drop=True)
+        )
+    return all_factors_df_dict, factor_col_info
 
 
 if __name__ == "__main__":
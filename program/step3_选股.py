@@ -5,9 +5,10 @@ import time
 import warnings
 import pandas as pd
 
+from core.data_store import BacktestDataContext
 from core.model.backtest_config import load_config, BacktestConfig
-from core.utils.path_kit import get_file_path
 from core.market_essentials import save_latest_result, select_analysis
+from core.selection import select_top_k
 from core.figure import draw_equity_curve_plotly
 
 # ====================================================================================================
@@ -23,7 +24,7 @@ pd.set_option("display.unicode.east_asian_width", True)
 FACTOR_COLS = ["交易日期", "股票代码", "股票名称"]
 
 
-def select_stocks(conf: BacktestConfig, show_plot=True):
+def select_stocks(conf: BacktestConfig, show_plot=True, data: BacktestDataContext = None):
     """
     选股流程：
     1. 初始化策略配置
@@ -33,6 +34,8 @@ def select_stocks(conf: BacktestConfig, show_plot=True):
 
     参数:
     conf (BacktestConfig): 回测配置
+    show_plot (bool): 是否显示选股分析图表
+    data (BacktestDataContext, optional): 共享的回测数据，参数遍历时传入，避免重复读取硬盘，默认为 None
     返回:
     DataFrame: 选股结果
     """
@@ -49,14 +52,16 @@ def select_stocks(conf: BacktestConfig, show_plot=True):
     # 2. 加载并清洗选股数据
     # ====================================================================================================
     s = time.time()
-    period_df = pd.read_pickle(get_file_path("data", "运行缓存", "因子计算结果.pkl"))  # 加载带有因子计算结果的数据
-    factor_columns_dict = pd.read_pickle(get_file_path("data", "运行缓存", "策略因子列信息.pkl"))  # 读取策略因子列信息
+    if data is None:
+        data = BacktestDataContext()
+    period_df = data.get_period_df(strategy.hold_period_name)  # 加载带有因子计算结果的数据
+    factor_columns_dict = data.factor_col_info  # 读取策略因子列信息
 
     # 新增：计算市值分位数
     period_df['市值分位'] = period_df.groupby('交易日期')['总市值'].rank(pct=True)
 
     # 过滤掉每一个周期中，没有交易的股票
-    period_df = period_df[period_df["是否交易"] == 1].dropna(subset=factor_columns_dict.keys()).copy()
+    period_df = period_df[period_df["是否交易"] == 1].dropna(subset=list(factor_columns_dict.keys())).copy()
     period_df.dropna(subset=["股票代码"], inplace=True)
 
     # 最后整理一下
@@ -128,48 +133,16 @@ def select_by_factor(period_df, select_num: float | int, factor_name):
     返回:
     DataFrame: 带目标资金占比的选股结果
     """
-    period_df = calc_select_factor_rank(period_df, factor_column=factor_name, ascending=True)
-
-    # 基于排名筛选股票
-    if int(select_num) == 0:  # 选股数量是百分比
-        period_df = period_df[period_df["rank"] <= period_df["总股数"] * select_num].copy()
-    else:  # 选股数量是固定的数字
-        period_df = period_df[period_df["rank"] <= select_num].copy()
-
-    # 根据选股数量分配目标资金
-    period_df["目标资金占比"] = 1 / period_df.groupby("交易日期")["股票代码"].transform("size")
-
-    period_df.sort_values(by="交易日期", inplace=True)
+    # 按交易日期分组，计算因子排名并筛选股票（选股数量小于1时是百分比），同时根据选股数量分配目标资金
+    row_index, rank, weight = select_top_k(
+        period_df["交易日期"].to_numpy(), period_df[factor_name].to_numpy(), select_num, ascending=True
+    )
+    period_df = period_df.take(row_index).assign(rank=rank, 目标资金占比=weight)
     period_df.reset_index(drop=True, inplace=True)
 
-    # 清理无关列
-    period_df.drop(columns=["总股数", "rank_max"], inplace=True)
-
     return period_df
 
 
-def calc_select_factor_rank(df, factor_column="因子", ascending=True):
-    """
-    计算因子排名。
-
-    参数:
-    df (DataFrame): 原始数据
-    factor_column (str): 因子列名
-    ascending (bool): 排序顺序，True为升序
-
-    返回:
-    DataFrame: 包含排名的原数据
-    """
-    # 计算因子的分组排名
-    df["rank"] = df.groupby("交易日期")[factor_column].rank(method="min", ascending=ascending)
-    df["rank_max"] = df.groupby("交易日期")["rank"].transform("max")
-    # 根据时间和因子排名排序
-    df.sort_values(by=["交易日期", "rank"], inplace=True)
-    # 重新计算一下总股数
-    df["总股数"] = df.groupby("交易日期")["股票代码"].transform("size")
-    return df
-
-
 if __name__ == "__main__":
     backtest_config = load_config()
     select_stocks(backtest_config)
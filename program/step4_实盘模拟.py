@@ -6,10 +6,10 @@ import warnings
 
 import pandas as pd
 
-from core.equity import calc_equity, show_plot_performance
+from core.data_store import BacktestDataContext, MarketPivot
+from core.equity import calc_equity, calc_equity_batch, show_plot_performance
 from core.model.backtest_config import BacktestConfig, load_config
 from core.model.timing_signal import EquityTiming
-from core.utils.path_kit import get_file_path
 
 # ====================================================================================================
 # ** 配置与初始化 **
@@ -33,10 +33,11 @@ def save_performance_df_csv(conf: BacktestConfig, **kwargs):
 # 2. 进行动态杠杆再择时的回测模拟
 # 3. 保存结果
 # ====================================================================================================
-def simu_equity_timing(conf: BacktestConfig, pivot_dict_stock: dict, df_stock_ratio: pd.DataFrame):
+def simu_equity_timing(conf: BacktestConfig, market_pivot: MarketPivot, df_stock_ratio: pd.DataFrame):
     """
     动态杠杆再择时模拟
     :param conf: 回测配置
+    :param market_pivot: 股票行情透视表
     :param df_stock_ratio: 股票目标资金占比
     :return: 资金曲线，策略收益，年化收益
     """
@@ -65,7 +66,7 @@ def simu_equity_timing(conf: BacktestConfig, pivot_dict_stock: dict, df_stock_ra
     # - 使用动态杠杆调整后的持仓计算资金曲线
     # - 包括现货和合约的比例数据
     # - 计算回测的总体收益、年度收益、季度收益和月度收益
-    account_df, rtn, year_return, month_return, quarter_return = calc_equity(conf, pivot_dict_stock, df_stock_ratio)
+    account_df, rtn, year_return, month_return, quarter_return = calc_equity(conf, market_pivot, df_stock_ratio)
 
     # 保存回测结果，包括再择时后的资金曲线和收益评价指标
     save_performance_df_csv(
@@ -83,7 +84,7 @@ def simu_equity_timing(conf: BacktestConfig, pivot_dict_stock: dict, df_stock_ra
     return account_df, rtn, year_return
 
 
-def simulate_performance(conf: BacktestConfig, select_results, show_plot=True):
+def simulate_performance(conf: BacktestConfig, select_results, show_plot=True, data: BacktestDataContext = None):
     """
     模拟投资组合的表现，生成资金曲线以跟踪组合收益变化。
 
@@ -91,23 +92,85 @@ def simulate_performance(conf: BacktestConfig, select_results, show_plot=True):
     conf (BacktestConfig): 回测配置
     select_results (DataFrame): 选股结果数据
     show_plot (bool): 是否显示回测结果图表
+    data (BacktestDataContext, optional): 共享的回测数据，参数遍历时传入，避免重复读取硬盘，默认为 None
 
     返回:
     None
     """
+    s_time = time.time()
+    # ====================================================================================================
+    # 1. 聚合选股结果中的权重，并对数据进行处理
+    # ====================================================================================================
+    df_stock_ratio = prepare_stock_ratio(conf, select_results)
+
+    # 行情透视表以内存映射的方式打开，只会读取回测需要的交易日期和股票
+    market_pivot = data.market_pivot if data is not None else MarketPivot()
+
+    # ====================================================================================================
+    # 2. 计算资金曲线
+    # ====================================================================================================
+    print(f"🌀 开始模拟日线交易，回溯 {len(df_stock_ratio):,} 天...")
+    # 计算资金曲线及收益数据
+    equity_result = calc_equity(conf, market_pivot, df_stock_ratio)
+
     # ====================================================================================================
-    # 1. 聚合选股结果中的权重
+    # 3. 保存结果，以及资金曲线再择时
     # ====================================================================================================
+    report = save_simulation_result(conf, market_pivot, df_stock_ratio, equity_result, show_plot)
+
+    print(f"✅ 回测完成，耗时：{time.time() - s_time:.3f}秒\n")
+
+    return report
+
+
+def simulate_performance_batch(conf_list, select_results_list, data: BacktestDataContext = None):
+    """
+    参数遍历时，批量模拟多个参数组合的表现。所有参数组合的资金曲线在一次numba并行计算中完成，
+    结果和逐个调用 simulate_performance 一致，不显示图表
+
+    参数:
+    conf_list (list): 回测配置列表
+    select_results_list (list): 每个参数组合的选股结果数据
+    data (BacktestDataContext, optional): 共享的回测数据，默认为 None
+
+    返回:
+    list: 每个参数组合的策略评价
+    """
+    s_time = time.time()
+    df_stock_ratio_list = [
+        prepare_stock_ratio(conf, select_results) for conf, select_results in zip(conf_list, select_results_list)
+    ]
+    market_pivot = data.market_pivot if data is not None else MarketPivot()
+
+    print(f"🌀 开始批量模拟日线交易，共 {len(conf_list):,} 个参数组合...")
+    equity_results = calc_equity_batch(conf_list, market_pivot, df_stock_ratio_list)
+
+    reports = [
+        save_simulation_result(conf, market_pivot, df_stock_ratio, equity_result, show_plot=False)
+        for conf, df_stock_ratio, equity_result in zip(conf_list, df_stock_ratio_list, equity_results)
+    ]
+
+    print(f"✅ 批量回测完成，耗时：{time.time() - s_time:.3f}秒\n")
+
+    return reports
+
+
+def prepare_stock_ratio(conf: BacktestConfig, select_results) -> pd.DataFrame:
+    """
+    聚合选股结果中的权重，确定回测区间，并按照换仓日历对齐
+
+    参数:
+    conf (BacktestConfig): 回测配置，会根据选股结果更新回测的开始和结束日期
+    select_results (DataFrame): 选股结果数据
+
+    返回:
+    DataFrame: 股票目标资金占比，index为换仓日期，columns为股票代码
+    """
     s_time = time.time()
     print("🌀 开始权重聚合...")
     df_stock_ratio = select_results.pivot(index="交易日期", columns="股票代码", values="目标资金占比").fillna(0)
     print(f"✅ 权重聚合完成，耗时：{time.time() - s_time:.3f}秒\n")
 
-    # ====================================================================================================
-    # 2. 对数据进行处理
-    # ====================================================================================================
-    pivot_dict_stock = pd.read_pickle(get_file_path("data", "运行缓存", "全部股票行情pivot.pkl"))
-
     # 确定回测区间
     data_date_max = f"{df_stock_ratio.index.max().date()}"
     conf.start_date = max(conf.start_date, f"{df_stock_ratio.index.min().date()}")
@@ -122,12 +185,24 @@ def simulate_performance(conf: BacktestConfig, select_results, show_plot=True):
     df_stock_ratio = df_stock_ratio.reindex(rebalance_dates, fill_value=0)
     df_stock_ratio = df_stock_ratio.sort_index()
 
-    # ====================================================================================================
-    # 3. 计算资金曲线
-    # ====================================================================================================
-    print(f"🌀 开始模拟日线交易，回溯 {len(df_stock_ratio):,} 天...")
-    # 计算资金曲线及收益数据
-    account_df, rtn, year_return, month_return, quarter_return = calc_equity(conf, pivot_dict_stock, df_stock_ratio)
+    return df_stock_ratio
+
+
+def save_simulation_result(conf: BacktestConfig, market_pivot: MarketPivot, df_stock_ratio, equity_result, show_plot):
+    """
+    保存资金曲线和策略评价，启用择时信号时，进行资金曲线再择时
+
+    参数:
+    conf (BacktestConfig): 回测配置
+    market_pivot (MarketPivot): 股票行情透视表
+    df_stock_ratio (DataFrame): 股票目标资金占比
+    equity_result (tuple): calc_equity 的计算结果
+    show_plot (bool): 是否显示回测结果图表
+
+    返回:
+    DataFrame: 策略评价
+    """
+    account_df, rtn, year_return, month_return, quarter_return = equity_result
 
     # - 保存计算出的资金曲线、策略评价、年度、季度和月度的收益数据
     save_performance_df_csv(
@@ -145,7 +220,7 @@ def simulate_performance(conf: BacktestConfig, select_results, show_plot=True):
     if has_equity_signal:
         print(f"🌀 开始计算资金曲线再择时...")
         # 进行再择时回测，计算动态杠杆后的资金曲线和收益指标
-        account_df2, rtn2, year_return2 = simu_equity_timing(conf, pivot_dict_stock, df_stock_ratio)
+        account_df2, rtn2, year_return2 = simu_equity_timing(conf, market_pivot, df_stock_ratio)
 
         # 可选：绘制再择时的资金曲线图表
         if show_plot:
@@ -156,8 +231,6 @@ def simulate_performance(conf: BacktestConfig, select_results, show_plot=True):
     elif show_plot:
         show_plot_performance(conf, account_df, rtn, year_return)
 
-    print(f"✅ 回测完成，耗时：{time.time() - s_time:.3f}秒\n")
-
     return conf.report
 
 
@@ -0,0 +1,15 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import sys
+import types
+
+try:
+    import config  # noqa: F401
+except SystemExit:
+    # 导入 config.py 时会检查数据路径，路径不存在时直接退出
+    # 测试不读取数据，用只包含导入时需要的配置项的模块代替，保证 core 下的模块都可以导入
+    stub = types.ModuleType('config')
+    stub.days_listed = 250
+    stub.n_jobs = 1
+    sys.modules['config'] = stub
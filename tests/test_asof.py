@@ -0,0 +1,70 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.utils.asof import asof_index, take_rows
+
+
+def merge_asof_index(left_dates, right_dates):
+    """
+    用 pd.merge_asof(direction='backward') 查找右表的行号，作为对照
+    merge_asof 要求两张表都按日期排序，排序之后再恢复左表原来的顺序
+    """
+    left = pd.DataFrame({'日期': pd.DatetimeIndex(left_dates), 'left_row': np.arange(len(left_dates))})
+    right = pd.DataFrame({'日期': pd.DatetimeIndex(right_dates), 'right_row': np.arange(len(right_dates))})
+    merged = pd.merge_asof(left.sort_values('日期'), right.sort_values('日期'), on='日期', direction='backward')
+    return merged.sort_values('left_row')['right_row'].fillna(-1).astype(np.int64).to_numpy()
+
+
+def merge_index(left_dates, right_dates):
+    """
+    用 pd.merge 查找日期完全相同的右表行号，作为对照
+    """
+    left = pd.DataFrame({'日期': pd.DatetimeIndex(left_dates)})
+    right = pd.DataFrame({'日期': pd.DatetimeIndex(right_dates), 'right_row': np.arange(len(right_dates))})
+    merged = pd.merge(left, right, on='日期', how='left')
+    return merged['right_row'].fillna(-1).astype(np.int64).to_numpy()
+
+
+def test_asof_index_backward_and_exact():
+    left = pd.to_datetime(['2024-01-01', '2024-01-03', '2024-01-05', '2024-01-08', '2024-01-05'])
+    # 右表没有排序
+    right = pd.to_datetime(['2024-01-05', '2024-01-02', '2024-01-07'])
+
+    # 2024-01-01 之前没有数据；日期相同时取相同日期的行
+    np.testing.assert_array_equal(asof_index(left, right), [-1, 1, 0, 2, 0])
+    np.testing.assert_array_equal(asof_index(left, right, exact=True), [-1, -1, 0, -1, 0])
+
+
+def test_asof_index_empty_right():
+    left = pd.to_datetime(['2024-01-01', '2024-01-03'])
+    np.testing.assert_array_equal(asof_index(left, pd.DatetimeIndex([])), [-1, -1])
+
+
+def test_asof_index_duplicated_right_dates():
+    with pytest.raises(ValueError):
+        asof_index(pd.to_datetime(['2024-01-03']), pd.to_datetime(['2024-01-02', '2024-01-01', '2024-01-02']))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_asof_index_equals_merge_asof(seed):
+    rng = np.random.default_rng(seed)
+    base = pd.Timestamp('2024-01-01')
+    # 左表日期可以重复，并且有一部分和右表日期相同；右表日期不重复，顺序打乱
+    left_dates = base + pd.to_timedelta(rng.integers(0, 60, 200), 'D')
+    right_dates = base + pd.to_timedelta(rng.permutation(60)[:rng.integers(1, 30)], 'D')
+
+    np.testing.assert_array_equal(asof_index(left_dates, right_dates), merge_asof_index(left_dates, right_dates))
+    np.testing.assert_array_equal(asof_index(left_dates, right_dates, exact=True), merge_index(left_dates, right_dates))
+
+
+def test_take_rows():
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']}, index=[10, 20, 30])
+    result = take_rows(df, np.array([2, -1, 0, 2]))
+
+    # 没有找到的行为空值，整数变为浮点数，和 pd.merge 缺少对应行时一致
+    expected = pd.DataFrame({'a': [3.0, np.nan, 1.0, 3.0], 'b': ['z', np.nan, 'x', 'z']})
+    pd.testing.assert_frame_equal(result, expected)
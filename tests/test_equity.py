@@ -0,0 +1,150 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import core.equity as equity
+from core.model.type_def import StockMarketData, SimuParams, get_symbol_type
+from core.rebalance import RebAlways
+
+SYMBOLS = ['sh600000', 'sh600519', 'sh688001', 'sh688111', 'sz000001', 'sz000002', 'sz000333', 'sz000651']
+TRADING_DATES = pd.bdate_range('2024-01-02', periods=80)
+
+
+class FramePivot:
+    """
+    用 DataFrame 模拟行情透视表，gather 和 MarketPivot.gather 一样按 交易日期 x 股票代码 取出数据
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def gather(self, field, dates, symbols):
+        return self.frames[field].loc[pd.DatetimeIndex(dates), list(symbols)].to_numpy(dtype=np.float64, copy=True)
+
+
+class Conf:
+    """
+    只包含模拟交易需要的回测配置
+    """
+
+    def __init__(self, start_date, end_date, initial_cash, t_rate, c_rate, rebalance_mode):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.initial_cash = initial_cash
+        self.t_rate = t_rate
+        self.c_rate = c_rate
+        self.rebalance_mode = rebalance_mode
+        self.report = None
+
+    def set_report(self, report):
+        self.report = report
+
+
+def make_frames(seed):
+    """
+    生成随机行情，包含停牌（开盘价、收盘价、前收盘价都为空）和除权除息（前收盘价和上一个收盘价不同）
+    """
+    rng = np.random.default_rng(seed)
+    shape = (len(TRADING_DATES), len(SYMBOLS))
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, shape), axis=0))
+    suspended = rng.random(shape) < 0.08
+    suspended[0] = False
+    close[suspended] = np.nan
+
+    # 前收盘价为停牌之前最后一个收盘价，偶尔因除权除息下调
+    pre_close = pd.DataFrame(close).ffill().shift().to_numpy(copy=True)
+    pre_close[0] = close[0]
+    pre_close *= np.where(rng.random(shape) < 0.03, 0.9, 1.0)
+    pre_close[suspended] = np.nan
+    open_ = pre_close * (1 + rng.normal(0, 0.01, shape))
+
+    return {
+        field: pd.DataFrame(values, index=TRADING_DATES, columns=SYMBOLS)
+        for field, values in (('open', open_), ('close', close), ('preclose', pre_close))
+    }
+
+
+def make_stock_ratio(rng, first_adj):
+    """
+    生成一个参数组合的目标资金占比：从 first_adj 开始每 5 个交易日换仓，只包含部分股票
+    """
+    symbols = sorted(rng.choice(SYMBOLS, size=rng.integers(3, 6), replace=False))
+    adj_dates = TRADING_DATES[first_adj::5]
+    ratios = rng.random((len(adj_dates), len(symbols)))
+    ratios[ratios < 0.3] = 0
+    ratios /= np.maximum(ratios.sum(axis=1, keepdims=True), 1e-9)
+    return pd.DataFrame(ratios, index=adj_dates, columns=symbols)
+
+
+def fake_read_trading_dates(first_date, last_date):
+    trading_dates = pd.Series(TRADING_DATES, name='交易日期')
+    return trading_dates[(trading_dates >= first_date) & (trading_dates <= last_date)]
+
+
+def make_market(frames, dates, symbols):
+    pivot = FramePivot(frames)
+    return equity.get_stock_market(pivot, pd.Series(dates), symbols, [get_symbol_type(sym) for sym in symbols])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_simulation_batch_equals_single(seed):
+    # 同一份行情，每个参数组合的换仓日期数量不同，调仓方式不同
+    rng = np.random.default_rng(seed)
+    market = make_market(make_frames(seed), TRADING_DATES, SYMBOLS)
+    params = SimuParams(100000.0, 1.2 / 10000, 1 / 1000)
+    pos_calc = RebAlways(market.types)
+
+    n_configs = 5
+    n_adjs = rng.integers(1, 16, n_configs)
+    delta_modes = np.array([i % 2 == 1 for i in range(n_configs)], dtype=np.bool_)
+    adj_dts = np.zeros((n_configs, n_adjs.max()), dtype=np.int64)
+    ratios = np.zeros((n_configs, n_adjs.max(), len(SYMBOLS)), dtype=np.float64)
+    for i in range(n_configs):
+        adj_idx = np.sort(rng.choice(len(TRADING_DATES), size=n_adjs[i], replace=False))
+        adj_dts[i, : n_adjs[i]] = market.candle_begin_ts[adj_idx]
+        ratios[i, : n_adjs[i]] = rng.dirichlet(np.ones(len(SYMBOLS)), size=n_adjs[i])
+
+    batch = equity.start_simulation_batch(market, params, adj_dts, n_adjs, ratios, pos_calc, delta_modes)
+
+    for i in range(n_configs):
+        single = equity.start_simulation(
+            market, params, adj_dts[i, : n_adjs[i]], ratios[i, : n_adjs[i]], pos_calc, delta_modes[i]
+        )
+        for batch_values, single_values in zip(batch, single):
+            np.testing.assert_array_equal(batch_values[i], single_values)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_calc_equity_batch_equals_calc_equity(seed, monkeypatch):
+    """
+    批量模拟使用全部参数组合的股票并集和日期并集，在参数组合的回测开始之前只持有现金，
+    结果和单独模拟（只使用自己的股票和回测区间）完全一致
+    """
+    monkeypatch.setattr(equity, 'read_trading_dates', fake_read_trading_dates)
+    rng = np.random.default_rng(seed)
+    pivot = FramePivot(make_frames(seed))
+
+    conf_list = []
+    df_stock_ratio_list = []
+    # 3 组 (初始资金, 印花税率, 佣金率)，第一组有 5 个参数组合，大于 chunk_size
+    simu_settings = [(100000, 1 / 1000, 1.2 / 10000)] * 5 + [(300000, 1 / 1000, 1.2 / 10000)] * 2 + [
+        (100000, 0.5 / 1000, 2.5 / 10000)
+    ] * 2
+    for k, (initial_cash, t_rate, c_rate) in enumerate(simu_settings):
+        # 回测开始日期不同：由目标资金占比的第一个换仓日和配置的开始日期共同决定
+        df_stock_ratio = make_stock_ratio(rng, first_adj=int(rng.integers(0, 20)))
+        start_date = TRADING_DATES[int(rng.integers(0, 30))].strftime('%Y-%m-%d')
+        end_date = TRADING_DATES[int(rng.integers(60, 80))].strftime('%Y-%m-%d')
+        mode = 'delta' if k % 2 else 'full'
+        conf_list.append(Conf(start_date, end_date, initial_cash, t_rate, c_rate, mode))
+        df_stock_ratio_list.append(df_stock_ratio)
+
+    results = equity.calc_equity_batch(conf_list, pivot, df_stock_ratio_list, chunk_size=2)
+
+    for conf, df_stock_ratio, result in zip(conf_list, df_stock_ratio_list, results):
+        expected = equity.calc_equity(conf, pivot, df_stock_ratio)
+        pd.testing.assert_frame_equal(result[0].reset_index(drop=True), expected[0].reset_index(drop=True))
+        pd.testing.assert_frame_equal(result[1], expected[1])
@@ -0,0 +1,123 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+
+from core.fin_essentials import get_last_quarter_and_year_index
+
+
+def loop_last_quarter_and_year_index(date_list):
+    """
+    向量化之前的实现（逐行向前查找），作为对照
+    获取上季度、上年度、以及上一次年报的索引
+    :param date_list: 财报日期数据
+    :return: 上季度、上年度、以及上一次年报的索引
+    """
+    # 使用 list 相比 TSeries 在性能上要好很多，使用上保持一致
+    date_list = date_list.tolist()
+    # 申明输出变量
+    last_q_index = []  # 上个季度的index
+    last_4q_index = []  # 去年同期的index
+    last_y_index = []  # 去年年报的index
+    last_y_3q_index = []  # 去年三季度的index
+    last_y_2q_index = []  # 去年二季度的index
+    last_y_q_index = []  # 去年一季度的index
+
+    no_meaning_index = len(date_list) - 1  # 无意义的索引值，（最后一行的索引）
+
+    # 逐个日期循环
+    for index, date in enumerate(date_list):
+        # 首个日期时，添加空值
+        if index == 0:
+            last_q_index.append(no_meaning_index)
+            last_4q_index.append(no_meaning_index)
+            last_y_index.append(no_meaning_index)
+            last_y_3q_index.append(no_meaning_index)
+            last_y_2q_index.append(no_meaning_index)
+            last_y_q_index.append(no_meaning_index)
+            continue
+
+        # 反向逐个遍历当前日期之前的日期
+        q_finish = False
+        _4q_finish = False
+        y_finish = False
+        _y_3q_index = False
+        _y_2q_index = False
+        _y_q_index = False
+        for i in sorted(range(index), reverse=True):
+            # 计算之前日期和当前日期相差的月份
+            delta_month = (date - date_list[i]).days / 30
+            delta_month = round(delta_month)
+            # 如果相差3个月，并且尚未找到上个季度的值
+            if delta_month == 3 and q_finish is False:
+                last_q_index.append(i)
+                q_finish = True  # 已经找到上个季度的值
+            # 如果相差12个月，并且尚未找到去年同期的值
+            if delta_month == 12 and _4q_finish is False:
+                last_4q_index.append(i)
+                _4q_finish = True  # 已经找到上个年度的值
+            # 如果是去年4季度，并且尚未找到去年4季度的值
+            if date.year - date_list[i].year == 1 and date_list[i].month == 3 and _y_q_index is False:
+                last_y_q_index.append(i)
+                _y_q_index = True
+            # 如果是去年4季度，并且尚未找到去年4季度的值
+            if date.year - date_list[i].year == 1 and date_list[i].month == 6 and _y_2q_index is False:
+                last_y_2q_index.append(i)
+                _y_2q_index = True
+            # 如果是去年4季度，并且尚未找到去年4季度的值
+            if date.year - date_list[i].year == 1 and date_list[i].month == 9 and _y_3q_index is False:
+                last_y_3q_index.append(i)
+                _y_3q_index = True
+            # 如果是去年4季度，并且尚未找到去年4季度的值
+            if date.year - date_list[i].year == 1 and date_list[i].month == 12 and y_finish is False:
+                last_y_index.append(i)
+                y_finish = True
+
+            # 如果三个数据都找到了
+            if q_finish and _4q_finish and y_finish and _y_q_index and _y_2q_index and _y_3q_index:
+                break  # 退出寻找
+        if q_finish is False:  # 全部遍历完之后，尚未找到上个季度的值
+            last_q_index.append(no_meaning_index)
+        if _4q_finish is False:  # 全部遍历完之后，尚未找到4个季度前的值
+            last_4q_index.append(no_meaning_index)
+        if y_finish is False:  # 全部遍历完之后，尚未找到去年4季度的值
+            last_y_index.append(no_meaning_index)
+        if _y_q_index is False:  # 全部遍历完之后，尚未找到去年4季度的值
+            last_y_q_index.append(no_meaning_index)
+        if _y_2q_index is False:  # 全部遍历完之后，尚未找到去年4季度的值
+            last_y_2q_index.append(no_meaning_index)
+        if _y_3q_index is False:  # 全部遍历完之后，尚未找到去年4季度的值
+            last_y_3q_index.append(no_meaning_index)
+    # 返回
+    return last_q_index, last_4q_index, last_y_index, last_y_q_index, last_y_2q_index, last_y_3q_index
+
+
+def random_report_dates(rng):
+    # 季度末的报告期，有缺失的季度、重复的报告期（更正公告），以及少量乱序（补发的旧报告）
+    quarter_ends = pd.date_range('2005-03-31', '2024-12-31', freq='QE')
+    start = rng.integers(0, len(quarter_ends) - 1)
+    dates = quarter_ends[start:start + rng.integers(1, 60)]
+    dates = dates[rng.random(len(dates)) > 0.2]
+    if len(dates) == 0:
+        dates = quarter_ends[start:start + 1]
+    dates = np.repeat(dates.to_numpy(), rng.integers(1, 3, len(dates)))
+    if len(dates) > 2 and rng.random() < 0.5:
+        i, j = sorted(rng.choice(len(dates), 2, replace=False))
+        dates[i], dates[j] = dates[j], dates[i]
+    return pd.Series(dates)
+
+
+def test_matches_loop_implementation():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        date_list = random_report_dates(rng)
+        expected = loop_last_quarter_and_year_index(date_list)
+        result = get_last_quarter_and_year_index(date_list)
+        assert len(result) == 6
+        for expected_index, result_index in zip(expected, result):
+            assert list(result_index) == expected_index, date_list.tolist()
+
+
+def test_empty():
+    assert get_last_quarter_and_year_index(pd.Series([], dtype='datetime64[ns]')) == ([], [], [], [], [], [])
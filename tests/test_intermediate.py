@@ -0,0 +1,54 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.utils.factor_hub import FactorHub
+from core.utils.intermediate import IntermediateGraph, Intermediates
+
+
+def _candle_df(n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '成交额': rng.uniform(1e6, 1e8, n),
+        '流通市值': rng.uniform(1e9, 1e10, n),
+    })
+
+
+def test_shared_custom_intermediate():
+    # 另一个因子文件中定义了和换手率因子相同的日换手率，汇总时不应该报错
+    turnover_std = type('换手率STD', (), {
+        'intermediate_funcs': {'日换手率': (('成交额', '流通市值'), lambda amount, float_mv: amount / float_mv)},
+    })
+    graph = IntermediateGraph.from_factors([FactorHub.get_by_name('换手率'), turnover_std])
+
+    df = _candle_df()
+    intermediates = Intermediates(df, graph)
+    intermediates.compute(['日换手率_mean_5', '日换手率_std_5'])
+    turnover = intermediates['日换手率']
+
+    mean_df, _ = FactorHub.get_by_name('换手率').add_factor(
+        df.copy(), 5, col_name='换手率_5', intermediates=intermediates
+    )
+
+    # 两个因子共用同一个日换手率，只计算一次
+    assert intermediates['日换手率'] is turnover
+    expected = df['成交额'] / df['流通市值']
+    np.testing.assert_allclose(mean_df['换手率_5'], expected.rolling(5).mean(), equal_nan=True)
+    np.testing.assert_allclose(intermediates['日换手率_std_5'], expected.rolling(5).std(), rtol=1e-9, equal_nan=True)
+
+
+def test_conflicting_custom_intermediate():
+    factor_a = type('A', (), {'intermediate_funcs': {'日换手率': (('成交额', '流通市值'), lambda a, b: a / b)}})
+    factor_b = type('B', (), {'intermediate_funcs': {'日换手率': (('成交额', '流通市值'), lambda a, b: a * b)}})
+    factor_c = type('C', (), {'intermediate_funcs': {'日换手率': (('成交额', '总市值'), lambda a, b: a / b)}})
+
+    # 依赖和代码相同的定义可以共用
+    IntermediateGraph.from_factors([factor_a, factor_a, FactorHub.get_by_name('换手率')])
+    # 计算代码不同，或者依赖不同时报错
+    with pytest.raises(ValueError):
+        IntermediateGraph.from_factors([factor_a, factor_b])
+    with pytest.raises(ValueError):
+        IntermediateGraph.from_factors([factor_a, factor_c])
@@ -0,0 +1,97 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.market_essentials import cal_name_state, cal_zdt_price, price_round, price_round_bj
+
+
+def decimal_round(x):
+    return float(Decimal(x + 1e-7).quantize(Decimal('1.00'), ROUND_HALF_UP))
+
+
+def decimal_round_bj(x):
+    return float(Decimal(x).quantize(Decimal('0.00'), rounding=ROUND_DOWN))
+
+
+def decimal_zdt_price(df):
+    """
+    逐个使用 Decimal 计算涨跌停价格，和向量化之前的 cal_zdt_price 一致
+    """
+    df = df.copy()
+    cond = df['股票名称'].str.contains('ST')
+    df['涨停价'] = df['前收盘价'] * 1.1
+    df['跌停价'] = df['前收盘价'] * 0.9
+    df.loc[cond, '涨停价'] = df['前收盘价'] * 1.05
+    df.loc[cond, '跌停价'] = df['前收盘价'] * 0.95
+    rule_kcb = df['股票代码'].str.contains('sh68')
+    new_rule_cyb = (df['交易日期'] > pd.to_datetime('2020-08-23')) & df['股票代码'].str.contains('sz3')
+    df.loc[rule_kcb | new_rule_cyb, '涨停价'] = df['前收盘价'] * 1.2
+    df.loc[rule_kcb | new_rule_cyb, '跌停价'] = df['前收盘价'] * 0.8
+    cond_bj = df['股票代码'].str.contains('bj')
+    df.loc[cond_bj, '涨停价'] = df['前收盘价'] * 1.3
+    df.loc[cond_bj, '跌停价'] = df['前收盘价'] * 0.7
+    df.loc[~cond_bj, '涨停价'] = df['涨停价'].apply(decimal_round)
+    df.loc[~cond_bj, '跌停价'] = df['跌停价'].apply(decimal_round)
+    df.loc[cond_bj, '涨停价'] = df['涨停价'].apply(decimal_round_bj)
+    df.loc[cond_bj, '跌停价'] = df['跌停价'].apply(decimal_round_bj)
+    return df
+
+
+def random_prices(rng, n):
+    # 常见的价格区间，以及刚好落在半分上的价格（x.xx5），覆盖四舍五入的边界
+    prices = np.round(rng.uniform(0.5, 300, n), 2)
+    ties = rng.integers(50, 300000, n) * 10 + 5
+    return np.concatenate([prices, ties / 1000, rng.uniform(0, 2000, n)])
+
+
+@pytest.mark.parametrize('ratio', [1.1, 0.9, 1.05, 0.95, 1.2, 0.8, 1.3, 0.7, 1.0])
+def test_price_round_matches_decimal(ratio):
+    rng = np.random.default_rng(int(ratio * 100))
+    values = random_prices(rng, 20000) * ratio
+    expected = np.array([decimal_round(x) for x in values])
+    np.testing.assert_array_equal(price_round(values), expected)
+
+
+@pytest.mark.parametrize('ratio', [1.3, 0.7, 1.0])
+def test_price_round_bj_matches_decimal(ratio):
+    rng = np.random.default_rng(int(ratio * 1000))
+    values = random_prices(rng, 20000) * ratio
+    expected = np.array([decimal_round_bj(x) for x in values])
+    np.testing.assert_array_equal(price_round_bj(values), expected)
+
+
+def test_price_round_keeps_nan():
+    values = np.array([np.nan, 10.005, np.nan])
+    result = price_round(values)
+    assert np.isnan(result[[0, 2]]).all()
+    assert result[1] == decimal_round(10.005)
+
+
+@pytest.mark.parametrize('with_name_state', [True, False])
+def test_cal_zdt_price_matches_decimal(with_name_state):
+    rng = np.random.default_rng(0)
+    n = 4000
+    # 主板、ST、*ST、2020-08-24前后的创业板、科创板、北交所
+    codes = rng.choice(['sh600000', 'sz000001', 'sz300001', 'sh688001', 'bj430001'], n)
+    names = rng.choice(['股票', 'ST股票', '*ST股票', 'S股票'], n)
+    dates = rng.choice(pd.to_datetime(['2019-06-03', '2020-08-21', '2020-08-24', '2023-03-01']), n)
+    pre_close = np.concatenate([
+        np.round(rng.uniform(1, 100, n // 2), 2),
+        (rng.integers(100, 10000, n // 2) * 10 + 5) / 1000,
+    ])
+    df = pd.DataFrame({
+        '交易日期': dates, '股票代码': codes, '股票名称': names, '前收盘价': pre_close,
+        '开盘价': pre_close, '最高价': pre_close, '最低价': pre_close,
+    })
+    if with_name_state:
+        df['名称状态'] = cal_name_state(df['股票名称'])
+
+    result = cal_zdt_price(df.copy())
+    expected = decimal_zdt_price(df)
+    np.testing.assert_array_equal(result['涨停价'].to_numpy(), expected['涨停价'].to_numpy())
+    np.testing.assert_array_equal(result['跌停价'].to_numpy(), expected['跌停价'].to_numpy())
@@ -0,0 +1,96 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.period_agg import aggregate_by_period
+
+
+def last_value(x):
+    # 自定义的聚合函数，aggregate_by_period 使用 pandas 计算
+    return x.iloc[-1]
+
+
+AGG_DICT = {
+    '日期': 'last',
+    '名称': ['first', 'last'],
+    'int8': ['last', 'sum', 'count'],
+    'float': ['first', 'last', 'max', 'min', 'sum', 'mean', 'count'],
+    'float32': ['sum', 'mean', 'max'],
+    'bool': ['sum', 'max', 'min', 'last'],
+    'int': ['sum', 'max', 'min', 'mean', 'first', last_value],
+}
+
+
+def make_daily_df(seed, n=200, nan_tags=False, shuffle=False):
+    rng = np.random.default_rng(seed)
+    tags = pd.Series(pd.to_datetime('2020-01-06') + pd.to_timedelta(np.sort(rng.integers(0, 12, n)) * 7, 'D'))
+    if nan_tags:
+        # 周期列为空值的行不参与聚合
+        tags[rng.random(n) < 0.2] = pd.NaT
+    values = rng.normal(size=n) * 10.0 ** rng.integers(-3, 12, n)
+    values[rng.random(n) < 0.3] = np.nan
+    df = pd.DataFrame({
+        '周期': tags,
+        '日期': pd.to_datetime('2020-01-01') + pd.to_timedelta(rng.integers(0, 99, n), 'D'),
+        '名称': pd.Series(rng.choice(['股票A', 'ST股票A', None], n), dtype='str'),
+        'int8': rng.integers(0, 2, n).astype(np.int8),
+        'float': values,
+        'float32': values.astype(np.float32),
+        'bool': rng.random(n) < 0.5,
+        'int': rng.integers(-5, 5, n),
+    })
+    if shuffle:
+        df = df.sample(frac=1, random_state=seed).reset_index(drop=True)
+    return df
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('nan_tags', [False, True])
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_matches_groupby_agg(seed, nan_tags, shuffle):
+    df = make_daily_df(seed, nan_tags=nan_tags, shuffle=shuffle)
+    expected = df.groupby('周期').agg(AGG_DICT)
+    result = aggregate_by_period(df, '周期', AGG_DICT)
+    pd.testing.assert_frame_equal(result, expected, check_exact=True, check_index_type=False)
+
+
+def test_dict_input():
+    df = make_daily_df(0, shuffle=True)
+    expected = df.groupby('周期').agg(AGG_DICT)
+    result = aggregate_by_period({col: df[col].array for col in df.columns}, '周期', AGG_DICT)
+    pd.testing.assert_frame_equal(result, expected, check_exact=True, check_index_type=False)
+
+
+def test_kahan_sum_and_inf():
+    # 普通的逐个相加会丢失小的数值，Kahan 求和和 pandas 一致；正负无穷时补偿项需要重置
+    df = pd.DataFrame({
+        '周期': [1, 1, 1, 1, 2, 2, 2, 3, 3],
+        'float': [1e16, 1.0, 1.0, -1e16, np.inf, 1.0, 2.0, np.nan, np.nan],
+    })
+    agg_dict = {'float': ['sum', 'mean', 'count']}
+    expected = df.groupby('周期').agg(agg_dict)
+    pd.testing.assert_frame_equal(aggregate_by_period(df, '周期', agg_dict), expected, check_exact=True)
+    assert expected.loc[1, ('float', 'sum')] == 2.0
+
+
+def test_dtypes_preserved():
+    df = make_daily_df(1)
+    result = aggregate_by_period(df, '周期', AGG_DICT)
+    assert result[('int8', 'sum')].dtype == np.int8
+    assert result[('int8', 'last')].dtype == np.int8
+    assert result[('bool', 'sum')].dtype == np.int64
+    assert result[('bool', 'max')].dtype == bool
+    assert result[('float32', 'mean')].dtype == np.float32
+    assert result[('日期', 'last')].dtype == df['日期'].dtype
+    assert result[('名称', 'last')].dtype == df['名称'].dtype
+
+
+def test_empty():
+    df = make_daily_df(2).iloc[:0]
+    agg_dict = {'float': ['sum', 'last'], 'int': 'max'}
+    result = aggregate_by_period(df, '周期', agg_dict)
+    assert result.empty
+    assert list(result.columns) == [('float', 'sum'), ('float', 'last'), ('int', 'max')]
@@ -0,0 +1,115 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import rolling
+
+
+def _series_cases():
+    rng = np.random.default_rng(1)
+    n = 400
+    # 大数值和随机空值，包括一段常数（方差为0）和一段连续的空值（有效数据少于 min_periods）
+    noisy = rng.normal(0, 1, n) * 1e8
+    noisy[rng.random(n) < 0.1] = np.nan
+    noisy[100:130] = 5.0
+    noisy[200:260] = np.nan
+    return {
+        'noisy': noisy,
+        'price': np.cumprod(1 + rng.normal(0, 0.02, n)),
+        'ties': rng.integers(0, 5, n).astype(float),  # 大量相同的值
+        'leading_nan': np.concatenate([np.full(30, np.nan), rng.normal(size=100)]),
+        'short': np.array([1.0, np.nan, 3.0]),
+        'all_nan': np.full(10, np.nan),
+        'empty': np.array([], dtype=float),
+    }
+
+
+CASES = _series_cases()
+
+# (名称, rolling 模块中的计算, pandas 中对应的计算)
+ROLLING_METHODS = [
+    ('sum', lambda x, w, mp: rolling.rolling_sum(x, w, mp), lambda r: r.sum()),
+    ('mean', lambda x, w, mp: rolling.rolling_mean(x, w, mp), lambda r: r.mean()),
+    ('std', lambda x, w, mp: rolling.rolling_std(x, w, mp), lambda r: r.std()),
+    ('var', lambda x, w, mp: rolling.rolling_var(x, w, mp), lambda r: r.var()),
+    ('var_ddof0', lambda x, w, mp: rolling.rolling_var(x, w, mp, ddof=0), lambda r: r.var(ddof=0)),
+    ('min', lambda x, w, mp: rolling.rolling_min(x, w, mp), lambda r: r.min()),
+    ('max', lambda x, w, mp: rolling.rolling_max(x, w, mp), lambda r: r.max()),
+    ('rank', lambda x, w, mp: rolling.rolling_rank(x, w, mp), lambda r: r.rank()),
+    ('rank_desc_pct', lambda x, w, mp: rolling.rolling_rank(x, w, mp, ascending=False, pct=True),
+     lambda r: r.rank(ascending=False, pct=True)),
+]
+
+
+def assert_same(result, expected):
+    result, expected = np.asarray(result, dtype=float), np.asarray(expected, dtype=float)
+    assert result.shape == expected.shape
+    assert np.array_equal(result, expected, equal_nan=True)
+
+
+@pytest.mark.parametrize('method', ROLLING_METHODS, ids=[m[0] for m in ROLLING_METHODS])
+@pytest.mark.parametrize('case', list(CASES))
+@pytest.mark.parametrize('window', [1, 2, 5, 20])
+@pytest.mark.parametrize('min_periods', [None, 1, 3])
+def test_rolling_matches_pandas(method, case, window, min_periods):
+    _, func, pandas_func = method
+    values = CASES[case]
+    if min_periods is not None and min_periods > window:
+        with pytest.raises(ValueError):
+            func(values, window, min_periods)
+        return
+    expected = pandas_func(pd.Series(values).rolling(window, min_periods=min_periods))
+    assert_same(func(values, window, min_periods), expected)
+
+
+@pytest.mark.parametrize('case', list(CASES))
+@pytest.mark.parametrize('window, min_periods', [(1, None), (5, None), (20, 3)])
+def test_rolling_zscore(case, window, min_periods):
+    values = CASES[case]
+    rolling_window = pd.Series(values).rolling(window, min_periods=min_periods)
+    mean, std = rolling_window.mean(), rolling_window.std()
+    expected = ((pd.Series(values) - mean) / std).where(std != 0)
+    assert_same(rolling.rolling_zscore(values, window, min_periods), expected)
+
+
+@pytest.mark.parametrize('case', list(CASES))
+@pytest.mark.parametrize('span', [1, 2, 5, 20])
+@pytest.mark.parametrize('adjust', [True, False])
+@pytest.mark.parametrize('ignore_na', [True, False])
+@pytest.mark.parametrize('min_periods', [0, 3])
+def test_ewm_mean_matches_pandas(case, span, adjust, ignore_na, min_periods):
+    values = CASES[case]
+    expected = pd.Series(values).ewm(span=span, adjust=adjust, ignore_na=ignore_na, min_periods=min_periods).mean()
+    result = rolling.ewm_mean(values, span=span, adjust=adjust, ignore_na=ignore_na, min_periods=min_periods)
+    assert_same(result, expected)
+
+
+def test_rolling_slope_matches_polyfit():
+    rng = np.random.default_rng(2)
+    values = rng.normal(size=60)
+    values[[7, 25, 26]] = np.nan
+    window, min_periods = 10, 5
+    slope = rolling.rolling_slope(values, window, min_periods)
+    for i in range(len(values)):
+        segment = values[max(i - window + 1, 0):i + 1]
+        valid = ~np.isnan(segment)
+        if valid.sum() < min_periods:
+            assert np.isnan(slope[i])
+        else:
+            t = np.arange(len(segment))
+            assert slope[i] == pytest.approx(np.polyfit(t[valid], segment[valid], 1)[0], rel=1e-9, abs=1e-12)
+
+
+def test_wide_frame_matches_pandas():
+    # 宽表按列独立计算，返回相同索引的 DataFrame
+    rng = np.random.default_rng(3)
+    frame = pd.DataFrame(rng.normal(size=(200, 6)))
+    frame.iloc[:50, 2] = np.nan
+    frame.iloc[80:90, 4] = np.nan
+    result = rolling.rolling_std(frame, 10)
+    assert isinstance(result, pd.DataFrame)
+    pd.testing.assert_frame_equal(result, frame.rolling(10).std(), check_exact=True)
+    assert_same(rolling.rolling_mean(frame.to_numpy(), 10, 1), frame.rolling(10, min_periods=1).mean())
@@ -0,0 +1,65 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.selection import select_top_k
+
+
+def rank_select(dates, values, select_num, ascending=True):
+    """
+    按交易日期分组排名之后筛选，作为对照：
+    排名使用 rank(method='min')，选股数量小于1时按 当天股票数量（包括因子值为空的股票） * 比例 筛选
+    """
+    df = pd.DataFrame({'交易日期': dates, '因子': values})
+    df['rank'] = df.groupby('交易日期')['因子'].rank(method='min', ascending=ascending)
+    df['总股数'] = df.groupby('交易日期')['因子'].transform('size')
+    if int(select_num) == 0:
+        df = df[df['rank'] <= df['总股数'] * select_num]
+    else:
+        df = df[df['rank'] <= select_num]
+    df = df.assign(目标资金占比=1 / df.groupby('交易日期')['因子'].transform('size'))
+    # 按交易日期和排名排序，排名相同的保持原来的顺序
+    return df.sort_values(['交易日期', 'rank'], kind='mergesort')
+
+
+def make_data(seed, n=600):
+    rng = np.random.default_rng(seed)
+    dates = pd.to_datetime('2024-01-05') + pd.to_timedelta(rng.integers(0, 8, n) * 7, 'D')
+    # 因子值取值很少，有大量相同的排名，另外有空值
+    values = rng.integers(0, 15, n).astype(float)
+    values[rng.random(n) < 0.15] = np.nan
+    return dates.to_numpy(), values
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('select_num', [1, 3, 10, 40, 0.05, 0.1, 0.3, 0.999])
+@pytest.mark.parametrize('ascending', [True, False])
+def test_matches_groupby_rank(seed, select_num, ascending):
+    dates, values = make_data(seed)
+    expected = rank_select(dates, values, select_num, ascending)
+    row_index, rank, weight = select_top_k(dates, values, select_num, ascending=ascending)
+
+    np.testing.assert_array_equal(row_index, expected.index.to_numpy())
+    np.testing.assert_array_equal(rank, expected['rank'].to_numpy())
+    np.testing.assert_array_equal(weight, expected['目标资金占比'].to_numpy())
+
+
+def test_nothing_selected():
+    dates, values = make_data(0, n=20)
+    # 比例太小，每天选股数量都不足1只；或者因子值全部为空
+    for select_num, vals in [(0.01, values), (5, np.full(len(values), np.nan))]:
+        row_index, rank, weight = select_top_k(dates, vals, select_num)
+        assert len(row_index) == len(rank) == len(weight) == 0
+
+
+def test_ties_at_limit():
+    # 第2名有3只股票并列，选2只时并列的股票全部入选，每只分到 1/4 的资金
+    dates = np.array(['2024-01-05'] * 5, dtype='datetime64[ns]')
+    values = np.array([3.0, 1.0, 2.0, 2.0, 2.0])
+    row_index, rank, weight = select_top_k(dates, values, 2)
+    np.testing.assert_array_equal(row_index, [1, 2, 3, 4])
+    np.testing.assert_array_equal(rank, [1, 2, 2, 2])
+    np.testing.assert_array_equal(weight, [0.25] * 4)
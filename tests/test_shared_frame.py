@@ -0,0 +1,97 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.utils.shared_frame import SharedFrame
+
+
+def make_frame(n=50):
+    rng = np.random.default_rng(0)
+    names = np.array(['平安银行', '万科A', np.nan, '浦发银行'], dtype=object)[rng.integers(0, 4, n)]
+    return pd.DataFrame({
+        '交易日期': pd.bdate_range('2024-01-02', periods=n),
+        '股票代码': pd.Categorical(rng.choice(['sh600000', 'sz000001', 'sz000002'], n)),
+        '股票名称': pd.Series(names, dtype='str'),
+        '备注': pd.Series(names, dtype=object),
+        '收盘价': rng.random(n),
+        '成交量': rng.integers(0, 10000, n),
+        '一字涨停': rng.random(n) < 0.3,
+    })
+
+
+def read_in_worker(handle, start, length):
+    return SharedFrame.attach(handle).to_frame(start, length)
+
+
+def test_round_trip():
+    df = make_frame()
+    with SharedFrame.publish(df) as shared:
+        attached = SharedFrame.attach(shared.handle)
+        assert len(attached) == len(df)
+        pd.testing.assert_frame_equal(attached.to_frame(), df)
+        pd.testing.assert_frame_equal(attached.to_frame(copy=False), df)
+        SharedFrame.detach(shared.handle)
+
+
+@pytest.mark.parametrize('start, length', [(0, 10), (17, 5), (45, None), (40, 100), (50, None)])
+def test_row_slice(start, length):
+    df = make_frame()
+    stop = len(df) if length is None else start + length
+    expected = df.iloc[start:stop].reset_index(drop=True)
+    with SharedFrame.publish(df) as shared:
+        attached = SharedFrame.attach(shared.handle)
+        pd.testing.assert_frame_equal(attached.to_frame(start, length), expected)
+        pd.testing.assert_frame_equal(attached.to_frame(start, length, copy=False), expected)
+        SharedFrame.detach(shared.handle)
+
+
+def test_views_are_read_only():
+    df = make_frame()
+    with SharedFrame.publish(df) as shared:
+        attached = SharedFrame.attach(shared.handle)
+        view = attached.to_frame(copy=False)
+        with pytest.raises(ValueError):
+            view.loc[0, '收盘价'] = 1.0
+
+        # copy=True 的数据可以修改，不影响共享内存
+        copied = attached.to_frame()
+        copied.loc[0, '收盘价'] = -1.0
+        assert copied['收盘价'].iloc[0] == -1.0
+        assert attached.to_frame()['收盘价'].iloc[0] == df['收盘价'].iloc[0]
+
+        del view
+        SharedFrame.detach(shared.handle)
+
+
+def test_detach():
+    df = make_frame()
+    with SharedFrame.publish(df) as shared:
+        attached = SharedFrame.attach(shared.handle)
+        assert SharedFrame.attach(shared.handle) is attached
+
+        SharedFrame.detach(shared.handle)
+        assert shared.handle not in SharedFrame._attached
+        assert attached.shm.buf is None
+
+        # 关闭之后重新挂载，数据不受影响；重复关闭不会报错
+        pd.testing.assert_frame_equal(SharedFrame.attach(shared.handle).to_frame(), df)
+        SharedFrame.detach_all()
+        SharedFrame.detach(shared.handle)
+        assert not SharedFrame._attached
+
+
+def test_read_in_worker():
+    df = make_frame()
+    # 其他测试已经启动了 numba 的并行线程，使用 spawn 创建子进程，避免 fork 之后死锁
+    with SharedFrame.publish(df) as shared, ProcessPoolExecutor(
+        max_workers=2, mp_context=multiprocessing.get_context('spawn'), initializer=SharedFrame.init_worker
+    ) as executor:
+        futures = [executor.submit(read_in_worker, shared.handle, start, 10) for start in range(0, len(df), 10)]
+        result = pd.concat([future.result() for future in futures], ignore_index=True)
+    pd.testing.assert_frame_equal(result, df)
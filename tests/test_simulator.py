@@ -0,0 +1,131 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pytest
+
+from core.model.type_def import SSE_MAIN, SSE_STAR, SZSE_MAIN
+from core.rebalance import RebAlways
+from core.simulator import Simulator
+
+C_RATE = 0.001  # 券商佣金
+T_RATE = 0.002  # 印花税率
+
+
+def make_simulator(cash, pos_values, last_prices):
+    simulator = Simulator(cash, C_RATE, T_RATE, np.array(pos_values, dtype=np.float64))
+    simulator.fill_last_prices(np.array(last_prices, dtype=np.float64))
+    return simulator
+
+
+def test_trade_delta_sell_and_buy():
+    # 股票0 涨到 11 元，卖出 50 股；股票1 不交易；股票2 新买入 200 股
+    simulator = make_simulator(10000.0, [1000.0, 2000.0, 0.0], [10.0, 20.0, 5.0])
+    stamp_tax, commission = simulator.trade_delta(np.array([11.0, 20.0, 5.0]), np.array([-50.0, 0.0, 200.0]))
+
+    # 股票0 结算后仓位价值 1100，卖出 550；股票2 买入 1000
+    assert stamp_tax == pytest.approx(550 * T_RATE)  # 印花税只对卖出收取
+    assert commission == pytest.approx((550 + 1000) * C_RATE)  # 佣金买卖双向收取
+    assert simulator.cash == pytest.approx(10000 + 550 - 1000 - 550 * T_RATE - 1550 * C_RATE)
+    np.testing.assert_allclose(simulator.pos_values, [550.0, 2000.0, 1000.0])
+    assert simulator.n_held == 3
+    np.testing.assert_allclose(simulator.last_prices, [11.0, 20.0, 5.0])
+
+
+def test_trade_delta_sell_funds_buy():
+    # 没有现金，卖出所得用于买入，只对净额结算现金
+    simulator = make_simulator(0.0, [5000.0, 0.0], [10.0, 10.0])
+    stamp_tax, commission = simulator.trade_delta(np.array([10.0, 10.0]), np.array([-300.0, 290.0]))
+
+    assert stamp_tax == pytest.approx(3000 * T_RATE)
+    assert commission == pytest.approx(5900 * C_RATE)
+    assert simulator.cash == pytest.approx(3000 - 2900 - 3000 * T_RATE - 5900 * C_RATE)
+    np.testing.assert_allclose(simulator.pos_values, [2000.0, 2900.0])
+
+
+def test_trade_delta_buy_only_no_stamp_tax():
+    simulator = make_simulator(10000.0, [0.0, 0.0], [10.0, 10.0])
+    stamp_tax, commission = simulator.trade_delta(np.array([10.0, 25.0]), np.array([100.0, 200.0]))
+
+    assert stamp_tax == 0
+    assert commission == pytest.approx(6000 * C_RATE)
+    assert simulator.cash == pytest.approx(10000 - 6000 - 6000 * C_RATE)
+
+
+def test_trade_delta_remaining_below_one_cent_is_sold_out():
+    # 除权之后持仓 100.0005 股，卖出 100 股之后剩余不到 1 分钱，按清仓处理，卖出全部仓位价值
+    simulator = make_simulator(0.0, [1000.005, 500.0], [10.0, 10.0])
+    stamp_tax, commission = simulator.trade_delta(np.array([10.0, 10.0]), np.array([-100.0, 0.0]))
+
+    assert stamp_tax == pytest.approx(1000.005 * T_RATE)
+    assert commission == pytest.approx(1000.005 * C_RATE)
+    assert simulator.cash == pytest.approx(1000.005 * (1 - T_RATE - C_RATE))
+    assert simulator.pos_values[0] == 0
+    assert simulator.n_held == 1
+    assert simulator.held_idx[0] == 1
+
+
+def test_trade_delta_keeps_suspended_holding():
+    # 股票1 停牌（价格为空），仓位价值和最新价都保持不变
+    simulator = make_simulator(1000.0, [1000.0, 3000.0], [10.0, 30.0])
+    stamp_tax, commission = simulator.trade_delta(np.array([12.0, np.nan]), np.array([0.0, 0.0]))
+
+    assert stamp_tax == 0
+    assert commission == 0
+    assert simulator.cash == 1000.0
+    np.testing.assert_allclose(simulator.pos_values, [1200.0, 3000.0])
+    np.testing.assert_allclose(simulator.last_prices, [12.0, 30.0])
+
+    # 复牌之后按照停牌前的价格结算
+    simulator.settle_pos_values(np.array([12.0, 33.0]))
+    np.testing.assert_allclose(simulator.pos_values, [1200.0, 3300.0])
+
+
+def test_calc_delta_lots():
+    types = np.array([SSE_MAIN, SSE_STAR, SSE_STAR, SZSE_MAIN, SSE_MAIN, SZSE_MAIN], dtype=np.int16)
+    prices = np.array([10.0, 50.0, 50.0, 20.0, np.nan, 10.0])
+    ratios = np.array([0.45, 0.25, 0.25, 0.0, 0.0, 0.05])
+    pos_values = np.array([30050.0, 20000.0, 0.0, 3010.0, 5000.0, 10500.0])
+
+    # 可用权益 100000 * 0.97 = 97000
+    delta_pos = RebAlways(types).calc_delta_lots(100000.0, prices, ratios, pos_values)
+
+    expected = [
+        1200,  # 目标 43650 / 10 = 4365 -> 4300 股，当前 3005 股，差额 1295 向 0 取整到 1200
+        0,  # 科创板目标 24250 / 50 = 485 股，当前 400 股，差额 85 股不足 200 股，不交易
+        485,  # 科创板新买入 485 股，不需要是 100 的整数倍
+        -150.5,  # 目标为 0，卖出全部持仓，包括零股
+        0,  # 停牌，保持当前持仓
+        -600,  # 目标 4850 / 10 = 485 -> 400 股，当前 1050 股，卖出 650 向 0 取整到 600
+    ]
+    np.testing.assert_allclose(delta_pos, expected)
+
+
+def test_calc_delta_lots_star_below_200_sells_all():
+    # 科创板目标不足 200 股时目标为 0，卖出全部持仓
+    types = np.array([SSE_STAR, SSE_MAIN], dtype=np.int16)
+    prices = np.array([100.0, 10.0])
+    ratios = np.array([0.1, 0.9])
+    pos_values = np.array([25000.0, 0.0])
+
+    # 科创板目标 97000 * 0.1 / 100 = 97 股，不足 200 股；主板目标 8730 股 -> 8700 股
+    delta_pos = RebAlways(types).calc_delta_lots(100000.0, prices, ratios, pos_values)
+    np.testing.assert_allclose(delta_pos, [-250.0, 8700.0])
+
+
+def test_delta_rebalance_round_trip():
+    # 计算差额之后执行交易，现金和仓位价值与手工计算一致
+    types = np.array([SSE_MAIN, SZSE_MAIN], dtype=np.int16)
+    prices = np.array([10.0, 20.0])
+    simulator = make_simulator(20000.0, [80000.0, 0.0], [10.0, 20.0])
+
+    equity = simulator.cash + simulator.get_pos_value()
+    delta_pos = RebAlways(types).calc_delta_lots(equity, prices, np.array([0.5, 0.5]), simulator.pos_values)
+    # 每只股票目标 48500 元：股票0 目标 4850 -> 4800 股，卖出 3200 股；股票1 目标 2425 -> 2400 股
+    np.testing.assert_allclose(delta_pos, [-3200.0, 2400.0])
+
+    stamp_tax, commission = simulator.trade_delta(prices, delta_pos)
+    assert stamp_tax == pytest.approx(32000 * T_RATE)
+    assert commission == pytest.approx((32000 + 48000) * C_RATE)
+    assert simulator.cash == pytest.approx(20000 + 32000 - 48000 - 32000 * T_RATE - 80000 * C_RATE)
+    np.testing.assert_allclose(simulator.pos_values, [48000.0, 48000.0])
@@ -0,0 +1,139 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pytest
+
+import core.equity as equity
+from core.model.type_def import SimuParams
+from core.rebalance import RebAlways
+from tests.test_equity import SYMBOLS, TRADING_DATES, make_frames, make_market
+
+
+class DenseSimulator:
+    """
+    稀疏持仓之前的实现（每次处理全部股票），作为对照
+    """
+
+    def __init__(self, init_capital, commission_rate, stamp_tax_rate, init_pos_values):
+        self.cash = init_capital
+        self.commission_rate = commission_rate
+        self.stamp_tax_rate = stamp_tax_rate
+        self.pos_values = np.array(init_pos_values, dtype=np.float64)
+        self.last_prices = np.zeros(len(init_pos_values), dtype=np.float64)
+
+    def fill_last_prices(self, prices):
+        mask = np.logical_not(np.isnan(prices))
+        self.last_prices[mask] = prices[mask]
+
+    def settle_pos_values(self, prices):
+        mask = np.logical_and(self.pos_values > 1e-6, np.logical_not(np.isnan(prices)))
+        self.pos_values[mask] *= prices[mask] / self.last_prices[mask]
+
+    def get_pos_value(self):
+        return np.sum(self.pos_values)
+
+    def sell_all(self, exec_prices):
+        self.settle_pos_values(exec_prices)
+        pos_values_total = np.sum(self.pos_values)
+        stamp_tax = pos_values_total * self.stamp_tax_rate
+        commission = pos_values_total * self.commission_rate
+        self.cash += pos_values_total - stamp_tax - commission
+        self.pos_values[:] = 0
+        self.fill_last_prices(exec_prices)
+        return stamp_tax, commission
+
+    def buy_stocks(self, exec_prices, target_pos):
+        self.settle_pos_values(exec_prices)
+        mask = target_pos > 0
+        buy_values = exec_prices[mask] * target_pos[mask]
+        self.pos_values[mask] = buy_values
+        commission = np.sum(self.pos_values * self.commission_rate)
+        self.cash -= np.sum(buy_values) + commission
+        self.fill_last_prices(exec_prices)
+        return commission
+
+    def trade_delta(self, exec_prices, delta_pos):
+        self.settle_pos_values(exec_prices)
+        traded = delta_pos != 0
+        trade_values = np.zeros(len(delta_pos), dtype=np.float64)
+        trade_values[traded] = exec_prices[traded] * delta_pos[traded]
+        new_values = self.pos_values + trade_values
+
+        # 剩余不到 1 分钱，视为清仓
+        sold_out = (trade_values < 0) & (new_values < 0.01)
+        sold = (trade_values < 0) & np.logical_not(sold_out)
+        sell_values_total = np.sum(self.pos_values[sold_out]) - np.sum(trade_values[sold])
+        buy_values_total = np.sum(trade_values[trade_values > 0])
+        self.pos_values[traded] = new_values[traded]
+        self.pos_values[sold_out] = 0
+
+        stamp_tax = sell_values_total * self.stamp_tax_rate
+        commission = (sell_values_total + buy_values_total) * self.commission_rate
+        self.cash += sell_values_total - buy_values_total - stamp_tax - commission
+        self.fill_last_prices(exec_prices)
+        return stamp_tax, commission
+
+
+def dense_simulation(market, simu_params, adj_dts, ratios, pos_calc, delta):
+    """
+    和 run_simulation 相同的日线交易流程，使用 DenseSimulator
+    """
+    n_bars = len(market.candle_begin_ts)
+    cashes = np.zeros(n_bars, dtype=np.float64)
+    pos_values = np.zeros(n_bars, dtype=np.float64)
+
+    simu = DenseSimulator(
+        simu_params.init_cash, simu_params.commission_rate, simu_params.stamp_tax_rate, np.zeros(len(market.types))
+    )
+    idx_adj = 0
+    buy_next_open = False
+    for idx_bar in range(n_bars):
+        simu.fill_last_prices(market.pre_cl[idx_bar])
+        simu.settle_pos_values(market.op[idx_bar])
+        simu.fill_last_prices(market.op[idx_bar])
+
+        if buy_next_open and delta:
+            equity_ = simu.cash + simu.get_pos_value()
+            delta_pos = pos_calc.calc_delta_lots(equity_, market.op[idx_bar], ratios[idx_adj], simu.pos_values)
+            idx_adj += 1
+            buy_next_open = False
+            simu.trade_delta(market.op[idx_bar], delta_pos)
+        elif buy_next_open:
+            target_pos = pos_calc.calc_lots(simu.cash, market.op[idx_bar], ratios[idx_adj])
+            idx_adj += 1
+            buy_next_open = False
+            simu.buy_stocks(market.op[idx_bar], target_pos)
+        elif idx_adj < len(adj_dts) and adj_dts[idx_adj] == market.candle_begin_ts[idx_bar]:
+            if not delta:
+                simu.sell_all(market.cl[idx_bar])
+            buy_next_open = True
+
+        simu.settle_pos_values(market.cl[idx_bar])
+        pos_values[idx_bar] = simu.get_pos_value()
+        cashes[idx_bar] = simu.cash
+
+    return cashes, pos_values
+
+
+@pytest.mark.parametrize('delta', [False, True])
+@pytest.mark.parametrize('seed', range(5))
+def test_sparse_simulator_equals_dense(seed, delta):
+    # 随机行情中包含停牌（开盘价和前收盘价为空）和除权除息，持仓股票停牌时仓位价值保持不变
+    rng = np.random.default_rng(seed)
+    market = make_market(make_frames(seed), TRADING_DATES, SYMBOLS)
+    params = SimuParams(100000.0, 1.2 / 10000, 1 / 1000)
+    pos_calc = RebAlways(market.types)
+
+    adj_idx = np.arange(int(rng.integers(0, 5)), len(TRADING_DATES), int(rng.integers(2, 6)))
+    adj_dts = market.candle_begin_ts[adj_idx]
+    ratios = rng.dirichlet(np.ones(len(SYMBOLS)), size=len(adj_idx))
+    ratios[rng.random(ratios.shape) < 0.4] = 0
+
+    cashes, pos_values, _, _ = equity.start_simulation(market, params, adj_dts, ratios, pos_calc, delta)
+    dense_cashes, dense_pos_values = dense_simulation(market, params, adj_dts, ratios, pos_calc, delta)
+
+    # 有持仓的交易日中存在停牌的股票
+    assert (np.isnan(market.op) & (pos_values[:, None] > 0)).any()
+    np.testing.assert_allclose(cashes, dense_cashes, rtol=1e-12)
+    np.testing.assert_allclose(pos_values, dense_pos_values, rtol=1e-12)
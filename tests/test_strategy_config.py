@@ -0,0 +1,88 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.model.strategy_config import FilterFactorConfig, filter_common, filter_series_by_range
+
+# 过滤范围的边界值都会在数据中出现：因子值是小整数，每天的股票数量少，排名和排名百分比经常正好等于边界
+RANGES = {
+    'rank': ['<=3', '<3', '>=2', '>2', '==2.5', '!=1'],
+    'pct': ['<=0.4', '<0.4', '>=0.5', '>0.5', '==0.5', '!=1'],
+    'val': ['<=2', '<2', '>=3', '>3', '==1', '!=4'],
+}
+
+
+def rule_filter_common(df, filter_list):
+    """
+    逐个过滤条件计算的实现（每个条件单独分组排名），作为对照
+    """
+    condition = pd.Series(True, index=df.index)
+    for filter_config in filter_list:
+        col_name = filter_config.col_name
+        match filter_config.method.how:
+            case 'rank':
+                rank = df.groupby('交易日期')[col_name].rank(ascending=filter_config.is_sort_asc, pct=False)
+                condition = condition & filter_series_by_range(rank, filter_config.method.range)
+            case 'pct':
+                rank = df.groupby('交易日期')[col_name].rank(ascending=filter_config.is_sort_asc, pct=True)
+                condition = condition & filter_series_by_range(rank, filter_config.method.range)
+            case 'val':
+                condition = condition & filter_series_by_range(df[col_name], filter_config.method.range)
+    return condition
+
+
+def make_data(rng):
+    # 每天 1 到 10 只股票，因子值有重复，并且有 20% 的空值
+    sizes = rng.integers(1, 11, 30)
+    dates = np.repeat(pd.bdate_range('2024-01-02', periods=len(sizes)).to_numpy(), sizes)
+    df = pd.DataFrame({'交易日期': dates})
+    for col in ('市值_None', 'Ret_5'):
+        values = rng.integers(0, 6, len(df)).astype(float)
+        values[rng.random(len(df)) < 0.2] = np.nan
+        df[col] = values
+    # 打乱行的顺序，索引不连续
+    return df.sample(frac=1, random_state=int(rng.integers(1 << 31))).set_index(rng.permutation(len(df)) * 3)
+
+
+def make_filter_list(rng):
+    filter_list = []
+    for _ in range(rng.integers(1, 6)):
+        how = str(rng.choice(list(RANGES)))
+        name, param = [('市值', None), ('Ret', 5)][rng.integers(2)]
+        filter_list.append(FilterFactorConfig.init(
+            (name, param, f'{how}:{rng.choice(RANGES[how])}', bool(rng.integers(2)))
+        ))
+    return filter_list
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_filter_common_equals_rule_evaluation(seed):
+    rng = np.random.default_rng(seed)
+    df = make_data(rng)
+    filter_list = make_filter_list(rng)
+
+    pd.testing.assert_series_equal(filter_common(df, filter_list), rule_filter_common(df, filter_list))
+
+
+def test_filter_common_boundaries():
+    # 一天 5 只股票，一只因子值为空，并列的因子值排名取平均，排名百分比按因子值不为空的 4 只股票计算
+    df = pd.DataFrame({
+        '交易日期': pd.to_datetime(['2024-01-02'] * 5),
+        '市值_None': [1.0, 2.0, 3.0, 3.0, np.nan],
+    })
+
+    def run(*rules):
+        return filter_common(df, [FilterFactorConfig.init(('市值', None, rule)) for rule in rules]).tolist()
+
+    # 排名 1, 2, 3.5, 3.5, 空
+    assert run('rank:<=2') == [True, True, False, False, False]
+    assert run('rank:>=3.5') == [False, False, True, True, False]
+    # 排名百分比 0.25, 0.5, 0.875, 0.875, 空
+    assert run('pct:<=0.5') == [True, True, False, False, False]
+    assert run('pct:<0.5') == [True, False, False, False, False]
+    assert run('val:>=2', 'val:<=3') == [False, True, True, True, False]
+    # 空值和任何数值都不相等
+    assert run('val:!=2') == [True, False, True, True, True]
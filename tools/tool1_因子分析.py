@@ -10,6 +10,7 @@ import pandas as pd
 import tools.utils.pfunctions as PFun
 import tools.utils.tfunctions as tFun
 
+from core.data_store import get_period_df_path
 from core.utils.path_kit import get_file_path
 from core.model.backtest_config import BacktestConfig, load_config
 
@@ -67,7 +68,7 @@ def factor_analysis(conf: BacktestConfig, factor_name: str) -> None:
     :param factor_name: 因子名称，需要再因子计算结果中有相应的字段，如反转策略中的'Ret_5'
     :return: None
     """
-    factor_data_path = get_file_path('data', '运行缓存', '因子计算结果.pkl', auto_create=False)  # 因子计算结果的绝对路径
+    factor_data_path = get_period_df_path(conf.strategy.hold_period_name)  # 因子计算结果的绝对路径
 
     print(f'✅ 开始分析{factor_name}因子')
 
@@ -11,6 +11,7 @@ import pandas as pd
 
 import tools.utils.pfunctions as PFun
 import tools.utils.tfunctions as tFun
+from core.data_store import CandleStore, MarketPivot
 from core.model.backtest_config import load_config, BacktestConfig
 from core.utils.path_kit import get_file_path
 
@@ -63,12 +64,11 @@ def process_select_data(conf: BacktestConfig, k_start: str, k_end: str) -> pd.Da
     # === 利用数据透视表计算股票的下周期涨跌幅
     select[['下一持有周期开始日期', '下一持有周期结束日期']] = select['持有周期'].str.split('--', expand=True).apply(
         pd.to_datetime)
-    stock_ts_path = get_file_path('data/运行缓存/全部股票行情pivot.pkl')  # 获取全部股票行情的pivot表
+    market_pivot = MarketPivot()  # 获取全部股票行情的pivot表
 
     # 利用前收盘价和收盘价计算收盘价后复权数据
-    stock_ts_dict = pd.read_pickle(stock_ts_path)
-    stock_ts_close = stock_ts_dict['close'][select['股票代码'].unique()].stack().reset_index(name='close')
-    stock_ts_preclose = stock_ts_dict['preclose'][select['股票代码'].unique()].stack().reset_index(name='preclose')
+    stock_ts_close = market_pivot.to_frame('close', select['股票代码'].unique()).stack().reset_index(name='close')
+    stock_ts_preclose = market_pivot.to_frame('preclose', select['股票代码'].unique()).stack().reset_index(name='preclose')
     stock_data = stock_ts_preclose.merge(stock_ts_close, on=['交易日期', '股票代码'], how='left')
     stock_data.sort_values(by=['股票代码', '交易日期'], inplace=True)
     stock_data['复权因子'] = stock_data.groupby('股票代码').apply(
@@ -170,8 +170,8 @@ def plot_stock_kline(conf: BacktestConfig, k_start: str, k_end: str, add_days=12
     d_start = pd.to_datetime(k_start) - pd.to_timedelta(f'{add_days}d')  # K线开始时间
     d_end = pd.to_datetime(k_end) + pd.to_timedelta(f'{add_days}d')  # K线结束时间
 
-    # 读取全部k线数据
-    all_stock_dict = pd.read_pickle(get_file_path('data/运行缓存/股票预处理数据.pkl'))
+    # 按需读取k线数据
+    candle_store = CandleStore()
 
     fig_save_path = save_path / f'选股行情图/'
     os.makedirs(fig_save_path, exist_ok=True)
@@ -185,7 +185,7 @@ def plot_stock_kline(conf: BacktestConfig, k_start: str, k_end: str, add_days=12
         name = all_res.loc[i, '股票名称']
         print(f'正在绘制：第{i + 1}/{total_stock_num}个 {code}_{name}')
         # 读取股票信息
-        df = all_stock_dict[code]
+        df = candle_store.read(code)
         df = df[(df['交易日期'] >= d_start) & (df['交易日期'] <= d_end)]
         df['开盘买入涨跌幅'] = df['收盘价'] / df['开盘价'] - 1
         # 获取所有的买入时间点
@@ -0,0 +1,101 @@
+"""
+未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from core import rolling
+
+pd.set_option('expand_frame_repr', False)  # 使数据框在控制台显示不换行
+pd.set_option('display.unicode.ambiguous_as_wide', True)
+pd.set_option('display.unicode.east_asian_width', True)
+
+# 对比的计算方式：名称 -> (core.rolling 的计算函数, pandas 的计算函数)
+CASES = {
+    'sum': (lambda x, n: rolling.rolling_sum(x, n), lambda s, n: s.rolling(n).sum()),
+    'mean': (lambda x, n: rolling.rolling_mean(x, n), lambda s, n: s.rolling(n).mean()),
+    'mean(min_periods=1)': (lambda x, n: rolling.rolling_mean(x, n, min_periods=1),
+                            lambda s, n: s.rolling(n, min_periods=1).mean()),
+    'std': (lambda x, n: rolling.rolling_std(x, n), lambda s, n: s.rolling(n).std()),
+    'min': (lambda x, n: rolling.rolling_min(x, n), lambda s, n: s.rolling(n).min()),
+    'max': (lambda x, n: rolling.rolling_max(x, n), lambda s, n: s.rolling(n).max()),
+    'rank': (lambda x, n: rolling.rolling_rank(x, n), lambda s, n: s.rolling(n).rank()),
+    'ewm': (lambda x, n: rolling.ewm_mean(x, span=n), lambda s, n: s.ewm(span=n).mean()),
+}
+
+
+def make_data(n_stocks: int, n_days: int, seed: int = 0) -> pd.DataFrame:
+    """
+    生成模拟的成交额宽表，index为交易日期，columns为股票代码，上市之前和停牌的日期为空值
+    """
+    rng = np.random.default_rng(seed)
+    values = np.exp(rng.normal(18, 1, size=(n_days, n_stocks)))
+    values[rng.random(size=values.shape) < 0.02] = np.nan  # 停牌
+    list_days = rng.integers(0, n_days, size=n_stocks)
+    values[np.arange(n_days)[:, None] < list_days[None, :]] = np.nan  # 上市之前
+    dates = pd.bdate_range('2010-01-01', periods=n_days)
+    return pd.DataFrame(values, index=dates, columns=[f'sh{600000 + i}' for i in range(n_stocks)])
+
+
+def time_it(func, repeat: int = 3) -> float:
+    """
+    重复执行取最短的耗时，单位为秒
+    """
+    cost = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        cost.append(time.perf_counter() - start)
+    return min(cost)
+
+
+def compare(panel: pd.DataFrame, window: int) -> pd.DataFrame:
+    """
+    分别按股票逐个计算（和 add_factor 一样）以及按宽表计算（和 add_factor_panel 一样），对比耗时和结果差异
+    """
+    # 按股票逐个计算时，只保留上市之后的数据
+    series_list = [panel[code].iloc[panel[code].notna().argmax():] for code in panel.columns]
+    rows = []
+    for name, (nb_func, pd_func) in CASES.items():
+        # 先调用一次，排除numba编译的耗时
+        nb_func(series_list[0], window)
+
+        def nb_by_stock():
+            return [nb_func(s, window) for s in series_list]
+
+        def pd_by_stock():
+            return [pd_func(s, window) for s in series_list]
+
+        diff = max(
+            np.nanmax(np.abs(np.asarray(a) - np.asarray(b)), initial=0)
+            for a, b in zip(nb_by_stock(), pd_by_stock())
+        )
+        panel_diff = np.nanmax(np.abs(nb_func(panel, window).to_numpy() - pd_func(panel, window).to_numpy()), initial=0)
+
+        nb_stock_cost, pd_stock_cost = time_it(nb_by_stock), time_it(pd_by_stock)
+        nb_panel_cost, pd_panel_cost = time_it(lambda: nb_func(panel, window)), time_it(lambda: pd_func(panel, window))
+        rows.append({
+            '计算方式': name,
+            '逐个股票_numba(秒)': nb_stock_cost,
+            '逐个股票_pandas(秒)': pd_stock_cost,
+            '逐个股票_加速倍数': pd_stock_cost / nb_stock_cost,
+            '宽表_numba(秒)': nb_panel_cost,
+            '宽表_pandas(秒)': pd_panel_cost,
+            '宽表_加速倍数': pd_panel_cost / nb_panel_cost,
+            '最大误差': max(diff, panel_diff),
+        })
+    return pd.DataFrame(rows).set_index('计算方式')
+
+
+if __name__ == '__main__':
+    # ====== 配置信息 ======
+    stock_num = 2000  # 模拟的股票数量
+    day_num = 2500  # 模拟的交易日数量，约10年
+    window_list = [5, 20, 120]  # 滚动窗口的长度
+
+    data = make_data(stock_num, day_num)
+    for n in window_list:
+        print(f'\n股票数量：{stock_num}，交易日数量：{day_num}，窗口长度：{n}')
+        print(compare(data, n).round(4))
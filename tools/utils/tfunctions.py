@@ -6,6 +6,8 @@ import pandas as pd
 from pathlib import Path
 from typing import Union
 
+from core.model.type_def import NAME_DELIST, NAME_S, NAME_ST, NAME_STAR
+
 
 def float_num_process(num, return_type=float, keep=2, max=5):
     """
@@ -44,17 +46,12 @@ def float_num_process(num, return_type=float, keep=2, max=5):
 def filter_stock(df: pd.DataFrame) -> pd.DataFrame:
     """
     过滤函数，ST/退市/交易天数不足等情况
-    :param df: 原始数据，包含股票名称、交易日期、开盘价、收盘价、交易量、交易额、市场交易天数等信息
+    :param df: 原始数据，包含名称状态、交易日期、开盘价、收盘价、交易量、交易额、市场交易天数等信息
     :return df:返回过滤后的df
     """
     # =删除不能交易的周期数
-    # 删除月末为st状态的周期数
-    df = df[df['股票名称'].str.contains('ST') == False]
-    # 删除月末为s状态的周期数
-    df = df[df['股票名称'].str.contains('S') == False]
-    # 删除月末有退市风险的周期数
-    df = df[df['股票名称'].str.contains('\*') == False]
-    df = df[df['股票名称'].str.contains('退') == False]
+    # 删除月末为st状态、s状态、有退市风险（名称包含 * 或者 退）的周期数，名称状态在step1中已经由股票名称算好
+    df = df[(df['名称状态'] & (NAME_ST | NAME_S | NAME_STAR | NAME_DELIST)) == 0]
     # 删除交易天数过少的周期数
     df = df[df['交易天数'] / df['市场交易天数'] >= 0.8]
     df = df[df['下日_是否交易'] == 1]
@@ -1,6 +1,7 @@
 """
 未经授权，不得复制、修改、或使用本代码的全部或部分内容。仅限个人学习用途，禁止商业用途。
 """
+import numpy as np
 import pandas as pd
 
 fin_cols = []  # 财务因子列
@@ -32,4 +33,38 @@ def add_factor(df: pd.DataFrame, param, fin_data=None, **kwargs) -> (pd.DataFram
     # 定义因子聚合方式，这里选择获取最新的因子值
     agg_dict = {col_name: 'last'}
 
-    return factor_df, agg_dict
\ No newline at end of file
+    return factor_df, agg_dict
+
+
+# noinspection PyUnusedLocal
+def add_factors(df: pd.DataFrame, params, fin_data=None, **kwargs) -> (pd.DataFrame, dict):
+    """
+    批量计算多个参数下的近期涨跌幅，复权收盘价只需要取出一次，结果和逐个调用 add_factor 一致。
+
+    :param df: 输入的K线数据，包含各类市场指标。
+    :param params: 策略参数的列表。
+    :param fin_data: 财务数据字典，这里不需要。
+    :param kwargs: 其他关键字参数，包括因子名称的列表（'col_names'），和params一一对应。
+    :return:
+        tuple:
+            pd.DataFrame: 包含全部参数的因子数据，索引与输入的df一致。
+            dict: 聚合字典，指定因子数据的聚合方式。
+    """
+    col_names = kwargs['col_names']
+    close = df['收盘价_复权'].to_numpy(dtype=np.float64)
+
+    factor_dict = {}
+    for param, col_name in zip(params, col_names):
+        n = int(param)
+        if n <= 0:
+            factor_dict[col_name] = df['收盘价_复权'].pct_change(param).to_numpy()
+            continue
+        # 近期涨跌幅 = 收盘价 / n 天前的收盘价 - 1，和 pct_change(n) 的计算方式相同
+        factor_col = np.full(len(close), np.nan)
+        factor_col[n:] = close[n:] / close[:-n] - 1
+        factor_dict[col_name] = factor_col
+
+    factor_df = pd.DataFrame(factor_dict, index=df.index)
+    agg_dict = {col_name: 'last' for col_name in col_names}
+
+    return factor_df, agg_dict
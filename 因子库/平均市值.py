@@ -3,10 +3,19 @@
 """
 import pandas as pd
 
+from core.utils.intermediate import Intermediates
+
 # 财务因子列：此列表用于存储财务因子相关的列名称
 fin_cols = []  # 财务因子列，配置后系统会自动加载对应的财务数据
 
 
+def get_intermediates(param) -> list:
+    """
+    总市值的均值（min_periods=1），和其他使用相同窗口的因子共用
+    """
+    return [f'总市值_mean_{int(param)}_1']
+
+
 def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
     """
     计算并将新的因子列添加到股票行情数据中，并返回包含计算因子的DataFrame及其聚合方式。
@@ -38,7 +47,8 @@ def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
 
     # ======================== 计算因子 ===========================
     # 我们这里的市值因子使用总市值的数值，并且获取最近n个交易日的平均值
-    df[col_name] = df['总市值'].rolling(n, min_periods=1).mean()
+    intermediates = kwargs.get('intermediates') or Intermediates(df)
+    df[col_name] = intermediates[f'总市值_mean_{n}_1']
 
     # ======================== 聚合方式 ===========================
     # 定义因子聚合方式，这里使用'last'表示在周期转换时保留该因子的最新值
@@ -53,3 +63,22 @@ def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
 
     # 返回新计算的因子列以及因子聚合方式
     return df[[col_name]], agg_rules
+
+
+def add_factor_panel(panel, param=None, **kwargs) -> (pd.DataFrame, dict):
+    """
+    在总市值宽表上按列滚动求最近n日的均值（min_periods=1），直接使用共用的中间结果。
+    上市之前总市值为空值，不计入窗口，所以上市第一天的因子值就是当天的总市值，和按股票计算一致。
+
+    :param panel: FactorPanel，panel['总市值_mean_n_1'] 返回总市值均值的宽表。
+    :param param: 均值的窗口长度n。
+    :param kwargs: 其他关键字参数，包括：
+        - col_name: 新计算的因子列名。
+    :return: tuple
+        - pd.DataFrame: 因子数值的宽表，index为交易日期，columns为股票代码。
+        - dict: 聚合方式字典。
+    """
+    col_name = kwargs['col_name']
+    factor_df = panel[f'总市值_mean_{int(param)}_1']
+
+    return factor_df, {col_name: 'last'}
@@ -3,10 +3,19 @@
 """
 import pandas as pd
 
+from core.utils.intermediate import Intermediates
+
 # 财务因子列：此列表用于存储财务因子相关的列名称
 fin_cols = []  # 财务因子列，配置后系统会自动加载对应的财务数据
 
 
+def get_intermediates(param) -> list:
+    """
+    成交额的标准差，和成交额缩波因子等使用相同窗口的因子共用
+    """
+    return [f'成交额_std_{int(param)}']
+
+
 def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
     """
     计算并将新的因子列添加到股票行情数据中，并返回包含计算因子的DataFrame及其聚合方式。
@@ -37,8 +46,9 @@ def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
     n = int(param)  # 将参数转换为整数
 
     # ======================== 计算因子 ===========================
-    # 计算成交额的标准差
-    df[col_name] = df['成交额'].rolling(n).std()
+    # 计算成交额的标准差，使用和其他因子共用的中间结果
+    intermediates = kwargs.get('intermediates') or Intermediates(df)
+    df[col_name] = intermediates[f'成交额_std_{n}']
 
     # ======================== 聚合方式 ===========================
     # 定义因子聚合方式，这里使用'last'表示在周期转换时保留该因子的最新值
@@ -53,3 +63,44 @@ def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
 
     # 返回新计算的因子列以及因子聚合方式
     return df[[col_name]], agg_rules
+
+
+def add_factors(df: pd.DataFrame, params=(), **kwargs) -> (pd.DataFrame, dict):
+    """
+    一次取出多个窗口的成交额标准差，不需要为每个参数复制K线数据。
+    标准差是中间结果，其他因子（比如成交额缩波因子）已经算过相同窗口时直接复用。
+
+    :param df: 单只股票的K线数据，需要包括成交额。
+    :param params: 标准差窗口长度的列表。
+    :param kwargs: 包括和params一一对应的因子列名（'col_names'），以及共用的中间结果（'intermediates'）。
+    :return: 全部窗口的成交额标准差，以及聚合方式（保留最新值）。
+    """
+    col_names = kwargs['col_names']
+
+    intermediates = kwargs.get('intermediates') or Intermediates(df)
+    factor_df = pd.DataFrame(
+        {col_name: intermediates[f'成交额_std_{int(param)}'] for param, col_name in zip(params, col_names)},
+        index=df.index,
+    )
+    agg_rules = {col_name: 'last' for col_name in col_names}
+
+    return factor_df, agg_rules
+
+
+def add_factor_panel(panel, param=None, **kwargs) -> (pd.DataFrame, dict):
+    """
+    在成交额宽表上按列滚动求最近n日的标准差，窗口需要满n个交易日。
+    上市之前成交额为空值，窗口从上市第一天开始计数，上市不足n个交易日的因子值为空，和按股票计算一致。
+
+    :param panel: FactorPanel，panel['成交额_std_n'] 返回成交额标准差的宽表。
+    :param param: 标准差的窗口长度n。
+    :param kwargs: 其他关键字参数，包括：
+        - col_name: 新计算的因子列名。
+    :return: tuple
+        - pd.DataFrame: 因子数值的宽表，index为交易日期，columns为股票代码。
+        - dict: 聚合方式字典。
+    """
+    col_name = kwargs['col_name']
+    factor_df = panel[f'成交额_std_{int(param)}']
+
+    return factor_df, {col_name: 'last'}
@@ -3,9 +3,18 @@
 """
 import pandas as pd
 
+from core.utils.intermediate import Intermediates
+
 fin_cols = []  # 财务因子列
 
 
+def get_intermediates(param) -> list:
+    """
+    成交额的短期、长期均值，和其他使用相同窗口的因子共用
+    """
+    return [f'成交额_mean_{param[0]}', f'成交额_mean_{param[1]}']
+
+
 # noinspection PyUnusedLocal
 def add_factor(df: pd.DataFrame, param, fin_data=None, **kwargs) -> (pd.DataFrame, dict):
     """
@@ -27,11 +36,13 @@ def add_factor(df: pd.DataFrame, param, fin_data=None, **kwargs) -> (pd.DataFram
     long = param[1]
     # 从额外参数中获取因子名称
     col_name = kwargs['col_name']
+    # 计算因子时共用的中间结果
+    intermediates = kwargs.get('intermediates') or Intermediates(df)
 
     # 计算短期的成交额均值
-    short_mean = df['成交额'].rolling(short).mean()
+    short_mean = intermediates[f'成交额_mean_{short}']
     # 计算长期的成交额均值
-    long_mean = df['成交额'].rolling(long).mean()
+    long_mean = intermediates[f'成交额_mean_{long}']
     # 计算成交额缩量因子
     factor_col = short_mean / long_mean
 
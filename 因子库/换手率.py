@@ -3,9 +3,23 @@
 """
 import pandas as pd
 
+from core.utils.intermediate import IntermediateGraph, Intermediates
+
 # 财务因子列：此列表用于存储财务因子相关的列名称
 fin_cols = []  # 财务因子列，配置后系统会自动加载对应的财务数据
 
+# 自定义的中间结果：每日的换手率
+intermediate_funcs = {
+    '日换手率': (('成交额', '流通市值'), lambda amount, float_mv: amount / float_mv),
+}
+
+
+def get_intermediates(param) -> list:
+    """
+    换手率的均值，不同参数共用同一个日换手率
+    """
+    return [f'日换手率_mean_{int(param)}']
+
 
 def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
     """
@@ -35,9 +49,9 @@ def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
     # 从kwargs中提取因子列的名称，这里使用'col_name'来标识因子列名称
     col_name = kwargs['col_name']
     # ======================== 计算因子 ===========================
-    # 我们这里的市值因子使用总市值的数值
-    turnover_rate = df['成交额'] / df['流通市值']
-    df[col_name] = turnover_rate.rolling(param).mean()
+    # 换手率 = 成交额 / 流通市值，计算最近param个交易日的均值
+    intermediates = kwargs.get('intermediates') or Intermediates(df, IntermediateGraph(intermediate_funcs))
+    df[col_name] = intermediates[f'日换手率_mean_{int(param)}']
 
     # ======================== 聚合方式 ===========================
     # 定义因子聚合方式，这里使用'last'表示在周期转换时保留该因子的最新值
@@ -52,3 +66,25 @@ def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
 
     # 返回新计算的因子列以及因子聚合方式
     return df[[col_name]], agg_rules
+
+
+def add_factors(df: pd.DataFrame, params=(), **kwargs) -> (pd.DataFrame, dict):
+    """
+    一次计算多个窗口的平均换手率：日换手率（成交额 / 流通市值）只算一次，每个参数在它上面取不同窗口的均值。
+
+    :param df: 单只股票的K线数据，需要包括成交额和流通市值。
+    :param params: 均值窗口长度的列表。
+    :param kwargs: 包括和params一一对应的因子列名（'col_names'），以及共用的中间结果（'intermediates'）。
+    :return: 全部窗口的平均换手率，以及聚合方式（保留最新值）。
+    """
+    col_names = kwargs['col_names']
+
+    # 单独调用时没有共用的中间结果，按本文件定义的日换手率新建
+    intermediates = kwargs.get('intermediates') or Intermediates(df, IntermediateGraph(intermediate_funcs))
+    factor_df = pd.DataFrame(
+        {col_name: intermediates[f'日换手率_mean_{int(param)}'] for param, col_name in zip(params, col_names)},
+        index=df.index,
+    )
+    agg_rules = {col_name: 'last' for col_name in col_names}
+
+    return factor_df, agg_rules
@@ -52,3 +52,23 @@ def add_factor(df: pd.DataFrame, param=None, **kwargs) -> (pd.DataFrame, dict):
 
     # 返回新计算的因子列以及因子聚合方式
     return df[[col_name]], agg_rules
+
+
+def add_factor_panel(panel, param=None, **kwargs) -> (pd.DataFrame, dict):
+    """
+    在复权收盘价宽表上按列计算相隔param行的涨跌幅。
+    停牌日已经补全，每个股票的K线在宽表中是连续的交易日，相隔param行就是相隔param个交易日；
+    上市之前为空值，上市后前param个交易日的涨跌幅也为空值，和按股票计算一致。
+
+    :param panel: FactorPanel，panel['收盘价_复权'] 返回复权收盘价的宽表。
+    :param param: 涨跌幅的间隔交易日数量。
+    :param kwargs: 其他关键字参数，包括：
+        - col_name: 新计算的因子列名。
+    :return: tuple
+        - pd.DataFrame: 因子数值的宽表，index为交易日期，columns为股票代码。
+        - dict: 聚合方式字典。
+    """
+    col_name = kwargs['col_name']
+    factor_df = panel['收盘价_复权'].pct_change(param)
+
+    return factor_df, {col_name: 'last'}
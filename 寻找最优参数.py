@@ -4,14 +4,20 @@
 import itertools
 import time
 import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack
 from copy import deepcopy
+from multiprocessing import util
 import pandas as pd
 
-from core.model.backtest_config import create_factory
+from config import n_jobs
+from core.data_store import BacktestDataContext
+from core.model.backtest_config import BacktestConfig, create_factory
+from core.utils.shared_frame import SharedFrame
 from program.step1_整理数据 import prepare_data
 from program.step2_计算因子 import calculate_factors
 from program.step3_选股 import select_stocks
-from program.step4_实盘模拟 import simulate_performance
+from program.step4_实盘模拟 import simulate_performance_batch
 
 # ====================================================================================================
 # ** 脚本运行前配置 **
@@ -33,6 +39,97 @@ def dict_itertools(dict_):
     values = list(dict_.values())
     return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
 
+# 批量模拟交易时，每一批的参数组合数量
+SIMULATE_BATCH_SIZE = 64
+
+# 子进程中共享的回测数据，由 init_sweep_worker 初始化
+_worker_data: BacktestDataContext | None = None
+
+
+def init_sweep_worker(period_handles: dict, factor_col_info: dict):
+    """
+    参数遍历子进程的初始化，因子计算结果直接引用主进程发布的共享内存，不会复制
+    :param period_handles: {持仓周期名称: 因子计算结果所在共享内存的名称}
+    :param factor_col_info: 策略因子列信息
+    """
+    global _worker_data
+    warnings.filterwarnings('ignore')
+    # 子进程退出时，先释放引用共享内存的回测数据（优先级高的先执行），再关闭挂载的共享内存
+    SharedFrame.init_worker()
+    util.Finalize(None, release_sweep_worker, exitpriority=10)
+    period_dfs = {
+        hold_period_name: SharedFrame.attach(handle).to_frame(copy=False)
+        for hold_period_name, handle in period_handles.items()
+    }
+    _worker_data = BacktestDataContext(period_dfs=period_dfs, factor_col_info=factor_col_info)
+
+
+def release_sweep_worker():
+    """
+    释放子进程中共享的回测数据，之后才可以关闭共享内存
+    """
+    global _worker_data
+    _worker_data = None
+
+
+def run_select(config: BacktestConfig, data: BacktestDataContext = None):
+    """
+    对单个参数组合进行选股
+    :param config: 回测配置
+    :param data: 共享的回测数据，子进程中为 None，使用 init_sweep_worker 初始化的数据
+    :return: 选股结果
+    """
+    data = data if data is not None else _worker_data
+    return select_stocks(config, show_plot=False, data=data)
+
+
+def iter_select_parallel(config_list, data: BacktestDataContext, max_workers: int, max_in_flight: int = None):
+    """
+    多进程并行选股，按照完成的先后顺序依次返回结果
+    每个持仓周期的因子计算结果只写入一次共享内存，所有子进程共用
+    同时提交的任务数量有上限，避免一次性提交全部参数组合占用过多内存，完成一个再补充一个
+
+    :param config_list: 回测配置列表
+    :param data: 共享的回测数据
+    :param max_workers: 进程数量
+    :param max_in_flight: 同时提交的任务数量上限，默认为进程数量的2倍
+    :return: 生成器，(参数组合在 config_list 中的位置, 选股结果)
+    """
+    max_in_flight = max_in_flight or max_workers * 2
+    pending = {}
+    config_iter = iter(enumerate(config_list))
+
+    hold_period_names = dict.fromkeys(config.strategy.hold_period_name for config in config_list)
+    with ExitStack() as stack:
+        period_handles = {
+            hold_period_name: stack.enter_context(SharedFrame.publish(data.get_period_df(hold_period_name))).handle
+            for hold_period_name in hold_period_names
+        }
+        executor = stack.enter_context(ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_sweep_worker,
+            initargs=(period_handles, dict(data.factor_col_info)),
+        ))
+
+        def submit_next():
+            next_item = next(config_iter, None)
+            if next_item is None:
+                return False
+            index, config = next_item
+            pending[executor.submit(run_select, config)] = index
+            return True
+
+        while len(pending) < max_in_flight and submit_next():
+            pass
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                submit_next()
+                yield index, future.result()
+
+
 def find_best_params(factory):
     """
     寻找最优参数
@@ -64,19 +161,41 @@ def find_best_params(factory):
     # ====================================================================================================
     # 3. 计算因子
     # ====================================================================================================
-    # 然后用这个配置计算的话，我们就能获得所有策略的因子的结果，存储在 `data/cache/all_factors_df.pkl`
-    calculate_factors(dummy_conf_with_all_factors)
+    # 然后用这个配置计算的话，我们就能获得所有策略的因子的结果，存储在 `data/运行缓存/因子计算结果`
+    # 遍历多个持仓周期时，日线因子只计算一次，再分别转换为每个持仓周期的数据
+    hold_period_names = list(dict.fromkeys(conf.strategy.hold_period_name for conf in conf_list))
+    calculate_factors(dummy_conf_with_all_factors, hold_period_names)
 
     # ====================================================================================================
     # 4. 选股
     # - 注意：选完之后，每一个策略的选股结果会被保存到硬盘
     # ====================================================================================================
-    reports = []
-    for config in factory.config_list:
-        print(f'{config.iter_round}/{len(factory.config_list)}', '-' * 72)
-        select_results = select_stocks(config, show_plot=False)
-        report = simulate_performance(config, select_results, show_plot=False)
-        reports.append(report)
+    # 因子计算结果和行情数据只读取一次，所有参数组合共用
+    data = BacktestDataContext()
+    max_workers = min(n_jobs, len(conf_list))
+    if max_workers > 1:
+        # 多进程并行选股，每完成一个参数组合就补充提交一个
+        select_iter = iter_select_parallel(conf_list, data, max_workers)
+    else:
+        select_iter = ((index, run_select(config, data)) for index, config in enumerate(conf_list))
+
+    # ====================================================================================================
+    # 5. 模拟交易
+    # - 每凑够一批选股结果，就批量模拟一次，同一批的参数组合在一次numba并行计算中完成
+    # ====================================================================================================
+    reports = [None] * len(conf_list)
+    batch = []
+    for n_done, (index, select_results) in enumerate(select_iter, 1):
+        print(f'✅ 参数组合{conf_list[index].iter_round}选股完成｜{n_done}/{len(conf_list)}')
+        batch.append((index, select_results))
+        if len(batch) < SIMULATE_BATCH_SIZE and n_done < len(conf_list):
+            continue
+
+        batch_configs = [conf_list[i] for i, _ in batch]
+        batch_reports = simulate_performance_batch(batch_configs, [r for _, r in batch], data=data)
+        for (i, _), report in zip(batch, batch_reports):
+            reports[i] = report
+        batch = []
 
     return reports
 
@@ -14,7 +14,7 @@ def filter_stock(df, strategy: StrategyConfig) -> pd.DataFrame:
     :return: 返回过滤后的数据
 
     ### df 列说明
-    包含基础列：  ['交易日期', '股票代码', '股票名称', '周频起始日', '月频起始日', '上市至今交易天数', '复权因子', '开盘价', '最高价',
+    包含基础列：  ['交易日期', '股票代码', '股票名称', '名称状态', '周频起始日', '月频起始日', '上市至今交易天数', '复权因子', '开盘价', '最高价',
                 '最低价', '收盘价', '成交额', '是否交易', '流通市值', '总市值', '下日_开盘涨停', '下日_是否ST', '下日_是否交易',
                 '下日_是否退市']
     以及config中配置好的，因子计算的结果列。
@@ -39,7 +39,7 @@ def calc_select_factor(df, strategy: StrategyConfig) -> pd.DataFrame:
     :return: 返回过滤后的数据
 
     ### df 列说明
-    包含基础列：  ['交易日期', '股票代码', '股票名称', '周频起始日', '月频起始日', '上市至今交易天数', '复权因子', '开盘价', '最高价',
+    包含基础列：  ['交易日期', '股票代码', '股票名称', '名称状态', '周频起始日', '月频起始日', '上市至今交易天数', '复权因子', '开盘价', '最高价',
                 '最低价', '收盘价', '成交额', '是否交易', '流通市值', '总市值', '下日_开盘涨停', '下日_是否ST', '下日_是否交易',
                 '下日_是否退市']
     以及config中配置好的，因子计算的结果列。